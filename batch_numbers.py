@@ -0,0 +1,48 @@
+import logging
+import threading
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class BatchNumberAllocator:
+    """
+    Выдача номеров пачек блоками.
+
+    Из базы резервируется сразу `block_size` номеров (одним UPDATE ... RETURNING),
+    дальше номера выдаются из памяти. Выдача под блокировкой, поэтому безопасна
+    для конкурирующих задач и потоков; другие процессы получают свои блоки
+    из того же счётчика, так что номера не повторяются. Неиспользованный остаток
+    блока при перезапуске теряется (в нумерации будет пропуск).
+    """
+
+    def __init__(self, db, block_size: int = None):
+        self.db = db
+        self.block_size = max(1, block_size or Config.BATCH_NUMBER_BLOCK_SIZE)
+        self.lock = threading.Lock()
+        self.next_number = 1
+        self.last_reserved = 0
+
+    def next(self, cursor=None) -> int:
+        """
+        Следующий номер пачки. С `cursor` новый блок резервируется в транзакции
+        вызывающего (Database.register_and_enqueue); если она откатится — `discard()`
+        """
+        with self.lock:
+            if self.next_number > self.last_reserved:
+                if cursor is not None:
+                    self.last_reserved = self.db.reserve_batch_numbers(self.block_size, cursor=cursor)
+                else:
+                    self.last_reserved = self.db.reserve_batch_numbers(self.block_size)
+                self.next_number = self.last_reserved - self.block_size + 1
+                if self.block_size > 1:
+                    logger.debug(f"Зарезервированы номера пачек {self.next_number}..{self.last_reserved}")
+            number = self.next_number
+            self.next_number += 1
+            return number
+
+    def discard(self):
+        """Забываем блок в памяти: следующий номер снова резервируется в базе"""
+        with self.lock:
+            self.next_number = self.last_reserved + 1
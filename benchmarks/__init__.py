@@ -0,0 +1 @@
+"""Офлайн-бенчмарки бота. Запуск из корня репозитория: python -m benchmarks.<модуль>"""
@@ -0,0 +1,105 @@
+"""
+Сравнение рендеров графика статистики: встроенный (native_chart) и matplotlib.
+
+Каждый рендер измеряется в отдельном процессе, чтобы импорт и память
+одного не влияли на другой:
+
+    python -m benchmarks.bench_chart_render [--runs 20] [--output result.json]
+"""
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+SAMPLE_COUNTS = [120, 100, 80, 50, 30, 20, 10, 5, 3, 7, 15, 25, 40, 60, 110, 140, 170, 180, 190, 200, 185, 160, 140, 100]
+BACKENDS = ('native', 'native_svg', 'matplotlib')
+
+
+def _load_backend(backend: str):
+    if backend == 'native':
+        import native_chart
+        return native_chart.render_png
+    if backend == 'native_svg':
+        import native_chart
+        return native_chart.render_svg
+    from chart_renderer import render_stats_png
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot  # noqa: F401 — импорт pyplot входит в стоимость рендера
+    return render_stats_png
+
+
+def measure(backend: str, runs: int) -> dict:
+    """Замеры в текущем процессе (вызывается в дочернем процессе)"""
+    hours = [(8 + i) % 24 for i in range(24)]
+    values = [SAMPLE_COUNTS[h] for h in hours]
+
+    start = time.perf_counter()
+    render = _load_backend(backend)
+    import_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    render(values, hours, 'Владивосток')
+    first_seconds = time.perf_counter() - start
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        render(values, hours, 'Владивосток')
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    output = render(values, hours, 'Владивосток')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'backend': backend,
+        'import_ms': round(import_seconds * 1000, 1),
+        'first_render_ms': round(first_seconds * 1000, 1),
+        'median_render_ms': round(statistics.median(timings) * 1000, 2),
+        'tracemalloc_peak_kb': round(peak / 1024, 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'output_bytes': len(output.encode() if isinstance(output, str) else output),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark stats chart renderers')
+    parser.add_argument('--runs', type=int, default=20, help='Renders per backend after the first one')
+    parser.add_argument('--backend', choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Save results as JSON')
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(measure(args.backend, args.runs)))
+        return
+
+    results = []
+    for backend in BACKENDS:
+        proc = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_chart_render', '--backend', backend, '--runs', str(args.runs)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(f"{backend}: ошибка\n{proc.stderr.strip()}")
+            continue
+        results.append(json.loads(proc.stdout))
+
+    columns = ('import_ms', 'first_render_ms', 'median_render_ms', 'tracemalloc_peak_kb', 'max_rss_mb', 'output_bytes')
+    print(f"{'backend':<12}" + ''.join(f"{c:>20}" for c in columns))
+    for r in results:
+        print(f"{r['backend']:<12}" + ''.join(f"{r[c]:>20}" for c in columns))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
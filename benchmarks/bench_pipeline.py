@@ -0,0 +1,206 @@
+"""
+Бенчмарк горячего пути на синтетических страницах CRM (benchmarks/crm_grid.py):
+разбор страницы и строки, извлечение времени, регистрация заявок в базе
+(новые и уже известные) и форматирование сообщений пачки.
+
+Каждый бенчмарк запускается в отдельном процессе (пиковый RSS не смешивается),
+результат — строк в секунду, пик выделенной памяти (tracemalloc) и RSS:
+
+    python -m benchmarks.bench_pipeline [--rows 300] [--runs 5] [--output baseline.json]
+    python -m benchmarks.bench_pipeline --baseline baseline.json [--tolerance 0.15]
+
+С `--baseline` результаты сравниваются с сохранёнными; если какой-то
+бенчмарк медленнее больше чем на `tolerance`, код возврата — 1.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.crm_grid import GridGenerator
+
+BENCHMARKS = ('parse_html', 'parse_row', 'extract_scheduled_time', 'db_register_new',
+              'db_register_existing', 'format_batch')
+
+
+def _setup(name: str, rows: int, rows_per_page: int, seed: int):
+    """
+    Готовим данные бенчмарка вне замера. Возвращает (prepare, run, items):
+    prepare() вызывается перед каждым прогоном и не замеряется, run(state) — замеряемая работа
+    """
+    from bs4 import BeautifulSoup
+    from crm_parser import CRMParser
+
+    parser = CRMParser()
+    pages = GridGenerator(seed=seed).pages(rows, rows_per_page)
+
+    if name == 'parse_html':
+        return (lambda: None), (lambda _: [parser.parse_requests_from_html(html) for html in pages]), rows
+
+    soup_rows = []
+    for html in pages:
+        soup = BeautifulSoup(html, 'html.parser')
+        soup_rows.extend(soup.find_all('tr', class_=lambda x: x and 'bg-status-awaitOnly' in x))
+
+    if name == 'parse_row':
+        return (lambda: None), (lambda _: [parser._parse_request_row(row) for row in soup_rows]), len(soup_rows)
+
+    if name == 'extract_scheduled_time':
+        cells = []
+        for row in soup_rows:
+            tds = row.find_all('td')
+            if len(tds) > 4:
+                cells.append((tds[1], tds[4].get_text(strip=True)))
+        return (lambda: None), (lambda _: [parser.extract_scheduled_time(cell, city) for cell, city in cells]), len(cells)
+
+    requests_data = [r for html in pages for r in parser.parse_requests_from_html(html)]
+
+    if name in ('db_register_new', 'db_register_existing'):
+        from database import Database
+        # Удаляется при выходе из процесса
+        workdir = tempfile.TemporaryDirectory(prefix='bench_db_')
+
+        def prepare():
+            path = os.path.join(workdir.name, f"{time.monotonic_ns()}.db")
+            db = Database(path)
+            if name == 'db_register_existing':
+                register(db)
+            return db
+
+        def register(db):
+            for r in requests_data:
+                db.add_or_update_request(
+                    r['id'], r['scheduled_time'], city=r['city'], request_type=r['type'],
+                    is_urgent=r['is_urgent'], scheduled_at=r['scheduled_at']
+                )
+
+        return prepare, register, len(requests_data)
+
+    if name == 'format_batch':
+        from routing import RoutingTable
+        from telegram_notifier import TelegramNotifier
+        # Форматированию не нужны бот и очередь отправки
+        notifier = TelegramNotifier.__new__(TelegramNotifier)
+        notifier.routing = RoutingTable([{'chat_id': '-1001', 'urgent': True}], '-1000')
+
+        def format_batch(_):
+            return [notifier.build_batch_messages(dest_requests, 1)
+                    for _, dest_requests in notifier.routing.split(requests_data).values()]
+
+        return (lambda: None), format_batch, len(requests_data)
+
+    raise ValueError(f"Неизвестный бенчмарк: {name}")
+
+
+def measure(name: str, rows: int, rows_per_page: int, runs: int, seed: int) -> dict:
+    """Замеры в текущем процессе (вызывается в дочернем процессе)"""
+    logging.disable(logging.INFO)
+    prepare, run, items = _setup(name, rows, rows_per_page, seed)
+
+    timings = []
+    for _ in range(runs):
+        state = prepare()
+        start = time.perf_counter()
+        run(state)
+        timings.append(time.perf_counter() - start)
+
+    state = prepare()
+    tracemalloc.start()
+    run(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {
+        'benchmark': name,
+        'items': items,
+        'median_ms': round(median * 1000, 2),
+        'min_ms': round(min(timings) * 1000, 2),
+        'rows_per_sec': round(items / median, 1) if median else None,
+        'tracemalloc_peak_kb': round(peak / 1024, 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> bool:
+    """Печатаем сравнение с базовыми результатами; False — есть регрессия"""
+    previous = {r['benchmark']: r for r in baseline.get('results', [])}
+    ok = True
+    print(f"\nСравнение с базовыми результатами ({baseline.get('created', '?')}):")
+    for r in results:
+        old = previous.get(r['benchmark'])
+        if not old or not old.get('rows_per_sec') or not r['rows_per_sec']:
+            continue
+        change = r['rows_per_sec'] / old['rows_per_sec'] - 1
+        regression = change < -tolerance
+        ok = ok and not regression
+        print(f"{r['benchmark']:<24}{old['rows_per_sec']:>14} → {r['rows_per_sec']:<14}"
+              f"{change * 100:+.1f}%{'  РЕГРЕССИЯ' if regression else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parsing, DB registration and batch formatting')
+    parser.add_argument('--rows', type=int, default=300, help='Requests on the generated CRM pages')
+    parser.add_argument('--rows-per-page', type=int, default=30, help='Requests per CRM page')
+    parser.add_argument('--runs', type=int, default=5, help='Timed runs per benchmark')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the page generator')
+    parser.add_argument('--only', choices=BENCHMARKS, action='append', help='Run only these benchmarks')
+    parser.add_argument('--bench', choices=BENCHMARKS, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Save results as a JSON baseline')
+    parser.add_argument('--baseline', help='Compare with a saved JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed rows/sec slowdown vs baseline')
+    args = parser.parse_args()
+
+    common = ['--rows', str(args.rows), '--rows-per-page', str(args.rows_per_page),
+              '--runs', str(args.runs), '--seed', str(args.seed)]
+
+    if args.bench:
+        print(json.dumps(measure(args.bench, args.rows, args.rows_per_page, args.runs, args.seed)))
+        return
+
+    results = []
+    for name in args.only or BENCHMARKS:
+        proc = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_pipeline', '--bench', name] + common,
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(f"{name}: ошибка\n{proc.stderr.strip()}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    columns = ('items', 'median_ms', 'rows_per_sec', 'tracemalloc_peak_kb', 'max_rss_mb')
+    print(f"{'benchmark':<24}" + ''.join(f"{c:>20}" for c in columns))
+    for r in results:
+        print(f"{r['benchmark']:<24}" + ''.join(f"{r[c]:>20}" for c in columns))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'params': {'rows': args.rows, 'rows_per_page': args.rows_per_page,
+                           'runs': args.runs, 'seed': args.seed},
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
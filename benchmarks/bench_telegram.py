@@ -0,0 +1,148 @@
+"""
+Пропускная способность и корректность доставки пачек через настоящий
+TelegramNotifier/TelegramSender против локального Bot API (benchmarks/fake_telegram.py).
+
+Пачки синтетических заявок раскладываются по маршрутам, разбиваются на
+части по лимиту длины и отправляются с учётом flood-лимитов; fake Bot API
+при этом отвечает 429 и задержками. После прогона каждая заявка должна
+оказаться в своём чате ровно один раз:
+
+    python -m benchmarks.bench_telegram [--batches 20] [--batch-size 400] [--server-chat-rate 20]
+                                        [--retry-after-rate 0.05] [--coalesce] [--output result.json]
+
+Код возврата 1, если заявки потерялись или задублировались.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import sys
+import time
+from collections import Counter
+from typing import Dict, List
+
+from benchmarks.crm_grid import GridGenerator
+from benchmarks.fake_telegram import FakeTelegram
+
+# Срочные — в отдельный чат, Москва и Владивосток — ещё и в чат городов, остальное — в чат по умолчанию
+ROUTES = [
+    {'chat_id': '-1001', 'urgent': True},
+    {'chat_id': '-1002', 'city': ['Москва', 'Владивосток']},
+]
+DEFAULT_CHAT_ID = '-1000'
+
+REQUEST_ID = re.compile(r'`(\d+)`')
+
+
+def make_batches(batches: int, batch_size: int, seed: int) -> List[List[Dict]]:
+    grid = GridGenerator(seed=seed)
+    result = []
+    for _ in range(batches):
+        batch = []
+        for _ in range(batch_size):
+            request = grid.request()
+            batch.append({
+                'id': request['id'],
+                'scheduled_time': f"{request['scheduled_utc']:%H:%M}",
+                'city': request['city'],
+                'type': request['type'],
+                'is_urgent': request['is_urgent'],
+            })
+        result.append(batch)
+    return result
+
+
+async def run(args) -> Dict:
+    from config import Config
+    from routing import RoutingTable
+    from telegram_notifier import TelegramNotifier
+    from telegram_sender import TelegramSender, create_bot, MAX_MESSAGE_LENGTH
+
+    telegram = FakeTelegram(args.latency, args.jitter, args.server_chat_rate, args.retry_after_rate, args.retry_after)
+    Config.TELEGRAM_API_BASE_URL = await telegram.start()
+    # Клиентские лимиты: по умолчанию — как в Config, для нагрузочного прогона их можно поднять
+    if args.global_rate:
+        Config.TELEGRAM_GLOBAL_RATE = args.global_rate
+    if args.chat_rate:
+        Config.TELEGRAM_CHAT_RATE = Config.TELEGRAM_GROUP_RATE = args.chat_rate
+
+    sender = TelegramSender(create_bot('123456:FAKE-TOKEN'))
+    routing = RoutingTable(ROUTES, DEFAULT_CHAT_ID)
+    notifier = TelegramNotifier(DEFAULT_CHAT_ID, routing, sender=sender)
+    batches = make_batches(args.batches, args.batch_size, args.seed)
+
+    started = time.monotonic()
+    try:
+        delivered = await asyncio.gather(*(
+            notifier.send_batch(batch, number, coalesce=args.coalesce)
+            for number, batch in enumerate(batches, start=1)
+        ))
+        elapsed = time.monotonic() - started
+    finally:
+        metrics = sender.get_metrics()
+        await sender.close()
+        await telegram.stop()
+
+    # Каждая заявка — ровно один раз в каждом своём чате
+    expected = Counter()
+    for batch in batches:
+        for key, (_, dest_requests) in routing.split(batch).items():
+            expected.update((key, r['id']) for r in dest_requests)
+    received = Counter()
+    for message in telegram.messages:
+        received.update((message['chat_id'], int(i)) for i in REQUEST_ID.findall(message['text'] or ''))
+
+    messages = len(telegram.messages)
+    return {
+        'batches': len(batches),
+        'requests': sum(len(b) for b in batches),
+        'batches_delivered': sum(delivered),
+        'messages': messages,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_sec': round(messages / elapsed, 1) if elapsed else None,
+        'max_message_length': max((len(m['text'] or '') for m in telegram.messages), default=0),
+        'length_limit': MAX_MESSAGE_LENGTH,
+        'server_retry_after': telegram.stats['retry_after'],
+        'server_bad_request': telegram.stats['bad_request'],
+        'client_retry_after': metrics['retry_after'],
+        'coalesced': metrics['coalesced'],
+        'latency_p50_s': round(metrics['latency_p50'], 3) if metrics['latency_p50'] is not None else None,
+        'latency_p95_s': round(metrics['latency_p95'], 3) if metrics['latency_p95'] is not None else None,
+        'lost': sum((expected - received).values()),
+        'duplicated': sum((received - expected).values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch delivery throughput against a fake Telegram Bot API')
+    parser.add_argument('--batches', type=int, default=20, help='Batches sent concurrently')
+    parser.add_argument('--batch-size', type=int, default=400, help='Requests per batch')
+    parser.add_argument('--coalesce', action='store_true', help='Allow coalescing of queued messages')
+    parser.add_argument('--latency', type=float, default=0.01, help='Fake API response delay, seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random ± delay, seconds')
+    parser.add_argument('--server-chat-rate', type=float, default=0.0, help='Fake API per-chat limit before 429')
+    parser.add_argument('--retry-after-rate', type=float, default=0.0, help='Share of random 429 responses')
+    parser.add_argument('--retry-after', type=int, default=1, help='retry_after for random 429, seconds')
+    parser.add_argument('--global-rate', type=float, help='Override TELEGRAM_GLOBAL_RATE')
+    parser.add_argument('--chat-rate', type=float, help='Override TELEGRAM_CHAT_RATE and TELEGRAM_GROUP_RATE')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Save results as JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    result = asyncio.run(run(args))
+    for key, value in result.items():
+        print(f"{key:<22}{value}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if result['lost'] or result['duplicated']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Генератор синтетических страниц CRM (Yii2 GridView «заявки на прозвоне»).
+
+Строки повторяют разметку реальной CRM из test_extract.py и варьируют то,
+на что смотрит CRMParser: город (с известным и неизвестным часовым поясом),
+тип заявки, флаг срочности `time-warning`, классы «в работе»
+(`bg-is_processing_by*`), строки других статусов, которые парсер должен
+пропустить, и строки-предупреждения партнёра без ссылки на заявку.
+
+    from benchmarks.crm_grid import GridGenerator
+    pages = GridGenerator(seed=1).pages(total_rows=300)
+"""
+import random
+from datetime import datetime, timedelta
+from html import escape
+from typing import Dict, List, Optional
+
+# Города: часть есть в таблице часовых поясов CRMParser, часть — нет
+CITIES = [
+    'Москва', 'Владивосток', 'Екатеринбург', 'Новосибирск', 'Самара', 'Красноярск',
+    'Иркутск', 'Омск', 'Волгоград', 'Казань', 'Калининград', 'Хабаровск',
+]
+REQUEST_TYPES = ['Впервые', 'Повторно', 'Гарантия', 'Консультация', 'Замер']
+STREETS = ['улица Таращанцев', 'проспект Ленина', 'улица Мира', 'Садовая улица', 'улица Гагарина']
+MANAGERS = ['Топильский Д Е', 'Иванова А С', 'Петров К В', 'Смирнова О Н']
+
+# Часовой пояс, в котором CRM показывает даты (Config.CRM_DISPLAY_UTC_OFFSET)
+DISPLAY_UTC_OFFSET = 3
+
+
+class GridGenerator:
+    """
+    Доли вариантов строк задаются параметрами; `seed` делает страницы
+    воспроизводимыми, чтобы результаты бенчмарков можно было сравнивать
+    """
+
+    def __init__(self, seed: int = 1, urgent_share: float = 0.3, processing_share: float = 0.15,
+                 other_status_share: float = 0.05, partner_alert_share: float = 0.02,
+                 title_only_share: float = 0.1, start_id: int = 2100000,
+                 now_utc: Optional[datetime] = None):
+        self.rng = random.Random(seed)
+        self.urgent_share = urgent_share
+        self.processing_share = processing_share
+        self.other_status_share = other_status_share
+        self.partner_alert_share = partner_alert_share
+        self.title_only_share = title_only_share
+        self.next_id = start_id
+        self.now_utc = (now_utc or datetime.utcnow()).replace(second=0, microsecond=0)
+
+    def request(self) -> Dict:
+        """Параметры одной заявки (из них строится строка и их же отдаёт fake CRM)"""
+        self.next_id += self.rng.randint(1, 40)
+        scheduled_utc = self.now_utc + timedelta(minutes=30 * self.rng.randint(-6, 48))
+        return {
+            'id': self.next_id,
+            'city': self.rng.choice(CITIES),
+            'type': self.rng.choice(REQUEST_TYPES),
+            'scheduled_utc': scheduled_utc,
+            'is_urgent': self.rng.random() < self.urgent_share,
+            'processing': (self.rng.choice(['bg-is_processing_by', 'bg-is_processing_by_me'])
+                           if self.rng.random() < self.processing_share else None),
+            'title_only': self.rng.random() < self.title_only_share,
+        }
+
+    def row(self, request: Dict, key: int = 0, status: str = 'bg-status-awaitOnly') -> str:
+        """Строка таблицы в разметке CRM"""
+        request_id = request['id']
+        url = f"/admin/domain/customer-request/update?id={request_id}"
+        scheduled_utc = request['scheduled_utc']
+        shown = scheduled_utc + timedelta(hours=DISPLAY_UTC_OFFSET)
+        now_shown = self.now_utc + timedelta(hours=DISPLAY_UTC_OFFSET)
+        created = scheduled_utc - timedelta(days=2, minutes=self.rng.randint(0, 600))
+
+        classes = f"           bg-status-1 bg-reqtype-10 {status}   "
+        if request['processing']:
+            classes += f" {request['processing']}"
+        warning = '<div class="time-warning"></div>' if request['is_urgent'] else ''
+        visible = '' if request['title_only'] else f"{shown:%d.%m.%y %H:%M}"
+        title = f"Сейчас {now_shown:%H:%M}, Назначено в: {scheduled_utc:%H:%M}(UTC)"
+
+        return (
+            f'<tr class="{classes}" data-sortkey="s_{int(created.timestamp())}" data-key="{key}">'
+            f'<td class="col__id pos-r"><a class="--blank-link" href="{url}" data-pjax="0" target="_blank">'
+            f'{request_id} <sup><i class="fa fa-external-link-alt"></i></sup></a></td>'
+            f'<td class="col__date col__openedAt col__req_status_awaitOnly pos-r zi-0">{warning}'
+            f'<span class=" " title="{title}">{visible}</span></td>'
+            f'<td class="col__req_type">{escape(request["type"])}</td>'
+            f'<td class="col__req_status">Ожидает</td>'
+            f'<td class="--fullwidth"><a href="{url}" data-pjax="0">{escape(request["city"])}</a></td>'
+            f'<td class="col__phone"><span title="" style="white-space: nowrap">'
+            f'+7 9{self.rng.randint(10, 99)}-***-{self.rng.randint(1000, 9999)}</span></td>'
+            f'<td><span style="min-width: 200px; max-width: 300px; display: block">'
+            f'{self.rng.choice(STREETS)}, , {self.rng.randint(1, 150)}</span></td>'
+            f'<td><span title="В городе - {created:%d.%m.%Y %H:%M}">{created:%d.%m.%y %H:%M} ({created:%H:%M})</span></td>'
+            f'<td></td>'
+            f'<td><span style="min-width: 120px; max-width: 180px; display: block">{self.rng.choice(MANAGERS)}</span></td>'
+            f'</tr>'
+        )
+
+    def partner_alert_row(self, key: int) -> str:
+        """Строка-предупреждение партнёра: класс статуса тот же, но ссылки на заявку нет"""
+        return (
+            f'<tr class="bg-status-awaitOnly partner-alert" data-key="{key}"><td colspan="10">'
+            f'<div class="alert alert-warning">Партнёр {self.rng.choice(MANAGERS)} '
+            f'не подтвердил {self.rng.randint(1, 9)} заявок</div></td></tr>'
+        )
+
+    def rows(self, requests: List[Dict]) -> List[str]:
+        """Строки страницы: заявки вперемешку со строками других статусов и предупреждениями"""
+        rows = []
+        for key, request in enumerate(requests):
+            if self.rng.random() < self.partner_alert_share:
+                rows.append(self.partner_alert_row(key))
+            if self.rng.random() < self.other_status_share:
+                rows.append(self.row(self.request(), key, status='bg-status-inWork'))
+            rows.append(self.row(request, key))
+        return rows
+
+    @staticmethod
+    def page(rows: List[str], page: int = 1, pages: int = 1) -> str:
+        """Полная HTML-страница GridView с пагинацией"""
+        pagination = ''.join(
+            f'<li class="{"active" if p == page else ""}">'
+            f'<a href="/admin/domain/customer-request/index?__view-mode=chats&amp;page={p}" data-page="{p - 1}">{p}</a></li>'
+            for p in range(1, pages + 1)
+        )
+        return (
+            '<!DOCTYPE html><html lang="ru"><head><meta charset="UTF-8"><title>Заявки</title>'
+            '<meta name="csrf-param" content="_csrf-frontend"><meta name="csrf-token" content="token">'
+            '</head><body><div class="wrap"><nav class="navbar navbar-inverse"><ul class="nav navbar-nav">'
+            '<li><a href="/admin/domain/customer-request/index">Заявки</a></li>'
+            '<li><a href="/admin/logout" data-method="post">Выход</a></li></ul></nav>'
+            '<div class="container-fluid"><div id="w0" class="grid-view">'
+            f'<div class="summary">Страница <b>{page}</b> из <b>{pages}</b>.</div>'
+            '<table class="table table-striped table-bordered"><thead><tr>'
+            '<th>ID</th><th>Дата</th><th>Тип</th><th>Статус</th><th>Город</th><th>Телефон</th>'
+            '<th>Адрес</th><th>Создана</th><th></th><th>Менеджер</th></tr></thead><tbody>'
+            + ''.join(rows) +
+            f'</tbody></table><ul class="pagination">{pagination}</ul></div></div></div></body></html>'
+        )
+
+    def pages(self, total_rows: int, rows_per_page: int = 30) -> List[str]:
+        """`total_rows` заявок на прозвоне, разложенных по страницам по `rows_per_page`"""
+        requests = [self.request() for _ in range(total_rows)]
+        chunks = [requests[i:i + rows_per_page] for i in range(0, len(requests), rows_per_page)] or [[]]
+        return [self.page(self.rows(chunk), number, len(chunks)) for number, chunk in enumerate(chunks, start=1)]
@@ -0,0 +1,158 @@
+"""
+End-to-end нагрузочный прогон CRMTelegramBot против локальной CRM (benchmarks/fake_crm.py).
+
+Для каждого размера очереди поднимается fake CRM, бот (тенант со своей
+временной базой) проходит полный путь: вход → загрузка и разбор всех
+страниц → регистрация в базе → пачка в outbox → доставка. Отправка идёт
+в RecordingSender, который запоминает сообщения вместо Telegram.
+
+Замеряются:
+- cold_poll_s — первый опрос, все заявки новые;
+- warm_poll_s — повторный опрос, новых нет (обычный цикл);
+- poll_to_send_s — после прихода новых заявок: от начала опроса до
+  последнего отправленного сообщения пачки;
+- throughput_rps — заявок в секунду на холодном опросе.
+
+    python -m benchmarks.e2e_load [--sizes 10 100 1000 10000] [--latency 0.02] [--output e2e.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+from benchmarks.fake_crm import FakeCRM
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+
+
+class RecordingSender:
+    """Замена TelegramSender: запоминает сообщения и время отправки"""
+
+    def __init__(self):
+        self.bot = None
+        self.sent: List[Dict] = []
+
+    async def send_message(self, chat_id, text: str, coalesce: bool = False, **kwargs):
+        self.sent.append({'chat_id': chat_id, 'text': text, 'at': time.monotonic()})
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        self.sent.append({'chat_id': chat_id, 'photo': True, 'at': time.monotonic()})
+
+    def queue_depth(self, chat_id=None) -> int:
+        return 0
+
+    async def close(self):
+        pass
+
+
+class HarnessResources:
+    """То же, что tenants.SharedResources, но с RecordingSender и без процесса рендера графиков"""
+
+    def __init__(self, sender):
+        from chart_renderer import ChartWorker
+        self.http_adapter = requests.adapters.HTTPAdapter()
+        self.parse_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='crm-parse')
+        self.sender = sender
+        self.chart_worker = ChartWorker()
+
+    def close(self):
+        self.parse_executor.shutdown(wait=False)
+        self.http_adapter.close()
+
+
+async def run_size(size: int, workdir: str, latency: float, error_rate: float, arrivals: int) -> Dict:
+    from main import CRMTelegramBot
+    from tenants import Tenant
+
+    crm = FakeCRM(size, latency=latency, error_rate=error_rate)
+    url = await crm.start()
+    sender = RecordingSender()
+    shared = HarnessResources(sender)
+    tenant = Tenant(
+        f"e2e{size}", crm.login, crm.password, '-1000', crm_base_url=url,
+        max_pages=size // crm.rows_per_page + 2, db_path=os.path.join(workdir, f"e2e{size}.db"),
+    )
+    bot = CRMTelegramBot(tenant, shared)
+
+    async def cycle() -> Dict:
+        """Опрос (с пачкой в outbox) + доставка, как send_if_needed и outbox_loop"""
+        sender.sent.clear()
+        started = time.monotonic()
+        new_requests = await bot.process_requests()
+        polled = time.monotonic()
+        if new_requests:
+            await bot.drain_outbox()
+        finished = sender.sent[-1]['at'] if sender.sent else time.monotonic()
+        return {'new': len(new_requests), 'poll_s': polled - started,
+                'poll_to_send_s': finished - started, 'messages': len(sender.sent)}
+
+    try:
+        cold = await cycle()
+        warm = await cycle()
+        crm.mutate(arrivals=arrivals, completed=arrivals // 2, taken=arrivals // 4)
+        fresh = await cycle()
+    finally:
+        await crm.stop()
+        shared.close()
+
+    return {
+        'size': size,
+        'pages': crm.stats['pages'],
+        'cold_new': cold['new'],
+        'cold_poll_s': round(cold['poll_s'], 3),
+        'throughput_rps': round(cold['new'] / cold['poll_s'], 1) if cold['poll_s'] else None,
+        'cold_messages': cold['messages'],
+        'warm_poll_s': round(warm['poll_s'], 3),
+        'fresh_new': fresh['new'],
+        'poll_to_send_s': round(fresh['poll_to_send_s'], 3),
+        'crm_errors': crm.stats['errors'],
+    }
+
+
+async def run(args) -> List[Dict]:
+    results = []
+    with tempfile.TemporaryDirectory(prefix='e2e_') as workdir:
+        for size in args.sizes:
+            result = await run_size(size, workdir, args.latency, args.error_rate, args.arrivals)
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end poll-to-send load test against a fake CRM')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='Queue sizes')
+    parser.add_argument('--latency', type=float, default=0.0, help='Fake CRM response delay, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of fake CRM 500/502 responses')
+    parser.add_argument('--arrivals', type=int, default=20, help='New requests before the poll-to-send cycle')
+    parser.add_argument('--output', help='Save results as JSON')
+    args = parser.parse_args()
+
+    # Логи бота — во временный файл, в консоль только предупреждения (до импорта Config)
+    os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'crm_bot_e2e.log'))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    from logging_setup import setup_logging
+    setup_logging()
+    results = asyncio.run(run(args))
+    logging.shutdown()
+
+    columns = ('pages', 'cold_poll_s', 'throughput_rps', 'warm_poll_s', 'poll_to_send_s', 'crm_errors')
+    print(f"{'size':>8}" + ''.join(f"{c:>18}" for c in columns))
+    for r in results:
+        print(f"{r['size']:>8}" + ''.join(f"{r[c]:>18}" for c in columns))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Локальная замена Yii2 CRM для нагрузочных и end-to-end тестов (aiohttp).
+
+Поддерживает то, чем пользуется CRMParser:
+
+- GET/POST /admin/login — форма с `_csrf-frontend`, проверка логина и
+  пароля, cookie сессии и редирект на список заявок;
+- GET /admin/domain/customer-request/index?__view-mode=chats&page=N — страницы
+  по 30 заявок в разметке CRM (benchmarks/crm_grid.py); номер страницы за
+  пределами списка, как в Yii2, даёт последнюю страницу;
+- истечение сессии: после `session_ttl` секунд список заявок редиректит на логин;
+- задержка ответов (`latency` ± `jitter`) и ошибки 500/502 с вероятностью `error_rate`;
+- очередь заявок меняется со временем (`mutate`): приходят новые, часть
+  прозвонена и исчезает, часть берут в работу.
+
+Отдельный процесс:
+
+    python -m benchmarks.fake_crm [--port 8081] [--requests 300] [--latency 0.05] [--error-rate 0.01]
+
+и затем CRM_BASE_URL=http://127.0.0.1:8081 для бота.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import secrets
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from benchmarks.crm_grid import GridGenerator
+
+logger = logging.getLogger(__name__)
+
+REQUESTS_PATH = '/admin/domain/customer-request/index'
+LOGIN_PATH = '/admin/login'
+SESSION_COOKIE = 'advanced-frontend'
+
+LOGIN_PAGE = (
+    '<!DOCTYPE html><html lang="ru"><head><meta charset="UTF-8"><title>Вход</title></head><body>'
+    '<form id="login-form" action="/admin/login" method="post">'
+    '<input type="hidden" name="_csrf-frontend" value="{csrf}">'
+    '<input type="text" name="LoginForm[email]"><input type="password" name="LoginForm[password]">'
+    '<input type="hidden" name="LoginForm[rememberMe]" value="0">{error}'
+    '<button type="submit">Войти</button></form></body></html>'
+)
+
+
+class FakeCRM:
+    def __init__(self, requests_count: int = 300, login: str = 'bench', password: str = 'bench',
+                 rows_per_page: int = 30, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, session_ttl: float = 3600, seed: int = 1):
+        self.login = login
+        self.password = password
+        self.rows_per_page = rows_per_page
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.session_ttl = session_ttl
+        self.rng = random.Random(seed)
+        self.grid = GridGenerator(seed=seed)
+
+        # Заявки на прозвоне в порядке id и время их появления (для замера задержки до отправки)
+        self.requests: Dict[int, Dict] = {}
+        self.appeared_at: Dict[int, float] = {}
+        self.add_requests(requests_count)
+
+        self.csrf_tokens = set()
+        self.sessions: Dict[str, float] = {}
+        self.stats = {'logins': 0, 'pages': 0, 'errors': 0, 'expired': 0}
+
+        self.runner: Optional[web.AppRunner] = None
+        self.mutate_task: Optional[asyncio.Task] = None
+        self.url = None
+
+    # --- Очередь заявок ---
+
+    def add_requests(self, count: int) -> List[int]:
+        now = time.monotonic()
+        added = []
+        for _ in range(count):
+            request = self.grid.request()
+            self.requests[request['id']] = request
+            self.appeared_at[request['id']] = now
+            added.append(request['id'])
+        return added
+
+    def mutate(self, arrivals: int = 5, completed: int = 3, taken: int = 2) -> List[int]:
+        """Один шаг жизни очереди: новые заявки, прозвоненные исчезают, часть берут в работу"""
+        ids = list(self.requests)
+        for request_id in self.rng.sample(ids, min(completed, len(ids))):
+            del self.requests[request_id]
+        waiting = [r for r in self.requests.values() if not r['processing']]
+        for request in self.rng.sample(waiting, min(taken, len(waiting))):
+            request['processing'] = 'bg-is_processing_by'
+        return self.add_requests(arrivals)
+
+    async def mutate_loop(self, interval: float, arrivals: int, completed: int, taken: int):
+        while True:
+            await asyncio.sleep(interval)
+            self.mutate(arrivals, completed, taken)
+
+    # --- HTTP ---
+
+    async def _simulate(self) -> Optional[web.Response]:
+        """Задержка и случайная ошибка сервера"""
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return web.Response(status=self.rng.choice([500, 502]), text='Internal Server Error')
+        return None
+
+    def _session_valid(self, request: web.Request) -> bool:
+        session = request.cookies.get(SESSION_COOKIE)
+        started = self.sessions.get(session)
+        if started is None:
+            return False
+        if time.monotonic() - started > self.session_ttl:
+            del self.sessions[session]
+            self.stats['expired'] += 1
+            return False
+        return True
+
+    def _login_page(self, error: str = '') -> web.Response:
+        csrf = secrets.token_urlsafe(16)
+        self.csrf_tokens.add(csrf)
+        error_html = f'<div class="help-block">{error}</div>' if error else ''
+        return web.Response(text=LOGIN_PAGE.format(csrf=csrf, error=error_html), content_type='text/html')
+
+    async def handle_login_get(self, request: web.Request) -> web.Response:
+        return await self._simulate() or self._login_page()
+
+    async def handle_login_post(self, request: web.Request) -> web.Response:
+        error = await self._simulate()
+        if error:
+            return error
+        form = await request.post()
+        csrf = form.get('_csrf-frontend', '')
+        if csrf not in self.csrf_tokens:
+            return web.Response(status=400, text='Bad Request: csrf')
+        self.csrf_tokens.discard(csrf)
+        if form.get('LoginForm[email]') != self.login or form.get('LoginForm[password]') != self.password:
+            return self._login_page('Неверный логин или пароль')
+
+        session = secrets.token_hex(16)
+        self.sessions[session] = time.monotonic()
+        self.stats['logins'] += 1
+        response = web.HTTPFound(f"{REQUESTS_PATH}?__view-mode=chats")
+        response.set_cookie(SESSION_COOKIE, session, httponly=True)
+        raise response
+
+    async def handle_requests(self, request: web.Request) -> web.Response:
+        error = await self._simulate()
+        if error:
+            return error
+        if not self._session_valid(request):
+            raise web.HTTPFound(LOGIN_PATH)
+
+        ordered = [self.requests[request_id] for request_id in sorted(self.requests)]
+        pages = max(1, -(-len(ordered) // self.rows_per_page))
+        try:
+            page = int(request.query.get('page', 1))
+        except ValueError:
+            page = 1
+        # Как Yii2 Pagination(validatePage=true): номер за пределами — ближайшая существующая страница
+        page = min(max(page, 1), pages)
+
+        chunk = ordered[(page - 1) * self.rows_per_page:page * self.rows_per_page]
+        self.stats['pages'] += 1
+        html = self.grid.page(self.grid.rows(chunk), page, pages)
+        return web.Response(text=html, content_type='text/html')
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(LOGIN_PATH, self.handle_login_get)
+        app.router.add_post(LOGIN_PATH, self.handle_login_post)
+        app.router.add_get(REQUESTS_PATH, self.handle_requests)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Запускаем сервер; port=0 — свободный порт. Возвращает базовый URL"""
+        self.runner = web.AppRunner(self.app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self.mutate_task:
+            self.mutate_task.cancel()
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+async def serve(args):
+    crm = FakeCRM(args.requests, args.login, args.password, latency=args.latency, jitter=args.jitter,
+                  error_rate=args.error_rate, session_ttl=args.session_ttl, seed=args.seed)
+    url = await crm.start(args.host, args.port)
+    if args.mutate_interval:
+        crm.mutate_task = asyncio.create_task(
+            crm.mutate_loop(args.mutate_interval, args.arrivals, args.completed, args.taken)
+        )
+    print(f"Fake CRM: {url} (логин {args.login}/{args.password}, заявок {len(crm.requests)})")
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(f"Заявок {len(crm.requests)}, статистика {crm.stats}")
+    finally:
+        await crm.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Yii2 CRM')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--requests', type=int, default=300, help='Initial number of awaiting requests')
+    parser.add_argument('--login', default='bench')
+    parser.add_argument('--password', default='bench')
+    parser.add_argument('--latency', type=float, default=0.0, help='Response delay, seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random ± delay, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of 500/502 responses')
+    parser.add_argument('--session-ttl', type=float, default=3600, help='Session lifetime, seconds')
+    parser.add_argument('--mutate-interval', type=float, default=10, help='Queue change period, seconds (0 — static)')
+    parser.add_argument('--arrivals', type=int, default=5, help='New requests per queue change')
+    parser.add_argument('--completed', type=int, default=3, help='Requests removed per queue change')
+    parser.add_argument('--taken', type=int, default=2, help='Requests taken into work per queue change')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Локальная замена Telegram Bot API (aiohttp) для офлайн-тестов доставки.
+
+Отвечает на getMe, sendMessage и sendPhoto в формате Bot API, поэтому
+python-telegram-bot работает с ней без изменений — достаточно
+TELEGRAM_API_BASE_URL=http://127.0.0.1:8082 (см. telegram_sender.create_bot).
+Умеет:
+
+- задержку ответа (`latency` ± `jitter`);
+- 429 с `retry_after`: при превышении `chat_rate` сообщений в секунду на чат
+  и случайно с вероятностью `retry_after_rate`;
+- 400 на слишком длинный текст (4096) или подпись (1024);
+- запись всех принятых сообщений (`messages`, GET /_fake/messages).
+
+Отдельный процесс:
+
+    python -m benchmarks.fake_telegram [--port 8082] [--chat-rate 1] [--retry-after-rate 0.05]
+
+После этого и `send_stats_test.py --send` работает без настоящего токена
+(с любыми TELEGRAM_BOT_TOKEN/TELEGRAM_CHAT_ID и TELEGRAM_API_BASE_URL).
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+MAX_TEXT_LENGTH = 4096
+MAX_CAPTION_LENGTH = 1024
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, chat_rate: float = 0.0,
+                 retry_after_rate: float = 0.0, retry_after: int = 1, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        # Лимит сообщений в секунду на чат (0 — без лимита)
+        self.chat_rate = chat_rate
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+
+        self.messages: List[Dict] = []
+        self.stats = {'accepted': 0, 'retry_after': 0, 'bad_request': 0}
+        self._last_accepted: Dict[str, float] = {}
+        self._message_id = 0
+
+        self.runner: Optional[web.AppRunner] = None
+        self.url = None
+
+    @staticmethod
+    def _error(status: int, description: str, retry_after: Optional[int] = None) -> web.Response:
+        body = {'ok': False, 'error_code': status, 'description': description}
+        if retry_after is not None:
+            body['parameters'] = {'retry_after': retry_after}
+        return web.json_response(body, status=status)
+
+    def _flood_check(self, chat_id: str) -> Optional[web.Response]:
+        """429, если чат превысил лимит или выпала случайная ошибка"""
+        now = time.monotonic()
+        if self.chat_rate:
+            last = self._last_accepted.get(chat_id)
+            wait = (last + 1 / self.chat_rate - now) if last is not None else 0
+            if wait > 0:
+                retry_after = max(1, math.ceil(wait))
+                self.stats['retry_after'] += 1
+                return self._error(429, f"Too Many Requests: retry after {retry_after}", retry_after)
+        if self.retry_after_rate and self.rng.random() < self.retry_after_rate:
+            self.stats['retry_after'] += 1
+            return self._error(429, f"Too Many Requests: retry after {self.retry_after}", self.retry_after)
+        self._last_accepted[chat_id] = now
+        return None
+
+    def _message(self, chat_id: str, **fields) -> Dict:
+        self._message_id += 1
+        chat_type = 'supergroup' if chat_id.startswith('-') else 'private'
+        message = {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': chat_type},
+        }
+        message.update(fields)
+        return message
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+
+        if method == 'getMe':
+            return web.json_response({'ok': True, 'result': {
+                'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot',
+            }})
+        if method not in ('sendMessage', 'sendPhoto'):
+            return self._error(404, 'Not Found: method not found')
+
+        form = await request.post()
+        chat_id = str(form.get('chat_id', ''))
+        text = form.get('text') if method == 'sendMessage' else form.get('caption')
+        limit = MAX_TEXT_LENGTH if method == 'sendMessage' else MAX_CAPTION_LENGTH
+
+        if not chat_id.lstrip('-').isdigit():
+            self.stats['bad_request'] += 1
+            return self._error(400, 'Bad Request: chat not found')
+        if method == 'sendMessage' and not text:
+            self.stats['bad_request'] += 1
+            return self._error(400, 'Bad Request: message text is empty')
+        if text and len(text) > limit:
+            self.stats['bad_request'] += 1
+            what = 'message is too long' if method == 'sendMessage' else 'message caption is too long'
+            return self._error(400, f"Bad Request: {what}")
+
+        flood = self._flood_check(chat_id)
+        if flood is not None:
+            return flood
+
+        self.stats['accepted'] += 1
+        self.messages.append({
+            'method': method,
+            'chat_id': chat_id,
+            'thread_id': form.get('message_thread_id'),
+            'text': text,
+            'parse_mode': form.get('parse_mode'),
+            'at': time.monotonic(),
+        })
+        if method == 'sendPhoto':
+            photo = [{'file_id': f"photo{self._message_id}", 'file_unique_id': f"u{self._message_id}",
+                      'width': 1200, 'height': 600}]
+            result = self._message(chat_id, photo=photo, caption=text)
+        else:
+            result = self._message(chat_id, text=text)
+        return web.json_response({'ok': True, 'result': result})
+
+    async def handle_messages(self, request: web.Request) -> web.Response:
+        return web.json_response({'stats': self.stats, 'messages': self.messages})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=20 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        app.router.add_get('/_fake/messages', self.handle_messages)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Запускаем сервер; port=0 — свободный порт. Возвращает базовый URL для TELEGRAM_API_BASE_URL"""
+        self.runner = web.AppRunner(self.app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+async def serve(args):
+    telegram = FakeTelegram(args.latency, args.jitter, args.chat_rate, args.retry_after_rate, args.retry_after)
+    url = await telegram.start(args.host, args.port)
+    print(f"Fake Telegram Bot API: {url} (TELEGRAM_API_BASE_URL={url})")
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(json.dumps(telegram.stats))
+    finally:
+        await telegram.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Telegram Bot API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=0.0, help='Response delay, seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random ± delay, seconds')
+    parser.add_argument('--chat-rate', type=float, default=0.0, help='Messages per second per chat before 429 (0 — no limit)')
+    parser.add_argument('--retry-after-rate', type=float, default=0.0, help='Share of random 429 responses')
+    parser.add_argument('--retry-after', type=int, default=1, help='retry_after for random 429, seconds')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
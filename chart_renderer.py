@@ -0,0 +1,166 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import signal
+import threading
+from typing import List, Optional
+
+from config import Config
+import native_chart
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_up():
+    """Импортируем matplotlib и прогреваем кэш шрифтов, чтобы первый график рисовался быстро"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    matplotlib.rcParams['font.family'] = 'DejaVu Sans'
+    matplotlib.rcParams['font.size'] = 10
+
+    fig, ax = plt.subplots(figsize=(1, 1))
+    ax.set_title('0ч')
+    fig.savefig(io.BytesIO(), format='png')
+    plt.close(fig)
+
+
+def render_stats_png(values: List[int], hours: List[int], tz_name: str) -> bytes:
+    """Рисуем почасовой график (столбцы + линия) через matplotlib и возвращаем PNG"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    positions = list(range(len(values)))
+
+    fig, ax = plt.subplots(figsize=(12, 5))
+    try:
+        ax.bar(positions, values, color='orange', alpha=0.9)
+        ax.set_xlabel('Час (локальное)')
+        ax.set_ylabel('Количество отправленных заявок')
+        ax.set_xticks(positions)
+        ax.set_xticklabels([f"{h}ч" for h in hours])
+
+        ax2 = ax.twinx()
+        ax2.plot(positions, values, color='green', marker='o')
+        ax2.set_ylabel('Линия (для наглядности)')
+
+        plt.title(f'Статистика отправок по часам — {tz_name} (последние 24 часа)')
+        plt.tight_layout()
+
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png')
+        return buf.getvalue()
+    finally:
+        plt.close(fig)
+
+
+def _worker_main(conn):
+    """Цикл процесса-рендерера: получает (values, hours, tz_name), отвечает PNG"""
+    # Ctrl+C обрабатывает основной процесс, он же и остановит рендерер
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        _warm_up()
+        conn.send(('ready', None))
+    except Exception as e:
+        conn.send(('error', f"warm-up failed: {e}"))
+        return
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        try:
+            conn.send(('ok', render_stats_png(*job)))
+        except Exception as e:
+            conn.send(('error', repr(e)))
+
+
+class ChartWorker:
+    """
+    Рендер графиков вне event loop.
+
+    По умолчанию (CHART_BACKEND=native) график рисуется встроенным рендером
+    native_chart в потоке. С CHART_BACKEND=matplotlib используется отдельный
+    процесс: он запускается заранее (`start`), чтобы импорт matplotlib и загрузка
+    шрифтов не происходили в момент отправки, а зависший рендер убивается
+    по таймауту и перезапускается при следующем вызове.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, backend: Optional[str] = None):
+        self.timeout = timeout if timeout is not None else Config.CHART_RENDER_TIMEOUT
+        self.backend = backend or Config.CHART_BACKEND
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Запускаем процесс-рендерер (прогрев идёт в фоне)"""
+        if self.backend != 'matplotlib':
+            return
+        if self.process is not None and self.process.is_alive():
+            return
+        ctx = multiprocessing.get_context('spawn')
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True, name='chart-renderer')
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        logger.info("Процесс рендера графиков запущен")
+
+    def stop(self):
+        """Останавливаем процесс-рендерер"""
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+        self.ready = False
+
+    def _recv(self, timeout: float):
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"рендер не уложился в {timeout:.0f}s")
+        try:
+            status, payload = self.conn.recv()
+        except EOFError:
+            raise RuntimeError("процесс рендера завершился без ответа")
+        if status == 'error':
+            raise RuntimeError(payload)
+        return payload
+
+    def _render_blocking(self, values: List[int], hours: List[int], tz_name: str) -> bytes:
+        with self.lock:
+            self.start()
+            try:
+                # Первый ответ процесса — сигнал о завершении прогрева
+                if not self.ready:
+                    self._recv(self.timeout)
+                    self.ready = True
+                self.conn.send((list(values), list(hours), tz_name))
+                return self._recv(self.timeout)
+            except Exception:
+                # Процесс в неизвестном состоянии — перезапустим при следующем рендере
+                self.stop()
+                raise
+
+    async def render(self, values: List[int], hours: List[int], tz_name: str) -> bytes:
+        """Рендерим PNG, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        if self.backend != 'matplotlib':
+            return await asyncio.wait_for(
+                loop.run_in_executor(None, native_chart.render_png, values, hours, tz_name),
+                timeout=self.timeout,
+            )
+        return await loop.run_in_executor(None, self._render_blocking, values, hours, tz_name)
@@ -6,7 +6,8 @@ load_dotenv()
 class Config:
     # CRM
     CRM_BASE_URL = os.getenv("CRM_BASE_URL", "https://kp-lead-centre.ru")
-    CRM_REQUESTS_URL = f"{CRM_BASE_URL}/admin/domain/customer-request/index?__view-mode=chats"
+    CRM_REQUESTS_PATH = "/admin/domain/customer-request/index?__view-mode=chats"
+    CRM_REQUESTS_URL = f"{CRM_BASE_URL}{CRM_REQUESTS_PATH}"
     
     # Авторизация
     CRM_LOGIN = os.getenv("CRM_LOGIN")
@@ -15,11 +16,108 @@ class Config:
     # Telegram
     TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
     TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+    # Другой адрес Bot API (свой сервер telegram-bot-api или локальная заглушка для тестов)
+    TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "")
+    # JSON-файл с маршрутами по чатам/темам (см. routing.py); без него всё идёт в TELEGRAM_CHAT_ID
+    TELEGRAM_ROUTES_FILE = os.getenv("TELEGRAM_ROUTES_FILE")
+    # Сколько назначений обслуживается одновременно
+    TELEGRAM_FANOUT_CONCURRENCY = int(os.getenv("TELEGRAM_FANOUT_CONCURRENCY", 4))
+
+    # Flood-лимиты Telegram (сообщений в секунду)
+    TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 25))
+    TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+    TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", 20 / 60))
+    TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", 5))
+    # Пробный режим (main.py --dry-run): настоящий опрос CRM, но теневая база и вывод
+    # сообщений строками JSON в файл или stdout ("-") вместо Telegram
+    DRY_RUN = os.getenv("DRY_RUN", "false").lower() in ("1", "true", "yes")
+    DRY_RUN_SINK = os.getenv("DRY_RUN_SINK", "-")
+    # Порт /metrics пробного экземпляра (0 — выключено: METRICS_PORT занят рабочим)
+    DRY_RUN_METRICS_PORT = int(os.getenv("DRY_RUN_METRICS_PORT", 0))
     
     # Настройки
     MAX_PAGES = int(os.getenv("MAX_PAGES", 5))
+    # Запись загруженных страниц заявок (page_recorder.py) и воспроизведение записей вместо CRM
+    CRM_RECORD_DIR = os.getenv("CRM_RECORD_DIR", "")
+    CRM_REPLAY_DIR = os.getenv("CRM_REPLAY_DIR", "")
+    # Сколько номеров пачек резервировать в базе за раз (1 — без пропусков в нумерации)
+    BATCH_NUMBER_BLOCK_SIZE = int(os.getenv("BATCH_NUMBER_BLOCK_SIZE", 1))
+    # Логи (logging_setup.py): ротация по размеру или по времени (LOG_ROTATE_WHEN, например midnight)
+    # со сжатием старых файлов, формат text или json, ограничение повторяющихся сообщений
+    LOG_FILE = os.getenv("LOG_FILE", "logs/crm_bot.log")
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+    LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 10))
+    LOG_RATE_LIMIT_SECONDS = float(os.getenv("LOG_RATE_LIMIT_SECONDS", 60))
+    LOG_RATE_LIMIT_BURST = int(os.getenv("LOG_RATE_LIMIT_BURST", 5))
+    # Эндпоинт метрик Prometheus /metrics (0 — выключен)
+    METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    # Трассировка циклов (tracing.py): JSONL-файл с ротацией по размеру
+    TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() in ("1", "true", "yes")
+    TRACE_FILE = os.getenv("TRACE_FILE", "logs/traces.jsonl")
+    TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", 10 * 1024 * 1024))
+    TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", 5))
+    # Профилирование циклов опроса (profiler.py): включается сигналом SIGUSR1 на PROFILE_CYCLES циклов
+    # или сразу после запуска на PROFILE_CYCLES_ON_START циклов; режим cprofile, sample или both
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_CYCLES = int(os.getenv("PROFILE_CYCLES", 3))
+    PROFILE_CYCLES_ON_START = int(os.getenv("PROFILE_CYCLES_ON_START", 0))
+    PROFILE_MODE = os.getenv("PROFILE_MODE", "both")
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+
+    # Сторож event loop (loop_watchdog.py): стек блокирующего кода, если loop не отвечает дольше порога
+    WATCHDOG_ENABLED = os.getenv("WATCHDOG_ENABLED", "true").lower() in ("1", "true", "yes")
+    WATCHDOG_INTERVAL = float(os.getenv("WATCHDOG_INTERVAL", 0.5))
+    WATCHDOG_THRESHOLD = float(os.getenv("WATCHDOG_THRESHOLD", 0.5))
+    # Отладочный режим asyncio с логированием медленных колбэков (заметно замедляет loop)
+    WATCHDOG_ASYNCIO_DEBUG = os.getenv("WATCHDOG_ASYNCIO_DEBUG", "false").lower() in ("1", "true", "yes")
+
+    # HA: несколько экземпляров с общей базой, работает только держатель аренды (leader.py)
+    HA_ENABLED = os.getenv("HA_ENABLED", "false").lower() in ("1", "true", "yes")
+    HA_LEASE_SECONDS = int(os.getenv("HA_LEASE_SECONDS", 15))
+    HA_HEARTBEAT_SECONDS = float(os.getenv("HA_HEARTBEAT_SECONDS", 5))
+
+    # Несколько аккаунтов CRM в одном процессе: JSON-файл со списком тенантов (см. tenants.py)
+    TENANTS_FILE = os.getenv("TENANTS_FILE")
+    # Общий пул потоков для загрузки и разбора страниц CRM всех тенантов
+    PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", 2))
+    # Каталог баз тенантов (tenants/<name>.db), если db_path не задан явно
+    TENANTS_DIR = os.getenv("TENANTS_DIR", "tenants")
+
+    # Часовой пояс, в котором CRM показывает даты (если в подсказке нет времени UTC)
+    CRM_DISPLAY_UTC_OFFSET = int(os.getenv("CRM_DISPLAY_UTC_OFFSET", 3))
     DB_PATH = os.getenv("DB_PATH", "crm_requests.db")
+
+    # Outbox: повторные попытки отправки пачек (экспоненциальная пауза)
+    OUTBOX_RETRY_BASE_SECONDS = int(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 5))
+    OUTBOX_RETRY_MAX_SECONDS = int(os.getenv("OUTBOX_RETRY_MAX_SECONDS", 300))
+    OUTBOX_POLL_SECONDS = int(os.getenv("OUTBOX_POLL_SECONDS", 10))
     
+    # Очистка старых данных (retention.py): сколько хранить, размер порции удаления,
+    # бюджет времени одного прохода, пауза между проходами и период запуска
+    RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 1))
+    RETENTION_OUTBOX_DAYS = int(os.getenv("RETENTION_OUTBOX_DAYS", 7))
+    RETENTION_CHUNK_SIZE = int(os.getenv("RETENTION_CHUNK_SIZE", 500))
+    RETENTION_SLICE_BUDGET_MS = int(os.getenv("RETENTION_SLICE_BUDGET_MS", 50))
+    RETENTION_SLICE_PAUSE_SECONDS = float(os.getenv("RETENTION_SLICE_PAUSE_SECONDS", 0.05))
+    RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", 600))
+    # Каталог gzip-архива удалённых заявок (пусто — без архива)
+    RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "")
+    # Сколько свободных страниц возвращать ОС за один цикл
+    RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", 200))
+
+    # Рендер графика статистики: native (встроенный, без matplotlib) или matplotlib
+    CHART_BACKEND = os.getenv("CHART_BACKEND", "native")
+    # Максимальное время рендера графика статистики, после него — текстовая сводка
+    CHART_RENDER_TIMEOUT = float(os.getenv("CHART_RENDER_TIMEOUT", 30))
+
+    # Кэш готовых ежедневных отчётов (график + подпись + счётчики) и сколько периодов хранить
+    STATS_CACHE_DIR = os.getenv("STATS_CACHE_DIR", "stats_cache")
+    STATS_CACHE_KEEP = int(os.getenv("STATS_CACHE_KEEP", 14))
+
     # Заголовки
     HEADERS = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
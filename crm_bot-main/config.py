@@ -1,6 +1,11 @@
 import os
+import sys
 from dotenv import load_dotenv
 
+# Общие с основным ботом модули (telegram_sender, batch_numbers, timeutils, native_chart)
+# не копируются сюда, а берутся из корня репозитория; свои модули этого каталога важнее
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 load_dotenv()
 
 class Config:
@@ -15,13 +20,29 @@ class Config:
     # Telegram
     TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
     TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+
+    # Flood-лимиты Telegram (сообщений в секунду)
+    TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 25))
+    TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+    TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", 20 / 60))
+    TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", 5))
     
     # Настройки
     MAX_PAGES = int(os.getenv("MAX_PAGES", 5))
+    # Сколько номеров пачек резервировать в базе за раз (1 — без пропусков в нумерации)
+    BATCH_NUMBER_BLOCK_SIZE = int(os.getenv("BATCH_NUMBER_BLOCK_SIZE", 1))
+    # Часовой пояс, в котором CRM показывает даты (для перевода scheduled_time в epoch)
+    CRM_DISPLAY_UTC_OFFSET = int(os.getenv("CRM_DISPLAY_UTC_OFFSET", 3))
     DB_PATH = os.getenv("DB_PATH", "crm_requests.db")
     # Период опроса partner alerts в секундах (по умолчанию — 60s)
     PARTNER_ALERT_CHECK_SECONDS = int(os.getenv("PARTNER_ALERT_CHECK_SECONDS", 60))
+    # Окно ожидания и максимальный размер пачки partner alerts
+    PARTNER_ALERT_LINGER_SECONDS = float(os.getenv("PARTNER_ALERT_LINGER_SECONDS", 2))
+    PARTNER_ALERT_MAX_BATCH = int(os.getenv("PARTNER_ALERT_MAX_BATCH", 50))
     
+    # Рендер графика статистики: native (встроенный, без matplotlib) или matplotlib
+    CHART_BACKEND = os.getenv("CHART_BACKEND", "native")
+
     # Заголовки
     HEADERS = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
@@ -1,12 +1,18 @@
 import sqlite3
 import logging
 import json
-from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from config import Config
+from timeutils import now_epoch, parse_local
 
 logger = logging.getLogger(__name__)
 
+
+def scheduled_epoch(scheduled_time: str) -> int:
+    """'YYYY-MM-DD HH:MM' из парсера -> UTC epoch (0, если время не удалось определить)"""
+    return parse_local(scheduled_time, '%Y-%m-%d %H:%M', Config.CRM_DISPLAY_UTC_OFFSET * 60) or 0
+
+
 class Database:
     def __init__(self, db_path: Optional[str] = None):
         self.db_path = db_path or Config.DB_PATH
@@ -21,18 +27,20 @@ class Database:
         cursor.execute('DROP TABLE IF EXISTS requests')
         cursor.execute('DROP TABLE IF EXISTS batch_counter')
         
-        # Основная таблица (только ID + время + статус отправки)
+        # Основная таблица (только ID + время + статус отправки).
+        # Все отметки времени — INTEGER UTC epoch; scheduled_at = 0, если время не определено
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS requests (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 request_id INTEGER NOT NULL,
-                scheduled_time TEXT NOT NULL,
-                first_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_sent_at TIMESTAMP NULL,
+                scheduled_at INTEGER NOT NULL DEFAULT 0,
+                first_seen_at INTEGER NULL,
+                last_sent_at INTEGER NULL,
                 batch_number INTEGER NULL,
-                UNIQUE(request_id, scheduled_time)
+                UNIQUE(request_id, scheduled_at)
             )
         ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_last_sent_at ON requests (last_sent_at)')
         
         # Счётчик пачек
         cursor.execute('''
@@ -47,22 +55,48 @@ class Database:
         conn.close()
         logger.info("База данных инициализирована (упрощённая версия)")
     
-    def get_next_batch_number(self) -> int:
-        """Получаем следующий номер пачки"""
+    @staticmethod
+    def _reserve_batch_numbers(cursor, count: int) -> int:
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            # Одна инструкция: увеличение и чтение под одной блокировкой записи
+            cursor.execute('''
+                UPDATE batch_counter
+                SET last_batch_number = last_batch_number + ?
+                WHERE id = 1
+                RETURNING last_batch_number
+            ''', (count,))
+        else:
+            # Старый SQLite без RETURNING: UPDATE и SELECT в одной транзакции
+            cursor.execute('''
+                UPDATE batch_counter
+                SET last_batch_number = last_batch_number + ?
+                WHERE id = 1
+            ''', (count,))
+            cursor.execute('SELECT last_batch_number FROM batch_counter WHERE id = 1')
+        return cursor.fetchone()[0]
+
+    def reserve_batch_numbers(self, count: int = 1, cursor=None) -> int:
+        """
+        Атомарно резервируем `count` номеров пачек подряд.
+        Возвращает последний зарезервированный номер (диапазон: last - count + 1 .. last).
+        С `cursor` резерв делается в уже открытой транзакции вызывающего и без commit
+        """
+        if cursor is not None:
+            return self._reserve_batch_numbers(cursor, count)
+
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE batch_counter 
-            SET last_batch_number = last_batch_number + 1
-            WHERE id = 1
-        ''')
-        cursor.execute('SELECT last_batch_number FROM batch_counter WHERE id = 1')
-        batch_number = cursor.fetchone()[0]
-        
-        conn.commit()
-        conn.close()
-        return batch_number
+
+        try:
+            last = self._reserve_batch_numbers(cursor, count)
+            conn.commit()
+            return last
+        finally:
+            conn.close()
+
+    def get_next_batch_number(self) -> int:
+        """Получаем следующий номер пачки"""
+        return self.reserve_batch_numbers(1)
     
     def add_or_update_request(self, request_id: int, scheduled_time: str) -> bool:
         """
@@ -71,29 +105,30 @@ class Database:
         """
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        scheduled_at = scheduled_epoch(scheduled_time)
         
         # Проверяем существование
         cursor.execute('''
             SELECT 1 FROM requests 
-            WHERE request_id = ? AND scheduled_time = ?
-        ''', (request_id, scheduled_time))
+            WHERE request_id = ? AND scheduled_at = ?
+        ''', (request_id, scheduled_at))
         
         exists = cursor.fetchone() is not None
         
         if not exists:
             # Новая заявка
             cursor.execute('''
-                INSERT INTO requests (request_id, scheduled_time)
+                INSERT INTO requests (request_id, scheduled_at)
                 VALUES (?, ?)
-            ''', (request_id, scheduled_time))
+            ''', (request_id, scheduled_at))
             logger.debug(f"Добавлена новая заявка: {request_id} ({scheduled_time})")
         
         # Всегда обновляем время последнего просмотра
         cursor.execute('''
             UPDATE requests 
-            SET first_seen_at = CURRENT_TIMESTAMP
-            WHERE request_id = ? AND scheduled_time = ?
-        ''', (request_id, scheduled_time))
+            SET first_seen_at = ?
+            WHERE request_id = ? AND scheduled_at = ?
+        ''', (now_epoch(), request_id, scheduled_at))
         
         conn.commit()
         conn.close()
@@ -106,21 +141,124 @@ class Database:
         
         cursor.execute('''
             UPDATE requests 
-            SET last_sent_at = CURRENT_TIMESTAMP,
+            SET last_sent_at = ?,
                 batch_number = ?
-            WHERE request_id = ? AND scheduled_time = ?
-        ''', (batch_number, request_id, scheduled_time))
+            WHERE request_id = ? AND scheduled_at = ?
+        ''', (now_epoch(), batch_number, request_id, scheduled_epoch(scheduled_time)))
         
         conn.commit()
         conn.close()
         logger.debug(f"Заявка {request_id} отмечена как отправленная в пачке #{batch_number}")
 
+    def pending_requests(self, requests_data: List[Dict]) -> List[Dict]:
+        """
+        Заявки, которые ещё не отправлены: новые или записанные в пачку, но не доставленные.
+        Известным заявкам, как в add_or_update_request, обновляется first_seen_at
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        pending = []
+        now = now_epoch()
+
+        for request_data in requests_data:
+            key = (request_data['id'], scheduled_epoch(request_data.get('scheduled_time', '')))
+            cursor.execute('''
+                SELECT last_sent_at FROM requests
+                WHERE request_id = ? AND scheduled_at = ?
+            ''', key)
+            row = cursor.fetchone()
+            if row is not None:
+                cursor.execute('''
+                    UPDATE requests
+                    SET first_seen_at = ?
+                    WHERE request_id = ? AND scheduled_at = ?
+                ''', (now,) + key)
+            if row is None or row[0] is None:
+                pending.append(request_data)
+
+        conn.commit()
+        conn.close()
+        return pending
+
+    def register_batch(self, requests_data: List[Dict], batch_numbers) -> Tuple[List[Dict], Optional[int]]:
+        """
+        Регистрируем заявки и закрепляем за неотправленными номер пачки — одной транзакцией.
+
+        Отправленными заявки отмечает только mark_batch_as_sent после доставки,
+        поэтому при ошибке отправки или падении процесса они остаются неотправленными
+        и снова попадают в pending_requests. Номер выдаёт `batch_numbers`
+        (BatchNumberAllocator) в этой же транзакции.
+        Возвращает (заявки пачки, номер пачки или None, если отправлять нечего)
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        now = now_epoch()
+        batch = []
+        batch_number = None
+
+        try:
+            # Блокировку записи берём сразу, чтобы основной цикл не вклинился между проверкой и записью
+            cursor.execute('BEGIN IMMEDIATE')
+            for request_data in requests_data:
+                key = (request_data['id'], scheduled_epoch(request_data.get('scheduled_time', '')))
+                cursor.execute('''
+                    INSERT OR IGNORE INTO requests (request_id, scheduled_at, first_seen_at)
+                    VALUES (?, ?, ?)
+                ''', key + (now,))
+                cursor.execute('''
+                    SELECT 1 FROM requests
+                    WHERE request_id = ? AND scheduled_at = ? AND last_sent_at IS NULL
+                ''', key)
+                if cursor.fetchone() is not None:
+                    batch.append(request_data)
+
+            if batch:
+                batch_number = batch_numbers.next(cursor)
+                cursor.executemany('''
+                    UPDATE requests
+                    SET batch_number = ?
+                    WHERE request_id = ? AND scheduled_at = ?
+                ''', [
+                    (batch_number, r['id'], scheduled_epoch(r.get('scheduled_time', '')))
+                    for r in batch
+                ])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Резерв номеров откатился вместе с транзакцией — забываем его и в памяти
+            if batch_number is not None:
+                batch_numbers.discard()
+            raise
+        finally:
+            conn.close()
+
+        return batch, batch_number
+
+    def mark_batch_as_sent(self, requests_data: List[Dict], batch_number: int):
+        """Отмечаем все заявки пачки как отправленные одной транзакцией"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.executemany('''
+            UPDATE requests
+            SET last_sent_at = ?,
+                batch_number = ?
+            WHERE request_id = ? AND scheduled_at = ?
+        ''', [
+            (now_epoch(), batch_number, r['id'], scheduled_epoch(r.get('scheduled_time', '')))
+            for r in requests_data
+        ])
+
+        conn.commit()
+        conn.close()
+        logger.debug(f"Пачка #{batch_number}: {len(requests_data)} заявок отмечены как отправленные")
+
     # Compatibility helpers for tests
     def add_request(self, request_id: int, payload: str) -> bool:
         """Compatibility wrapper used by `test.py`.
 
-        Inserts a request row if it does not exist. `payload` is stored in `scheduled_time` column
-        for compatibility with the simplified schema used in tests.
+        Inserts a request row if it does not exist. `payload` is not stored: the schema keeps
+        only the integer `scheduled_at`, which is left unknown (0) for such rows.
         Returns True if inserted, False if already existed.
         """
         conn = sqlite3.connect(self.db_path)
@@ -131,8 +269,8 @@ class Database:
 
         if not exists:
             cursor.execute(
-                'INSERT INTO requests (request_id, scheduled_time) VALUES (?, ?)',
-                (request_id, payload or '')
+                'INSERT INTO requests (request_id, first_seen_at) VALUES (?, ?)',
+                (request_id, now_epoch())
             )
             conn.commit()
 
@@ -155,8 +293,8 @@ class Database:
         
         cursor.execute('''
             DELETE FROM requests 
-            WHERE date(first_seen_at) < date('now', ?)
-        ''', (f'-{days} days',))
+            WHERE first_seen_at < ?
+        ''', (now_epoch() - days * 86400,))
         
         deleted = cursor.rowcount
         conn.commit()
@@ -169,39 +307,20 @@ class Database:
         """Возвращает словарь {hour: count} для последних 24 часов в часовом поясе с указанным смещением.
 
         Час возвращается в диапазоне 0-23 локального времени (tz_offset_hours).
-        Время в БД хранится в формате UTC (SQLite CURRENT_TIMESTAMP -> UTC), поэтому
-        мы выбираем записи за последние 24 часа по UTC и затем смещаем их на tz_offset.
+        Время в БД хранится в UTC epoch, поэтому и отбор за последние 24 часа, и перевод
+        в локальный час (сдвиг на tz_offset) делаются целочисленной арифметикой в SQLite.
         """
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
-        # Определяем порог UTC (24 часа назад)
-        now_utc = datetime.utcnow()
-        start_utc = now_utc - datetime.timedelta(hours=24) if False else None
-        # We will compute start_utc properly without relying on datetime.timedelta import
-        from datetime import timedelta
-        start_utc = now_utc - timedelta(hours=24)
-
         cursor.execute('''
-            SELECT last_sent_at FROM requests
-            WHERE last_sent_at IS NOT NULL
-            AND last_sent_at >= ?
-        ''', (start_utc.strftime('%Y-%m-%d %H:%M:%S'),))
-
-        rows = cursor.fetchall()
-        conn.close()
+            SELECT ((last_sent_at + ?) / 3600) % 24 AS hour, COUNT(*) FROM requests
+            WHERE last_sent_at >= ?
+            GROUP BY hour
+        ''', (tz_offset_hours * 3600, now_epoch() - 24 * 3600))
 
-        # Initialize counts for 0..23
         counts = {h: 0 for h in range(24)}
-
-        for (last_sent_at_str,) in rows:
-            try:
-                ts = datetime.strptime(last_sent_at_str, '%Y-%m-%d %H:%M:%S')
-                # ts is in UTC; convert to local by adding offset
-                local_ts = ts + timedelta(hours=tz_offset_hours)
-                hour = local_ts.hour
-                counts[hour] = counts.get(hour, 0) + 1
-            except Exception:
-                continue
+        counts.update(dict(cursor.fetchall()))
+        conn.close()
 
         return counts
@@ -3,12 +3,14 @@ import logging
 import signal
 import sys
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Set, Tuple
 
 from config import Config
 from database import Database
 from crm_parser import CRMParser
 from telegram_notifier import TelegramNotifier
+from micro_batcher import MicroBatcher
+from batch_numbers import BatchNumberAllocator
 
 # Логирование
 logging.basicConfig(
@@ -24,9 +26,17 @@ logger = logging.getLogger(__name__)
 class CRMTelegramBot:
     def __init__(self):
         self.db = Database()
+        self.batch_numbers = BatchNumberAllocator(self.db)
         self.crm_parser = CRMParser()
         self.telegram_notifier = TelegramNotifier()
         self.partner_alerts_task = None
+        # Ключи (id, время) alerts, которые уже ждут в micro-batcher или отправляются
+        self.pending_alerts: Set[Tuple] = set()
+        self.partner_alerts_batcher = MicroBatcher(
+            self.send_partner_alerts,
+            linger_seconds=Config.PARTNER_ALERT_LINGER_SECONDS,
+            max_size=Config.PARTNER_ALERT_MAX_BATCH,
+        )
         self.daily_stats_task = None
         self.is_running = True
         
@@ -55,6 +65,7 @@ class CRMTelegramBot:
             # Запускаем таск ежедневной отправки статистики (08:00 по Владивостоку)
             self.daily_stats_task = asyncio.create_task(self.daily_stats_loop())
             # Запускаем таск постоянного мониторинга partner alerts
+            self.partner_alerts_batcher.start()
             self.partner_alerts_task = asyncio.create_task(self.partner_alerts_loop())
                 
             return True
@@ -172,7 +183,7 @@ class CRMTelegramBot:
         
         if requests_to_send:
             # Получаем номер пачки
-            batch_number = self.db.get_next_batch_number()
+            batch_number = self.batch_numbers.next()
             
             # Отправляем
             success = await self.telegram_notifier.send_batch(requests_to_send, batch_number)
@@ -237,6 +248,10 @@ class CRMTelegramBot:
                 await self.partner_alerts_task
             except asyncio.CancelledError:
                 pass
+        # Отправляем накопленные partner alerts
+        await self.partner_alerts_batcher.close()
+        # Останавливаем очередь отправки в Telegram
+        await self.telegram_notifier.close()
 
     async def daily_stats_loop(self):
         """Цикл, отправляющий статистику раз в сутки в 08:00 по Владивостоку (UTC+10).
@@ -303,16 +318,13 @@ class CRMTelegramBot:
         while self.is_running:
             try:
                 alerts = self.crm_parser.find_partner_alerts()
-                for alert in alerts:
-                    # Если alert новый — отправляем немедленно
-                    request_id = alert['id']
-                    scheduled_time = alert.get('scheduled_time', '')
-                    is_new = self.db.add_or_update_request(request_id, scheduled_time)
-                    if is_new:
-                        batch_number = self.db.get_next_batch_number()
-                        success = await self.telegram_notifier.send_batch([alert], batch_number)
-                        if success:
-                            self.db.mark_as_sent(request_id, scheduled_time, batch_number)
+                # Неотправленные alerts собираются в короткие пачки и уходят одним сообщением.
+                # В базу они записываются только при отправке пачки (send_partner_alerts)
+                for alert in self.db.pending_requests(alerts):
+                    key = self.alert_key(alert)
+                    if key not in self.pending_alerts:
+                        self.pending_alerts.add(key)
+                        self.partner_alerts_batcher.add(alert)
                 # Ждем перед следующей проверкой
                 await asyncio.sleep(CHECK_INTERVAL)
             except asyncio.CancelledError:
@@ -321,6 +333,27 @@ class CRMTelegramBot:
                 logger.error(f"Ошибка в partner_alerts_loop: {e}")
                 await asyncio.sleep(CHECK_INTERVAL)
 
+    @staticmethod
+    def alert_key(alert: Dict) -> Tuple:
+        return alert['id'], alert.get('scheduled_time', '')
+
+    async def send_partner_alerts(self, alerts: List[Dict]):
+        """Отправляем накопленные partner alerts одной пачкой"""
+        try:
+            # Регистрация и номер пачки — одной транзакцией; отправленными alerts становятся только после доставки
+            batch, batch_number = self.db.register_batch(alerts, self.batch_numbers)
+            if batch_number is None:
+                return
+            success = await self.telegram_notifier.send_batch(batch, batch_number, coalesce=True)
+            if success:
+                self.db.mark_batch_as_sent(batch, batch_number)
+                logger.info(f"Partner alerts: пачка #{batch_number} отправлена ({len(batch)} шт.)")
+            else:
+                # Alerts остались неотправленными в базе — следующая проверка поставит их снова
+                logger.error(f"Не удалось отправить partner alerts (пачка #{batch_number}), повтор при следующей проверке")
+        finally:
+            self.pending_alerts.difference_update(self.alert_key(alert) for alert in alerts)
+
 async def main():
     bot = CRMTelegramBot()
     await bot.run()
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Собирает элементы в небольшие пачки перед отправкой.
+
+    Пачка отдаётся в `flush_callback`, когда с момента появления её первого
+    элемента прошло `linger_seconds` или набралось `max_size` элементов.
+    """
+
+    def __init__(self, flush_callback: Callable[[List[Any]], Awaitable[None]],
+                 linger_seconds: float = 2.0, max_size: int = 50):
+        self.flush_callback = flush_callback
+        self.linger_seconds = linger_seconds
+        self.max_size = max_size
+        self.items: List[Any] = []
+        self.first_item_at: Optional[float] = None
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def add(self, item: Any):
+        """Добавляем элемент в текущую пачку"""
+        if not self.items:
+            self.first_item_at = time.monotonic()
+        self.items.append(item)
+        self.wakeup.set()
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def _flush(self):
+        while self.items:
+            batch = self.items[:self.max_size]
+            self.items = self.items[self.max_size:]
+            self.first_item_at = time.monotonic() if self.items else None
+            try:
+                await self.flush_callback(batch)
+            except Exception as e:
+                logger.error(f"Ошибка при отправке пачки из {len(batch)} элементов: {e}")
+
+    async def _run(self):
+        while True:
+            if not self.items:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            # Ждём, пока пачка наберётся или истечёт окно ожидания
+            remaining = self.first_item_at + self.linger_seconds - time.monotonic()
+            if remaining > 0 and len(self.items) < self.max_size:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._flush()
+
+    async def close(self):
+        """Останавливаем фоновую задачу и отправляем то, что осталось"""
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self._flush()
@@ -6,6 +6,7 @@ import json
 
 from database import Database
 from telegram_notifier import TelegramNotifier
+from timeutils import to_epoch
 
 
 SAMPLE_COUNTS = [120, 100, 80, 50, 30, 20, 10, 5, 3, 7, 15, 25, 40, 60, 110, 140, 170, 180, 190, 200, 185, 160, 140, 100]
@@ -37,11 +38,10 @@ def populate_sample_db(db_path: str, tz_offset_hours: int = 10):
 
         for i in range(count):
             req_id += 1
-            scheduled_time = f"{(local_hour):02d}:00"
-            last_sent_at = (candidate_date + timedelta(minutes=i % 60)).strftime('%Y-%m-%d %H:%M:%S')
+            last_sent_at = to_epoch(candidate_date + timedelta(minutes=i % 60))
             cur.execute(
-                "INSERT OR IGNORE INTO requests (request_id, scheduled_time, first_seen_at, last_sent_at, batch_number) VALUES (?, ?, ?, ?, ?)",
-                (req_id, scheduled_time, datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), last_sent_at, 1)
+                "INSERT OR IGNORE INTO requests (request_id, scheduled_at, first_seen_at, last_sent_at, batch_number) VALUES (?, ?, ?, ?, ?)",
+                (req_id, last_sent_at, last_sent_at, last_sent_at, 1)
             )
 
     conn.commit()
@@ -6,6 +6,8 @@ from typing import List, Dict
 from telegram import Bot
 from telegram.error import TelegramError
 from config import Config
+from telegram_sender import TelegramSender
+import native_chart
 import io
 
 logger = logging.getLogger(__name__)
@@ -14,6 +16,8 @@ class TelegramNotifier:
     def __init__(self):
         self.bot = Bot(token=Config.TELEGRAM_BOT_TOKEN)
         self.chat_id = Config.TELEGRAM_CHAT_ID
+        # Все отправки идут через очередь с учётом flood-лимитов
+        self.sender = TelegramSender(self.bot)
     
     async def send_startup_notification(self):
         """Отправляем уведомление о запуске бота"""
@@ -33,7 +37,7 @@ class TelegramNotifier:
                 f"*Управление:* PM2 (автозапуск)"
             )
             
-            await self.bot.send_message(
+            await self.sender.send_message(
                 chat_id=self.chat_id,
                 text=message,
                 parse_mode='Markdown',
@@ -46,8 +50,11 @@ class TelegramNotifier:
             logger.error(f"Ошибка отправки уведомления о запуске: {e}")
             return False
     
-    async def send_batch(self, requests_data: List[Dict], batch_number: int) -> bool:
-        """Отправляем пачку заявок"""
+    async def send_batch(self, requests_data: List[Dict], batch_number: int, coalesce: bool = False) -> bool:
+        """Отправляем пачку заявок
+
+        `coalesce=True` разрешает склеить сообщение с соседними в очереди чата.
+        """
         if not requests_data:
             logger.info("Нет заявок для отправки")
             return False
@@ -68,9 +75,10 @@ class TelegramNotifier:
             message = "\n".join(message_lines)
             
             # Отправляем
-            await self.bot.send_message(
+            await self.sender.send_message(
                 chat_id=self.chat_id,
                 text=message,
+                coalesce=coalesce,
                 parse_mode='Markdown',
                 disable_notification=True  # Без уведомлений
             )
@@ -107,13 +115,13 @@ class TelegramNotifier:
                 for h, v in zip(hours, values):
                     lines.append(f"{h:02d}: {v}")
                 lines.append(f"\nОтправлено за последние 24 часа: {total}")
-                await self.bot.send_message(chat_id=self.chat_id, text="\n".join(lines))
+                await self.sender.send_message(chat_id=self.chat_id, text="\n".join(lines))
                 logger.info("Ежедневная статистика отправлена в текстовом виде (фолбэк)")
                 return True
 
             caption = f"📊 Статистика отправок (по {tz_name})\nОтправлено за последние 24 часа: {total}"
 
-            await self.bot.send_photo(
+            await self.sender.send_photo(
                 chat_id=self.chat_id,
                 photo=buf,
                 caption=caption,
@@ -128,9 +136,23 @@ class TelegramNotifier:
             logger.error(f"Ошибка при формировании/отправке статистики: {e}")
             return False
 
+    async def close(self):
+        """Останавливаем очередь отправки"""
+        await self.sender.close()
+
     def _render_stats_image(self, values: List[int], hours: List[int], tz_name: str) -> io.BytesIO:
         """Рендерит график в памяти и возвращает BytesIO с PNG.
 
+        По умолчанию используется встроенный рендер (native_chart) без matplotlib;
+        при CHART_BACKEND=matplotlib — более детальный график через matplotlib.
+        """
+        if Config.CHART_BACKEND == 'matplotlib':
+            return self._render_stats_image_matplotlib(values, hours, tz_name)
+        return io.BytesIO(native_chart.render_png(values, hours, tz_name))
+
+    def _render_stats_image_matplotlib(self, values: List[int], hours: List[int], tz_name: str) -> io.BytesIO:
+        """Рендер через matplotlib.
+
         Внутри — делаем максимально устойчивую к headless окружению конфигурацию matplotlib.
         """
         try:
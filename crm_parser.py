@@ -1,25 +1,67 @@
 import requests
 import logging
 import re
+import time
+from contextlib import contextmanager
 from typing import List, Dict, Optional
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 from config import Config
+from timeutils import parse_local
+from metrics import POLL_STAGE_SECONDS, ROWS_PARSED
+from tracing import span
+from page_recorder import PageRecorder, PageReplay
 
 logger = logging.getLogger(__name__)
 
 class CRMParser:
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None, login: Optional[str] = None,
+                 password: Optional[str] = None, adapter: Optional[requests.adapters.HTTPAdapter] = None,
+                 max_pages: Optional[int] = None, record_dir: Optional[str] = None,
+                 replay_dir: Optional[str] = None):
+        # По умолчанию — аккаунт из Config; тенанты (tenants.py) передают свои данные
+        self.base_url = base_url or Config.CRM_BASE_URL
+        self.requests_url = f"{self.base_url}{Config.CRM_REQUESTS_PATH}"
+        self.crm_login = login if login is not None else Config.CRM_LOGIN
+        self.crm_password = password if password is not None else Config.CRM_PASSWORD
+        self.max_pages = max_pages or Config.MAX_PAGES
+
         self.session = requests.Session()
         self.session.headers.update(Config.HEADERS)
+        # Общий пул соединений: у каждого тенанта своя сессия (cookies), но соединения переиспользуются
+        if adapter is not None:
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
         self.is_logged_in = False
+        # Длительность этапов последнего опроса: {этап: секунды}
+        self.stage_seconds: Dict[str, float] = {}
+
+        # Запись страниц для воспроизведения (page_recorder.py)
+        record_dir = record_dir if record_dir is not None else Config.CRM_RECORD_DIR
+        self.recorder = PageRecorder(record_dir) if record_dir else None
+        # Воспроизведение: страницы берутся из записей, вход в CRM не нужен
+        replay_dir = replay_dir if replay_dir is not None else Config.CRM_REPLAY_DIR
+        self.replay = PageReplay(replay_dir) if replay_dir else None
+        if self.replay is not None:
+            self.is_logged_in = True
     
+    @contextmanager
+    def _stage(self, name: str):
+        """Замер этапа опроса: метрика POLL_STAGE_SECONDS и сумма в stage_seconds"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            POLL_STAGE_SECONDS.labels(name).observe(elapsed)
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + elapsed
+
     def login(self) -> bool:
         """Авторизация в Yii2 CRM"""
         try:
             logger.info("Попытка авторизации в CRM...")
             
-            login_url = f"{Config.CRM_BASE_URL}/admin/login"
+            login_url = f"{self.base_url}/admin/login"
             response = self.session.get(login_url, timeout=30)
             
             if response.status_code != 200:
@@ -34,8 +76,8 @@ class CRMParser:
             
             # Данные для входа
             login_data = {
-                'LoginForm[email]': Config.CRM_LOGIN,
-                'LoginForm[password]': Config.CRM_PASSWORD,
+                'LoginForm[email]': self.crm_login,
+                'LoginForm[password]': self.crm_password,
                 '_csrf-frontend': csrf_token,
                 'LoginForm[rememberMe]': '1',
             }
@@ -161,6 +203,35 @@ class CRMParser:
 
         return cell.get_text(strip=True)
     
+    def extract_scheduled_at(self, cell) -> Optional[int]:
+        """Запланированные дата и время из ячейки как UTC epoch (None, если не разобрали)
+
+        Видимый текст ("12.12.25 19:00") показан в часовом поясе CRM; если в title
+        есть время UTC ("Назначено в: 16:00(UTC)"), смещение берём из разницы,
+        иначе — CRM_DISPLAY_UTC_OFFSET.
+        """
+        time_span = cell.find('span') if cell else None
+        if not time_span:
+            return None
+
+        match = re.search(r'(\d{2}\.\d{2}\.\d{2})\s+(\d{1,2}):(\d{2})', time_span.get_text(strip=True))
+        if not match:
+            return None
+        date_str, hour, minute = match.group(1), int(match.group(2)), int(match.group(3))
+
+        offset_minutes = Config.CRM_DISPLAY_UTC_OFFSET * 60
+        utc_match = re.search(r'Назначено в:\s*(\d{1,2}):(\d{2})', time_span.get('title', ''))
+        if utc_match:
+            diff = (hour * 60 + minute) - (int(utc_match.group(1)) * 60 + int(utc_match.group(2)))
+            # Разница известна с точностью до суток: приводим её к (-10ч .. +14ч], чтобы
+            # UTC+12..+14 (Камчатка, Тонга, Кирибати) не стали -12..-10ч; UTC-11/-12 так
+            # неотличимы от +13/+12 и в CRM не встречаются
+            offset_minutes = diff % (24 * 60)
+            if offset_minutes > 14 * 60:
+                offset_minutes -= 24 * 60
+
+        return parse_local(f"{date_str} {hour:02d}:{minute:02d}", "%d.%m.%y %H:%M", offset_minutes)
+
     def parse_requests_from_html(self, html: str) -> List[Dict]:
         """Парсим заявки из HTML"""
         requests_found = []
@@ -225,9 +296,10 @@ class CRMParser:
                 'is_urgent': is_urgent,
                 'is_processing': is_processing,
                 'date': cells[1].get_text(strip=True) if len(cells) > 1 else "",
+                'scheduled_at': self.extract_scheduled_at(cells[1]) if len(cells) > 1 else None,
                 'type': cells[2].get_text(strip=True) if len(cells) > 2 else "",
                 'city': city_text,
-                'url': f"{Config.CRM_BASE_URL}{link['href']}"
+                'url': f"{self.base_url}{link['href']}"
             }
             
             return request_data
@@ -238,16 +310,26 @@ class CRMParser:
     
     def get_requests_page(self, page: int = 1) -> Optional[str]:
         """Получаем HTML страницу с заявками"""
+        if self.replay is not None:
+            return self.replay.get_page(page)
+
         try:
             params = {'page': page} if page > 1 else {}
             
             response = self.session.get(
-                Config.CRM_REQUESTS_URL,
+                self.requests_url,
                 params=params,
                 timeout=30
             )
             
-            if response.status_code == 200:
+            if response.status_code == 200 and "/admin/login" in response.url:
+                # Сессия истекла: CRM перенаправила на форму входа
+                logger.warning(f"Сессия CRM истекла при загрузке страницы {page}")
+                self.is_logged_in = False
+                return None
+            elif response.status_code == 200:
+                if self.recorder:
+                    self.recorder.record(page, response.text)
                 return response.text
             else:
                 logger.error(f"Ошибка при загрузке страницы {page}: {response.status_code}")
@@ -257,22 +339,50 @@ class CRMParser:
             logger.error(f"Ошибка при загрузке страницы {page}: {e}")
             return None
     
+    # Вход и загрузка — соседние этапы: время повторного входа не попадает в fetch_page
+    def _timed_login(self):
+        with self._stage('login'), span('crm.login'):
+            self.login()
+
+    def _timed_fetch(self, page: int) -> Optional[str]:
+        with self._stage('fetch_page'), span('crm.fetch_page', page=page) as fetch_span:
+            html = self.get_requests_page(page)
+            fetch_span.set(bytes=len(html) if html else 0)
+        return html
+
     def find_all_awaiting_calls(self) -> List[Dict]:
         """Находим все заявки на прозвоне на всех страницах"""
         all_requests = []
-        
-        if not self.is_logged_in and not self.login():
-            logger.error("Не удалось авторизоваться в CRM")
+        self.stage_seconds = {}
+
+        if self.replay is not None and not self.replay.start_cycle():
+            logger.info("Записанные циклы опроса закончились")
             return all_requests
+        if self.recorder:
+            self.recorder.start_cycle()
         
-        for page in range(1, Config.MAX_PAGES + 1):
+        if not self.is_logged_in:
+            self._timed_login()
+            if not self.is_logged_in:
+                logger.error("Не удалось авторизоваться в CRM")
+                return all_requests
+        
+        for page in range(1, self.max_pages + 1):
             logger.info(f"Проверяем страницу {page}")
             
-            html = self.get_requests_page(page)
+            html = self._timed_fetch(page)
+            if html is None and not self.is_logged_in:
+                # Входим заново и повторяем страницу, чтобы не пропустить цикл
+                self._timed_login()
+                if self.is_logged_in:
+                    html = self._timed_fetch(page)
             if not html:
                 break
             
-            page_requests = self.parse_requests_from_html(html)
+            with self._stage('parse'), span('crm.parse', page=page) as parse_span:
+                page_requests = self.parse_requests_from_html(html)
+                parse_span.set(rows=len(page_requests))
+            ROWS_PARSED.inc(len(page_requests))
             all_requests.extend(page_requests)
             
             if len(page_requests) < 30:
@@ -1,38 +1,90 @@
 import sqlite3
 import logging
 import json
-from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from config import Config
+from timeutils import now_epoch
+from tracing import traced, current_span
 
 logger = logging.getLogger(__name__)
 
+# Версия схемы (PRAGMA user_version): 1 — все отметки времени в INTEGER UTC epoch
+SCHEMA_VERSION = 1
+
+# Текущее время в epoch на стороне SQLite (значение по умолчанию для колонок времени)
+EPOCH_NOW_SQL = "(CAST(strftime('%s', 'now') AS INTEGER))"
+
+REQUESTS_TABLE_SQL = f'''
+    CREATE TABLE IF NOT EXISTS requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        request_id INTEGER NOT NULL,
+        scheduled_time TEXT NOT NULL,
+        first_seen_at INTEGER DEFAULT {EPOCH_NOW_SQL},
+        last_seen_at INTEGER NULL,
+        last_sent_at INTEGER NULL,
+        batch_number INTEGER NULL,
+        city_id INTEGER NULL REFERENCES cities(id),
+        type_id INTEGER NULL REFERENCES request_types(id),
+        is_urgent INTEGER NOT NULL DEFAULT 0,
+        scheduled_at INTEGER NULL,
+        UNIQUE(request_id, scheduled_time)
+    )
+'''
+
+OUTBOX_TABLE_SQL = f'''
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        batch_number INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        created_at INTEGER DEFAULT {EPOCH_NOW_SQL},
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at INTEGER DEFAULT {EPOCH_NOW_SQL},
+        last_error TEXT NULL,
+        delivered TEXT NOT NULL DEFAULT '[]',
+        sent_at INTEGER NULL
+    )
+'''
+
+# Колонки времени, которые в старых базах хранились текстом CURRENT_TIMESTAMP
+EPOCH_COLUMNS = {
+    'requests': ['first_seen_at', 'last_seen_at', 'last_sent_at'],
+    'outbox': ['created_at', 'next_attempt_at', 'sent_at'],
+}
+
+
+def copy_database(source_path: str, target_path: str):
+    """Согласованная копия базы через backup API (можно делать, пока в неё пишет другой процесс)"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
 class Database:
+    # Словарные таблицы: имя -> колонка-ссылка в requests
+    DICTIONARIES = {'cities': 'city_id', 'request_types': 'type_id'}
+
     def __init__(self, db_path: Optional[str] = None):
         self.db_path = db_path or Config.DB_PATH
+        # Кэш словарей в памяти процесса: {таблица: {имя: id}}
+        self._dictionary_cache: Dict[str, Dict[str, int]] = {table: {} for table in self.DICTIONARIES}
         self.init_db()
     
     def init_db(self):
         """Инициализация базы данных"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        
-        # Удаляем старые таблицы
-        cursor.execute('DROP TABLE IF EXISTS requests')
-        cursor.execute('DROP TABLE IF EXISTS batch_counter')
-        
-        # Основная таблица (только ID + время + статус отправки)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                request_id INTEGER NOT NULL,
-                scheduled_time TEXT NOT NULL,
-                first_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_sent_at TIMESTAMP NULL,
-                batch_number INTEGER NULL,
-                UNIQUE(request_id, scheduled_time)
-            )
-        ''')
+        self._enable_incremental_vacuum(cursor)
+
+        # Таблицы больше не удаляем при старте: иначе теряются заявки,
+        # ожидающие отправки в outbox, и уже отправленные уходят повторно
+        cursor.execute('PRAGMA user_version')
+        schema_version = cursor.fetchone()[0]
+
+        # Основная таблица (ID + время + статус отправки + поля для аналитики)
+        cursor.execute(REQUESTS_TABLE_SQL)
         
         # Счётчик пачек
         cursor.execute('''
@@ -42,63 +94,278 @@ class Database:
             )
         ''')
         cursor.execute('INSERT OR IGNORE INTO batch_counter (id) VALUES (1)')
-        
+
+        # Словари городов и типов заявок: в requests хранится только целочисленный id
+        for table in self.DICTIONARIES:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                )
+            ''')
+
+        # Поля для аналитики (для баз, созданных до их появления)
+        self._ensure_column(cursor, 'requests', 'last_seen_at', 'INTEGER NULL')
+        self._ensure_column(cursor, 'requests', 'city_id', 'INTEGER NULL REFERENCES cities(id)')
+        self._ensure_column(cursor, 'requests', 'type_id', 'INTEGER NULL REFERENCES request_types(id)')
+        self._ensure_column(cursor, 'requests', 'is_urgent', 'INTEGER NOT NULL DEFAULT 0')
+        # Запланированные дата и время заявки (UTC epoch)
+        self._ensure_column(cursor, 'requests', 'scheduled_at', 'INTEGER NULL')
+
+        # Очередь исходящих пачек (outbox): пачка записывается до отправки
+        # и помечается отправленной только после подтверждения от Telegram
+        cursor.execute(OUTBOX_TABLE_SQL)
+        self._ensure_column(cursor, 'outbox', 'delivered', "TEXT NOT NULL DEFAULT '[]'")
+
+        # Время в старых базах — текст CURRENT_TIMESTAMP, переводим в INTEGER epoch
+        if schema_version < 1:
+            self._migrate_to_epoch(cursor, 'requests', REQUESTS_TABLE_SQL)
+            self._migrate_to_epoch(cursor, 'outbox', OUTBOX_TABLE_SQL)
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_last_sent_at ON requests (last_sent_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_batch_number ON requests (batch_number)')
+        # Для порционной очистки по времени последнего появления (см. retention.py)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_requests_seen_at
+            ON requests (COALESCE(last_seen_at, first_seen_at))
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_outbox_pending
+            ON outbox (sent_at, next_attempt_at)
+        ''')
+
+        # Аренда ведущего экземпляра в HA-режиме (см. leader.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS leader_lock (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                acquired_at INTEGER NOT NULL,
+                heartbeat_at INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
         conn.commit()
         conn.close()
         logger.info("База данных инициализирована (упрощённая версия)")
+
+    @staticmethod
+    def _enable_incremental_vacuum(cursor):
+        """
+        Новая (пустая) база создаётся с auto_vacuum=INCREMENTAL. Существующую при старте
+        не трогаем: перевод требует полного VACUUM, он делается отдельно
+        (enable_incremental_vacuum, `python main.py --enable-incremental-vacuum`)
+        """
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'")
+        if not cursor.fetchone()[0]:
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+    def incremental_vacuum_enabled(self) -> bool:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        finally:
+            conn.close()
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        Переводим существующую базу в auto_vacuum=INCREMENTAL. VACUUM переписывает весь файл
+        и держит эксклюзивную блокировку, поэтому запускается вручную, в тихое время.
+        Возвращает False, если база занята другим процессом
+        """
+        if self.incremental_vacuum_enabled():
+            return True
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Не удалось перевести {self.db_path} в auto_vacuum=INCREMENTAL: {e}")
+            return False
+        finally:
+            conn.close()
+        logger.info(f"База {self.db_path} переведена в режим auto_vacuum=INCREMENTAL")
+        return True
+
+    @staticmethod
+    def _ensure_column(cursor, table: str, column: str, definition: str):
+        """Добавляем колонку в существующую таблицу, если её ещё нет (миграция старых баз)"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+            logger.info(f"Добавлена колонка {table}.{column}")
     
-    def get_next_batch_number(self) -> int:
-        """Получаем следующий номер пачки"""
+    @staticmethod
+    def _migrate_to_epoch(cursor, table: str, create_sql: str):
+        """Пересоздаём таблицу с INTEGER-колонками времени, переводя текстовые значения в epoch"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        declared = {row[1]: row[2].upper() for row in cursor.fetchall()}
+        if all(declared.get(column) == 'INTEGER' for column in EPOCH_COLUMNS[table]):
+            return
+
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+        cursor.execute(create_sql)
+        cursor.execute(f'PRAGMA table_info({table})')
+        columns = [row[1] for row in cursor.fetchall() if row[1] in declared]
+
+        select = ', '.join(
+            f"CASE WHEN typeof({c}) = 'text' THEN CAST(strftime('%s', {c}) AS INTEGER) ELSE {c} END"
+            if c in EPOCH_COLUMNS[table] else c
+            for c in columns
+        )
+        cursor.execute(f'INSERT INTO {table} ({", ".join(columns)}) SELECT {select} FROM {table}_legacy')
+        logger.info(f"Таблица {table}: время переведено в epoch ({cursor.rowcount} строк)")
+        cursor.execute(f'DROP TABLE {table}_legacy')
+
+    def _intern(self, cursor, table: str, name: Optional[str]) -> Optional[int]:
+        """id значения в словаре `table` (добавляем при первой встрече); пустое значение -> None"""
+        name = (name or '').strip()
+        if not name:
+            return None
+
+        cache = self._dictionary_cache[table]
+        dictionary_id = cache.get(name)
+        if dictionary_id is None:
+            cursor.execute(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', (name,))
+            cursor.execute(f'SELECT id FROM {table} WHERE name = ?', (name,))
+            dictionary_id = cache[name] = cursor.fetchone()[0]
+        return dictionary_id
+
+    @staticmethod
+    def _reserve_batch_numbers(cursor, count: int) -> int:
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            # Одна инструкция: увеличение и чтение под одной блокировкой записи
+            cursor.execute('''
+                UPDATE batch_counter
+                SET last_batch_number = last_batch_number + ?
+                WHERE id = 1
+                RETURNING last_batch_number
+            ''', (count,))
+        else:
+            # Старый SQLite без RETURNING: UPDATE и SELECT в одной транзакции
+            cursor.execute('''
+                UPDATE batch_counter
+                SET last_batch_number = last_batch_number + ?
+                WHERE id = 1
+            ''', (count,))
+            cursor.execute('SELECT last_batch_number FROM batch_counter WHERE id = 1')
+        return cursor.fetchone()[0]
+
+    @traced('db.reserve_batch_numbers')
+    def reserve_batch_numbers(self, count: int = 1, cursor=None) -> int:
+        """
+        Атомарно резервируем `count` номеров пачек подряд.
+        Возвращает последний зарезервированный номер (диапазон: last - count + 1 .. last).
+        С `cursor` резерв делается в уже открытой транзакции вызывающего и без commit
+        """
+        if cursor is not None:
+            return self._reserve_batch_numbers(cursor, count)
+
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE batch_counter 
-            SET last_batch_number = last_batch_number + 1
-            WHERE id = 1
-        ''')
-        cursor.execute('SELECT last_batch_number FROM batch_counter WHERE id = 1')
-        batch_number = cursor.fetchone()[0]
-        
-        conn.commit()
-        conn.close()
-        return batch_number
+
+        try:
+            last = self._reserve_batch_numbers(cursor, count)
+            conn.commit()
+            return last
+        finally:
+            conn.close()
+
+    def get_next_batch_number(self) -> int:
+        """Получаем следующий номер пачки"""
+        return self.reserve_batch_numbers(1)
     
-    def add_or_update_request(self, request_id: int, scheduled_time: str) -> bool:
+    @traced('db.add_or_update_request')
+    def add_or_update_request(self, request_id: int, scheduled_time: str,
+                              city: Optional[str] = None, request_type: Optional[str] = None,
+                              is_urgent: bool = False, scheduled_at: Optional[int] = None) -> bool:
         """
         Добавляем или обновляем заявку
         Возвращает True, если заявка новая (никогда не была в базе)
         """
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        
-        # Проверяем существование
+        is_new = self._register_request(
+            cursor, request_id, scheduled_time, city, request_type, is_urgent, scheduled_at, now_epoch()
+        )
+        conn.commit()
+        conn.close()
+        return is_new  # True = новая, False = уже была
+
+    def _register_request(self, cursor, request_id: int, scheduled_time: str, city: Optional[str],
+                          request_type: Optional[str], is_urgent: bool, scheduled_at: Optional[int],
+                          now: int) -> bool:
+        # Новая заявка вставляется, существующая игнорируется (по UNIQUE(request_id, scheduled_time))
         cursor.execute('''
-            SELECT 1 FROM requests 
-            WHERE request_id = ? AND scheduled_time = ?
-        ''', (request_id, scheduled_time))
-        
-        exists = cursor.fetchone() is not None
+            INSERT OR IGNORE INTO requests
+                (request_id, scheduled_time, city_id, type_id, is_urgent, scheduled_at, first_seen_at, last_seen_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            request_id, scheduled_time,
+            self._intern(cursor, 'cities', city), self._intern(cursor, 'request_types', request_type),
+            int(is_urgent), scheduled_at, now, now,
+        ))
+        is_new = cursor.rowcount == 1
         
-        if not exists:
-            # Новая заявка
-            cursor.execute('''
-                INSERT INTO requests (request_id, scheduled_time)
-                VALUES (?, ?)
-            ''', (request_id, scheduled_time))
+        if is_new:
             logger.debug(f"Добавлена новая заявка: {request_id} ({scheduled_time})")
-        
-        # Всегда обновляем время последнего просмотра
-        cursor.execute('''
-            UPDATE requests 
-            SET first_seen_at = CURRENT_TIMESTAMP
-            WHERE request_id = ? AND scheduled_time = ?
-        ''', (request_id, scheduled_time))
-        
-        conn.commit()
-        conn.close()
-        return not exists  # True = новая, False = уже была
+        else:
+            # Уже была — обновляем только время последнего просмотра (first_seen_at остаётся временем появления)
+            cursor.execute('''
+                UPDATE requests 
+                SET last_seen_at = ?
+                WHERE request_id = ? AND scheduled_time = ?
+            ''', (now, request_id, scheduled_time))
+        return is_new
+
+    @traced('db.register_and_enqueue')
+    def register_and_enqueue(self, requests_data: List[Dict], batch_numbers) -> Tuple[List[Dict], Optional[int]]:
+        """
+        Регистрируем заявки опроса и ставим новые пачкой в outbox — одной транзакцией.
+
+        Если посередине случится ошибка или процесс упадёт, не сохранится ничего:
+        при следующем опросе те же заявки снова будут новыми и попадут в пачку.
+        Номер пачки выдаёт `batch_numbers` (BatchNumberAllocator) в этой же
+        транзакции и только когда новые заявки есть.
+        Возвращает (новые заявки, номер пачки или None)
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        now = now_epoch()
+        new_requests = []
+        batch_number = None
+        current_span().set(rows=len(requests_data))
+
+        try:
+            # Блокировку записи берём сразу, чтобы другой экземпляр не вклинился между проверкой и записью
+            cursor.execute('BEGIN IMMEDIATE')
+            for req in requests_data:
+                if self._register_request(
+                    cursor, req['id'], req.get('scheduled_time', ''), req.get('city'), req.get('type'),
+                    req.get('is_urgent', False), req.get('scheduled_at'), now
+                ):
+                    new_requests.append(req)
+
+            if new_requests:
+                batch_number = batch_numbers.next(cursor)
+                self._insert_outbox(cursor, new_requests, batch_number, now)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Отменённые вставки в словари и резерв номеров не должны остаться в памяти
+            self._dictionary_cache = {table: {} for table in self.DICTIONARIES}
+            if batch_number is not None:
+                batch_numbers.discard()
+            raise
+        finally:
+            conn.close()
+
+        if batch_number is not None:
+            logger.debug(f"Пачка #{batch_number} записана в outbox ({len(new_requests)} заявок)")
+        return new_requests, batch_number
     
+    @traced('db.mark_as_sent')
     def mark_as_sent(self, request_id: int, scheduled_time: str, batch_number: int):
         """Отмечаем заявку как отправленную"""
         conn = sqlite3.connect(self.db_path)
@@ -106,15 +373,189 @@ class Database:
         
         cursor.execute('''
             UPDATE requests 
-            SET last_sent_at = CURRENT_TIMESTAMP,
+            SET last_sent_at = ?,
                 batch_number = ?
             WHERE request_id = ? AND scheduled_time = ?
-        ''', (batch_number, request_id, scheduled_time))
+        ''', (now_epoch(), batch_number, request_id, scheduled_time))
         
         conn.commit()
         conn.close()
         logger.debug(f"Заявка {request_id} отмечена как отправленная в пачке #{batch_number}")
 
+    @traced('db.enqueue_batch')
+    def enqueue_batch(self, requests_data: List[Dict], batch_number: int) -> int:
+        """Записываем пачку в outbox перед отправкой. Возвращает id записи outbox"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        outbox_id = self._insert_outbox(cursor, requests_data, batch_number, now_epoch())
+        conn.commit()
+        conn.close()
+        logger.debug(f"Пачка #{batch_number} записана в outbox (id={outbox_id})")
+        return outbox_id
+
+    @staticmethod
+    def _insert_outbox(cursor, requests_data: List[Dict], batch_number: int, now: int) -> int:
+        cursor.execute('''
+            INSERT INTO outbox (batch_number, payload, created_at, next_attempt_at)
+            VALUES (?, ?, ?, ?)
+        ''', (batch_number, json.dumps(requests_data, ensure_ascii=False), now, now))
+        return cursor.lastrowid
+
+    @traced('db.get_due_outbox')
+    def get_due_outbox(self, limit: int = 10) -> List[Dict]:
+        """Возвращаем неотправленные пачки, у которых наступило время попытки (старые первыми)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT id, batch_number, payload, attempts, delivered FROM outbox
+            WHERE sent_at IS NULL AND next_attempt_at <= ?
+            ORDER BY id
+            LIMIT ?
+        ''', (now_epoch(), limit))
+        rows = cursor.fetchall()
+        conn.close()
+
+        return [
+            {
+                'id': outbox_id,
+                'batch_number': batch_number,
+                'requests': json.loads(payload),
+                'attempts': attempts,
+                'delivered': json.loads(delivered),
+            }
+            for outbox_id, batch_number, payload, attempts, delivered in rows
+        ]
+
+    def count_pending_outbox(self) -> int:
+        """Количество пачек, ожидающих отправки"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM outbox WHERE sent_at IS NULL')
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    @traced('db.complete_outbox')
+    def complete_outbox(self, outbox_id: int) -> bool:
+        """
+        Отмечаем пачку из outbox доставленной и её заявки — отправленными.
+        Всё в одной транзакции: повторное подтверждение той же пачки
+        ничего не меняет. Возвращает True, если пачка отмечена этим вызовом.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        now = now_epoch()
+
+        try:
+            cursor.execute('''
+                UPDATE outbox
+                SET sent_at = ?, last_error = NULL
+                WHERE id = ? AND sent_at IS NULL
+            ''', (now, outbox_id))
+
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return False
+
+            cursor.execute('SELECT batch_number, payload FROM outbox WHERE id = ?', (outbox_id,))
+            batch_number, payload = cursor.fetchone()
+
+            cursor.executemany('''
+                UPDATE requests
+                SET last_sent_at = ?,
+                    batch_number = ?
+                WHERE request_id = ? AND scheduled_time = ?
+            ''', [
+                (now, batch_number, req['id'], req.get('scheduled_time', ''))
+                for req in json.loads(payload)
+            ])
+
+            conn.commit()
+            return True
+        finally:
+            conn.close()
+
+    @traced('db.update_outbox_delivered')
+    def update_outbox_delivered(self, outbox_id: int, delivered: List[str]):
+        """Запоминаем уже доставленные части пачки, чтобы не слать их повторно"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE outbox SET delivered = ?
+            WHERE id = ? AND sent_at IS NULL
+        ''', (json.dumps(sorted(delivered)), outbox_id))
+
+        conn.commit()
+        conn.close()
+
+    @traced('db.reschedule_outbox')
+    def reschedule_outbox(self, outbox_id: int, error: str, delay_seconds: float):
+        """Откладываем повторную попытку отправки пачки"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE outbox
+            SET attempts = attempts + 1,
+                last_error = ?,
+                next_attempt_at = ?
+            WHERE id = ? AND sent_at IS NULL
+        ''', (error[:500], now_epoch() + int(delay_seconds), outbox_id))
+
+        conn.commit()
+        conn.close()
+
+    def try_acquire_leadership(self, name: str, holder: str, lease_seconds: int) -> bool:
+        """
+        Захватываем или продлеваем аренду `name` одной инструкцией.
+        Удаётся, если аренда свободна, истекла или уже принадлежит `holder`
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        now = now_epoch()
+
+        try:
+            cursor.execute('''
+                INSERT INTO leader_lock (name, holder, acquired_at, heartbeat_at, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    acquired_at = CASE WHEN leader_lock.holder = excluded.holder
+                                       THEN leader_lock.acquired_at ELSE excluded.acquired_at END,
+                    holder = excluded.holder,
+                    heartbeat_at = excluded.heartbeat_at,
+                    expires_at = excluded.expires_at
+                WHERE leader_lock.holder = excluded.holder OR leader_lock.expires_at <= excluded.heartbeat_at
+            ''', (name, holder, now, now, now + lease_seconds))
+            acquired = cursor.rowcount == 1
+            conn.commit()
+            return acquired
+        finally:
+            conn.close()
+
+    def release_leadership(self, name: str, holder: str):
+        """Освобождаем аренду, если она наша"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('UPDATE leader_lock SET expires_at = 0 WHERE name = ? AND holder = ?', (name, holder))
+        conn.commit()
+        conn.close()
+
+    def get_leader(self, name: str) -> Optional[Dict]:
+        """Текущий держатель аренды (None, если аренды нет или она истекла)"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT holder, acquired_at, heartbeat_at, expires_at FROM leader_lock
+            WHERE name = ? AND expires_at > ?
+        ''', (name, now_epoch()))
+        row = cursor.fetchone()
+        conn.close()
+        if row is None:
+            return None
+        return dict(zip(('holder', 'acquired_at', 'heartbeat_at', 'expires_at'), row))
+
     # Compatibility helpers for tests
     def add_request(self, request_id: int, payload: str) -> bool:
         """Compatibility wrapper used by `test.py`.
@@ -149,14 +590,14 @@ class Database:
         return exists
     
     def cleanup_old_requests(self, days: int = 1):
-        """Очищаем старые записи"""
+        """Очищаем записи, которые не появлялись в CRM больше `days` дней"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
             DELETE FROM requests 
-            WHERE date(first_seen_at) < date('now', ?)
-        ''', (f'-{days} days',))
+            WHERE COALESCE(last_seen_at, first_seen_at) < ?
+        ''', (now_epoch() - days * 86400,))
         
         deleted = cursor.rowcount
         conn.commit()
@@ -169,39 +610,20 @@ class Database:
         """Возвращает словарь {hour: count} для последних 24 часов в часовом поясе с указанным смещением.
 
         Час возвращается в диапазоне 0-23 локального времени (tz_offset_hours).
-        Время в БД хранится в формате UTC (SQLite CURRENT_TIMESTAMP -> UTC), поэтому
-        мы выбираем записи за последние 24 часа по UTC и затем смещаем их на tz_offset.
+        Время в БД хранится в UTC epoch, поэтому и отбор за последние 24 часа, и перевод
+        в локальный час (сдвиг на tz_offset) делаются целочисленной арифметикой в SQLite.
         """
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
-        # Определяем порог UTC (24 часа назад)
-        now_utc = datetime.utcnow()
-        start_utc = now_utc - datetime.timedelta(hours=24) if False else None
-        # We will compute start_utc properly without relying on datetime.timedelta import
-        from datetime import timedelta
-        start_utc = now_utc - timedelta(hours=24)
-
         cursor.execute('''
-            SELECT last_sent_at FROM requests
-            WHERE last_sent_at IS NOT NULL
-            AND last_sent_at >= ?
-        ''', (start_utc.strftime('%Y-%m-%d %H:%M:%S'),))
+            SELECT ((last_sent_at + ?) / 3600) % 24 AS hour, COUNT(*) FROM requests
+            WHERE last_sent_at >= ?
+            GROUP BY hour
+        ''', (tz_offset_hours * 3600, now_epoch() - 24 * 3600))
 
-        rows = cursor.fetchall()
-        conn.close()
-
-        # Initialize counts for 0..23
         counts = {h: 0 for h in range(24)}
-
-        for (last_sent_at_str,) in rows:
-            try:
-                ts = datetime.strptime(last_sent_at_str, '%Y-%m-%d %H:%M:%S')
-                # ts is in UTC; convert to local by adding offset
-                local_ts = ts + timedelta(hours=tz_offset_hours)
-                hour = local_ts.hour
-                counts[hour] = counts.get(hour, 0) + 1
-            except Exception:
-                continue
+        counts.update(dict(cursor.fetchall()))
+        conn.close()
 
         return counts
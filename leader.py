@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Callable, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElector:
+    """
+    Выбор ведущего экземпляра через аренду (lease) в общей базе SQLite.
+
+    Несколько копий бота работают с одной базой; опрашивает CRM и отправляет
+    только держатель аренды `name` в таблице leader_lock. Ведущий продлевает
+    аренду каждые HA_HEARTBEAT_SECONDS, остальные в это же время пытаются
+    её захватить и получают её, как только аренда истекла (HA_LEASE_SECONDS)
+    или была освобождена при остановке ведущего.
+
+    Если продлить аренду не удалось (база недоступна), экземпляр сам перестаёт
+    считать себя ведущим, когда локально отсчитанный срок аренды истёк, — раньше,
+    чем её сможет забрать другой экземпляр.
+    """
+
+    def __init__(self, db, name: str = 'main', instance_id: Optional[str] = None,
+                 lease_seconds: Optional[int] = None, heartbeat_seconds: Optional[float] = None,
+                 on_change: Optional[Callable[[bool], None]] = None):
+        self.db = db
+        self.name = name
+        self.instance_id = instance_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds or Config.HA_LEASE_SECONDS
+        self.heartbeat_seconds = heartbeat_seconds or Config.HA_HEARTBEAT_SECONDS
+        self.on_change = on_change
+        # До какого момента (time.monotonic) аренда точно наша
+        self.lease_deadline = 0.0
+        self.was_leader = False
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self.lease_deadline
+
+    def _set_state(self, is_leader: bool):
+        if is_leader == self.was_leader:
+            return
+        self.was_leader = is_leader
+        if is_leader:
+            logger.info(f"Экземпляр {self.instance_id} стал ведущим ({self.name})")
+        else:
+            logger.warning(f"Экземпляр {self.instance_id} больше не ведущий ({self.name}), переход в резерв")
+        if self.on_change:
+            self.on_change(is_leader)
+
+    def heartbeat(self) -> bool:
+        """Захватываем или продлеваем аренду. Возвращает True, если экземпляр ведущий"""
+        started = time.monotonic()
+        try:
+            acquired = self.db.try_acquire_leadership(self.name, self.instance_id, self.lease_seconds)
+        except Exception as e:
+            logger.error(f"Не удалось продлить аренду {self.name}: {e}")
+            acquired = False
+
+        if acquired:
+            # Отсчитываем от момента до запроса и с запасом в секунду (в базе время
+            # округлено до секунд): локальный срок истекает раньше, чем в базе
+            self.lease_deadline = started + self.lease_seconds - 1
+        self._set_state(self.is_leader)
+        return self.is_leader
+
+    async def run(self):
+        """Фоновый цикл heartbeat"""
+        while True:
+            try:
+                self.heartbeat()
+                await asyncio.sleep(self.heartbeat_seconds)
+            except asyncio.CancelledError:
+                break
+
+    def release(self):
+        """Освобождаем аренду, чтобы резервный экземпляр подхватил работу сразу"""
+        if not self.was_leader:
+            return
+        self.lease_deadline = 0.0
+        try:
+            self.db.release_leadership(self.name, self.instance_id)
+        except Exception as e:
+            logger.error(f"Не удалось освободить аренду {self.name}: {e}")
+        self._set_state(False)
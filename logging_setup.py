@@ -0,0 +1,184 @@
+"""
+Настройка логирования бота без записи на диск из event loop.
+
+Все обработчики корневого логгера заменяются одним QueueHandler: запись
+в очередь дешёвая, а файл и консоль обслуживает QueueListener в отдельном
+потоке. Файл ротируется по размеру (LOG_MAX_BYTES) или по времени
+(LOG_ROTATE_WHEN, например "midnight"), старые части сжимаются в .gz.
+
+LOG_FORMAT=json пишет в файл по объекту JSON на строку с идентификатором
+цикла (cycle_id из tracing), чтобы собрать все строки одного опроса или
+одной отправки. Повторяющиеся INFO/DEBUG-сообщения (отличающиеся только
+числами) ограничиваются LOG_RATE_LIMIT_BURST за LOG_RATE_LIMIT_SECONDS.
+"""
+import atexit
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from config import Config
+from tracing import current_trace_id
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_DIGITS = re.compile(r'\d+')
+_EXC_FORMATTER = logging.Formatter()
+
+
+class CycleIdFilter(logging.Filter):
+    """Добавляет в запись идентификатор текущего цикла (до передачи в поток записи)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.cycle_id = current_trace_id()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Не больше `burst` похожих сообщений за `interval` секунд. Похожие —
+    с одинаковым текстом без учёта чисел («Ожидание 1799 секунд» и
+    «Ожидание 1798 секунд»). WARNING и выше не ограничиваются. Первое
+    сообщение после паузы сообщает, сколько похожих было пропущено
+    """
+
+    def __init__(self, interval: float, burst: int):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.lock = threading.Lock()
+        # ключ → [начало окна, сообщений в окне, пропущено]
+        self.windows: Dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.name, _DIGITS.sub('#', str(record.msg)))
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self.windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+
+        if suppressed:
+            record.msg = f"{record.getMessage()} (пропущено похожих сообщений: {suppressed})"
+            record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        cycle_id = getattr(record, 'cycle_id', None)
+        if cycle_id:
+            data['cycle_id'] = cycle_id
+        # После очереди исключение приходит уже текстом (см. ExcTextQueueHandler)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class ExcTextQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который не склеивает traceback с сообщением. Стандартный
+    prepare() форматирует запись целиком и обнуляет exc_info, и JsonFormatter
+    в потоке записи уже не видит исключения. Здесь в очередь уходит сообщение
+    без traceback, а сам traceback — текстом в exc_text
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _gzip_namer(name: str) -> str:
+    return f"{name}.gz"
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def _file_handler(path: str) -> logging.Handler:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if Config.LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=Config.LOG_ROTATE_WHEN, backupCount=Config.LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    return handler
+
+
+def start_queue_listener(*handlers: logging.Handler,
+                         respect_handler_level: bool = False) -> logging.handlers.QueueHandler:
+    """
+    Запускаем фоновый QueueListener, пишущий в `handlers`, и возвращаем QueueHandler
+    для постановки записей в его очередь (сам listener — в атрибуте `listener`).
+    При завершении процесса listener дописывает очередь
+    """
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=respect_handler_level)
+    listener.start()
+    atexit.register(listener.stop)
+    queue_handler = ExcTextQueueHandler(log_queue)
+    queue_handler.listener = listener
+    return queue_handler
+
+
+def setup_logging(path: Optional[str] = None) -> logging.handlers.QueueListener:
+    """
+    Настраиваем корневой логгер: QueueHandler в вызывающем потоке,
+    файл и консоль — в фоновом QueueListener (останавливается при выходе)
+    """
+    file_handler = _file_handler(path or Config.LOG_FILE)
+    file_handler.setFormatter(JsonFormatter() if Config.LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    queue_handler = start_queue_listener(file_handler, stream_handler, respect_handler_level=True)
+    queue_handler.addFilter(CycleIdFilter())
+    if Config.LOG_RATE_LIMIT_BURST:
+        queue_handler.addFilter(RateLimitFilter(Config.LOG_RATE_LIMIT_SECONDS, Config.LOG_RATE_LIMIT_BURST))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(Config.LOG_LEVEL)
+    return queue_handler.listener
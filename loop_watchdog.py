@@ -0,0 +1,132 @@
+"""
+Сторож event loop: замер задержки планирования и поиск блокирующих вызовов.
+
+Корутина-«пульс» просыпается каждые WATCHDOG_INTERVAL секунд и отмечает
+время. Отдельный поток проверяет пульс: если event loop не отвечает
+дольше WATCHDOG_THRESHOLD, поток снимает стек потока event loop — это и
+есть блокирующий код (requests, sqlite3, matplotlib внутри корутины) —
+пишет его в лог и считает случаи по месту в коде проекта.
+
+С WATCHDOG_ASYNCIO_DEBUG дополнительно включается отладочный режим asyncio:
+он сам логирует колбэки дольше порога (slow_callback_duration), а мы их считаем.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Optional
+
+from config import Config
+from metrics import EVENT_LOOP_LAG, EVENT_LOOP_BLOCKED, SLOW_CALLBACKS
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _SlowCallbackCounter(logging.Filter):
+    """Считает предупреждения asyncio о медленных колбэках, ничего не отфильтровывая"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.msg, str) and record.msg.startswith('Executing '):
+            SLOW_CALLBACKS.inc()
+        return True
+
+
+class LoopWatchdog:
+    def __init__(self, interval: Optional[float] = None, threshold: Optional[float] = None,
+                 asyncio_debug: Optional[bool] = None):
+        self.interval = interval or Config.WATCHDOG_INTERVAL
+        self.threshold = threshold or Config.WATCHDOG_THRESHOLD
+        self.asyncio_debug = asyncio_debug if asyncio_debug is not None else Config.WATCHDOG_ASYNCIO_DEBUG
+        # Сколько раз event loop блокировался в каждом месте кода проекта
+        self.blocked = Counter()
+        self.max_lag = 0.0
+        self._last_tick = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+        self._slow_callback_counter = _SlowCallbackCounter()
+
+    async def _pulse(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            self._last_tick = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG.set(lag)
+
+    @staticmethod
+    def _blocking_location(frame) -> str:
+        """Самый глубокий кадр из кода проекта (а не из библиотек) — место блокировки"""
+        innermost = None
+        while frame is not None:
+            code = frame.f_code
+            location = f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}"
+            if innermost is None:
+                innermost = location
+            if os.path.dirname(os.path.abspath(code.co_filename)) == PROJECT_DIR:
+                return location
+            frame = frame.f_back
+        return innermost or '?'
+
+    def _report(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        location = self._blocking_location(frame)
+        self.blocked[location] += 1
+        EVENT_LOOP_BLOCKED.labels(location).inc()
+        stack = ''.join(traceback.format_stack(frame))
+        logger.warning(f"Event loop заблокирован уже {stalled:.2f}s в {location}:\n{stack}")
+
+    def _watch(self):
+        reported_tick = None
+        while not self._stop.wait(self.interval / 2):
+            tick = self._last_tick
+            stalled = time.monotonic() - tick - self.interval
+            if stalled < self.threshold:
+                if reported_tick is not None and tick != reported_tick:
+                    reported_tick = None
+                continue
+            # О каждой блокировке сообщаем один раз, пока пульс не возобновится
+            if tick != reported_tick:
+                reported_tick = tick
+                self._report(stalled)
+
+    def start(self):
+        """Запускаем пульс и поток-сторож (вызывать из работающего event loop)"""
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        if self.asyncio_debug:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+            logging.getLogger('asyncio').addFilter(self._slow_callback_counter)
+
+        self._last_tick = time.monotonic()
+        self._task = asyncio.create_task(self._pulse())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info(f"Сторож event loop запущен (порог {self.threshold}s)")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+        logging.getLogger('asyncio').removeFilter(self._slow_callback_counter)
+        if self.blocked:
+            summary = ', '.join(f"{location} × {count}" for location, count in self.blocked.most_common(5))
+            logger.info(f"Блокировки event loop за время работы (max lag {self.max_lag:.2f}s): {summary}")
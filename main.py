@@ -1,40 +1,141 @@
+import argparse
 import asyncio
 import logging
+import os
+import random
 import signal
+import sqlite3
 import sys
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from config import Config
-from database import Database
+from database import Database, copy_database
 from crm_parser import CRMParser
 from telegram_notifier import TelegramNotifier
-
-# Логирование
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/crm_bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+from stats_report import StatsReportBuilder
+from retention import RetentionManager
+from batch_numbers import BatchNumberAllocator
+from routing import RoutingTable
+from tenants import Tenant, SharedResources, load_tenants
+from leader import LeaderElector
+from tracing import TRACER, span, traced, current_span, run_in_context
+from profiler import PROFILER
+from loop_watchdog import LoopWatchdog
+from logging_setup import setup_logging
+from metrics import (
+    REGISTRY, MetricsServer, POLL_CYCLE_SECONDS, POLL_STAGE_SECONDS, NEW_REQUESTS, BATCH_SIZE,
+    OUTBOX_PENDING, DB_SIZE_BYTES, TELEGRAM_QUEUE_DEPTH, db_size_bytes,
 )
+
 logger = logging.getLogger(__name__)
 
+
+def shadow_path(path: str) -> str:
+    """Путь для пробного режима рядом с рабочим: crm_requests.db → crm_requests.shadow.db"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shadow{ext}"
+
+
+def prepare_shadow_db(db_path: str) -> str:
+    """Теневая база пробного режима; при первом запуске — копия рабочей, чтобы новыми были те же заявки"""
+    path = shadow_path(db_path)
+    if not os.path.exists(path) and os.path.exists(db_path):
+        copy_database(db_path, path)
+        logger.info(f"Теневая база {path} создана из {db_path}")
+    return path
+
+
+def configure_dry_run():
+    """
+    Пробный режим рядом с рабочим экземпляром: все файлы процесса — свои
+    (лог, трассировка, профили, записи страниц), /metrics — на DRY_RUN_METRICS_PORT или выключен.
+    База и кэш отчётов переключаются в CRMTelegramBot
+    """
+    TRACER.path = shadow_path(TRACER.path)
+    PROFILER.output_dir = shadow_path(PROFILER.output_dir)
+    if Config.CRM_RECORD_DIR:
+        Config.CRM_RECORD_DIR = shadow_path(Config.CRM_RECORD_DIR)
+    Config.METRICS_PORT = Config.DRY_RUN_METRICS_PORT
+
+
 class CRMTelegramBot:
-    def __init__(self):
-        self.db = Database()
-        self.crm_parser = CRMParser()
-        self.telegram_notifier = TelegramNotifier()
+    def __init__(self, tenant: Optional[Tenant] = None, shared: Optional[SharedResources] = None):
+        if tenant is None:
+            # Один аккаунт из Config
+            self.name = 'default'
+            db_path = Config.DB_PATH
+            self.crm_parser = CRMParser()
+            self.telegram_notifier = TelegramNotifier()
+            self.parse_executor = None
+            stats_cache_dir = Config.STATS_CACHE_DIR
+            archive_dir = Config.RETENTION_ARCHIVE_DIR
+        else:
+            # Тенант: своя база, сессия CRM и маршрутизация, общие пулы и очередь отправки
+            self.name = tenant.name
+            db_path = tenant.db_path
+            self.crm_parser = CRMParser(
+                tenant.crm_base_url, tenant.crm_login, tenant.crm_password,
+                adapter=shared.http_adapter, max_pages=tenant.max_pages,
+                record_dir=tenant.data_dir(Config.CRM_RECORD_DIR),
+                replay_dir=tenant.data_dir(Config.CRM_REPLAY_DIR)
+            )
+            self.telegram_notifier = TelegramNotifier(
+                tenant.chat_id, RoutingTable(tenant.routes, tenant.chat_id),
+                sender=shared.sender, chart_worker=shared.chart_worker
+            )
+            self.parse_executor = shared.parse_executor
+            stats_cache_dir = tenant.data_dir(Config.STATS_CACHE_DIR)
+            archive_dir = tenant.data_dir(Config.RETENTION_ARCHIVE_DIR)
+
+        if Config.DRY_RUN:
+            # Пробный режим: своя база и кэш отчётов, без архива — рабочий экземпляр их не видит
+            db_path = prepare_shadow_db(db_path)
+            stats_cache_dir = shadow_path(stats_cache_dir)
+            archive_dir = ''
+        self.db = Database(db_path)
+        # Итоги последнего опроса: длительность этапов, найдено и новых заявок
+        self.last_cycle: Dict = {}
+
+        self.batch_numbers = BatchNumberAllocator(self.db)
+        self.stats_report_builder = StatsReportBuilder(
+            self.db, self.telegram_notifier.chart_worker, cache_dir=stats_cache_dir,
+            tz_offset_hours=10, tz_name='Владивосток'
+        )
+        self.retention = RetentionManager(self.db, archive_dir=archive_dir)
+        # HA: опрашивает CRM и отправляет только ведущий экземпляр, остальные — в горячем резерве
+        self.leader = LeaderElector(self.db, on_change=self.on_leadership_change) if Config.HA_ENABLED else None
+        self.leader_task = None
+        REGISTRY.add_collector(self.collect_metrics)
         self.daily_stats_task = None
+        self.outbox_task = None
+        self.retention_task = None
+        self.outbox_wakeup = asyncio.Event()
         self.is_running = True
         
-        # Обработка сигналов
-        signal.signal(signal.SIGINT, self.signal_handler)
-        signal.signal(signal.SIGTERM, self.signal_handler)
+        # Обработка сигналов (в многотенантном режиме сигналы обрабатывает run_tenants)
+        if tenant is None:
+            signal.signal(signal.SIGINT, self.signal_handler)
+            signal.signal(signal.SIGTERM, self.signal_handler)
         
-        logger.info("CRM Telegram Bot инициализирован")
+        logger.info(f"CRM Telegram Bot инициализирован ({self.name})")
     
+    def is_active(self) -> bool:
+        """Должен ли этот экземпляр опрашивать CRM и отправлять (всегда, если HA выключен)"""
+        return self.leader is None or self.leader.is_leader
+
+    def on_leadership_change(self, is_leader: bool):
+        """Новый ведущий сразу досылает пачки, оставшиеся в outbox от предыдущего"""
+        if is_leader:
+            self.outbox_wakeup.set()
+
+    def collect_metrics(self):
+        """Обновляем gauge-метрики перед выдачей /metrics"""
+        OUTBOX_PENDING.labels(self.name).set(self.db.count_pending_outbox())
+        DB_SIZE_BYTES.labels(self.name).set(db_size_bytes(self.db.db_path))
+        TELEGRAM_QUEUE_DEPTH.set(self.telegram_notifier.sender.queue_depth())
+
     def signal_handler(self, signum, frame):
         """Обработка сигналов завершения"""
         logger.info(f"Получен сигнал {signum}, останавливаю бота...")
@@ -43,16 +144,29 @@ class CRMTelegramBot:
     async def startup(self):
         """Инициализация при запуске"""
         try:
+            # Заранее поднимаем процесс рендера графиков (импорт matplotlib и шрифтов)
+            self.telegram_notifier.chart_worker.start()
+
+            # HA: первая попытка захватить аренду до старта циклов, дальше — heartbeat в фоне
+            if self.leader is not None:
+                self.leader.heartbeat()
+                self.leader_task = asyncio.create_task(self.leader.run())
+                # Резерв заранее авторизуется в CRM, чтобы при переключении начать сразу
+                if not self.leader.is_leader:
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(self.parse_executor, self.crm_parser.login)
+
             # Отправляем уведомление о запуске
             await self.telegram_notifier.send_startup_notification()
             
-            # Очистка старых записей (раз в день в 00:05)
-            now = datetime.now()
-            if now.hour == 0 and now.minute < 10:
-                self.db.cleanup_old_requests(days=1)
-
             # Запускаем таск ежедневной отправки статистики (08:00 по Владивостоку)
             self.daily_stats_task = asyncio.create_task(self.daily_stats_loop())
+
+            # Запускаем таск отправки пачек из outbox (в т.ч. оставшихся с прошлого запуска)
+            self.outbox_task = asyncio.create_task(self.outbox_loop())
+
+            # Запускаем таск периодической очистки старых записей
+            self.retention_task = asyncio.create_task(self.retention_loop())
                 
             return True
         except Exception as e:
@@ -108,13 +222,20 @@ class CRMTelegramBot:
         
         return seconds_to_wait
     
+    @traced('poll', root=True)
     async def process_requests(self) -> List[Dict]:
-        """Обрабатываем заявки и возвращаем список для отправки"""
+        """Обрабатываем заявки: новые ставятся пачкой в outbox и возвращаются списком"""
         logger.info("Поиск заявок на прозвоне...")
+        current_span().set(tenant=self.name)
+        cycle_started = time.monotonic()
+        self.last_cycle = {}
         
         try:
-            # Получаем все заявки
-            all_requests = self.crm_parser.find_all_awaiting_calls()
+            # Получаем все заявки (загрузка и разбор страниц — в пуле потоков, не в event loop)
+            loop = asyncio.get_running_loop()
+            all_requests = await loop.run_in_executor(
+                self.parse_executor, run_in_context(PROFILER.wrap(self.crm_parser.find_all_awaiting_calls))
+            )
             
             # Отфильтровываем заявки в работе
             active_requests = []
@@ -124,20 +245,25 @@ class CRMTelegramBot:
             
             logger.info(f"Найдено заявок: {len(all_requests)} → активных: {len(active_requests)}")
             
-            # Регистрируем в базе и собираем новые
-            new_requests = []
-            for req in active_requests:
-                request_id = req['id']
-                scheduled_time = req.get('scheduled_time', '')
-                
-                # Добавляем в базу
-                is_new = self.db.add_or_update_request(request_id, scheduled_time)
-                
-                # Собираем только новые заявки для отправки
-                if is_new:
-                    new_requests.append(req)
+            # Регистрируем в базе (город, тип и срочность — для аналитики) и сразу ставим
+            # новые заявки пачкой в outbox — одной транзакцией, отправкой занимается outbox_loop
+            db_started = time.monotonic()
+            with POLL_STAGE_SECONDS.labels('db_register').time():
+                new_requests, batch_number = self.db.register_and_enqueue(active_requests, self.batch_numbers)
             
             logger.info(f"Новых заявок для отправки: {len(new_requests)}")
+            if batch_number is not None:
+                BATCH_SIZE.observe(len(new_requests))
+                logger.info(f"Пачка #{batch_number} поставлена в очередь отправки ({len(new_requests)} заявок)")
+            NEW_REQUESTS.inc(len(new_requests))
+            finished = time.monotonic()
+            POLL_CYCLE_SECONDS.observe(finished - cycle_started)
+            self.last_cycle = {
+                'seconds': finished - cycle_started,
+                'stages': dict(self.crm_parser.stage_seconds, db_register=finished - db_started),
+                'found': len(all_requests),
+                'new': len(new_requests),
+            }
             return new_requests
             
         except Exception as e:
@@ -160,31 +286,35 @@ class CRMTelegramBot:
         """Проверяем и отправляем если наступило время"""
         if not self.should_send_now():
             return
+
+        if not self.is_active():
+            logger.info("Резервный экземпляр: отправку выполняет ведущий")
+            return
         
         current_time = datetime.now()
         logger.info(f"Время отправки! {current_time.strftime('%H:%M:%S')}")
         
-        # Получаем актуальные заявки
-        requests_to_send = await self.process_requests()
+        # Получаем актуальные заявки (если профилировщик взведён — с профилем цикла)
+        with PROFILER.cycle('poll'):
+            requests_to_send = await self.process_requests()
+        if Config.DRY_RUN:
+            print(self.format_last_cycle(), flush=True)
         
         if requests_to_send:
-            # Получаем номер пачки
-            batch_number = self.db.get_next_batch_number()
-            
-            # Отправляем
-            success = await self.telegram_notifier.send_batch(requests_to_send, batch_number)
-            
-            if success:
-                # Отмечаем как отправленные
-                for req in requests_to_send:
-                    self.db.mark_as_sent(req['id'], req.get('scheduled_time', ''), batch_number)
-                
-                logger.info(f"Пачка #{batch_number} успешно отправлена ({len(requests_to_send)} заявок)")
-            else:
-                logger.error("Не удалось отправить пачку")
+            # Пачка уже в outbox (process_requests), будим отправку
+            self.outbox_wakeup.set()
         else:
             logger.info("Нет новых заявок для отправки")
     
+    def format_last_cycle(self) -> str:
+        """Строка с временем последнего опроса по этапам (пробный режим печатает её после каждого цикла)"""
+        cycle = self.last_cycle
+        if not cycle:
+            return f"[{self.name}] опрос не удался"
+        stages = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in cycle['stages'].items())
+        return (f"[{self.name}] {datetime.now():%H:%M:%S} опрос {cycle['seconds']:.2f}s ({stages}), "
+                f"заявок {cycle['found']}, новых {cycle['new']}")
+
     async def run(self):
         """Основной цикл работы"""
         logger.info("Запуск основного цикла бота...")
@@ -227,6 +357,108 @@ class CRMTelegramBot:
                 await self.daily_stats_task
             except asyncio.CancelledError:
                 pass
+        # Завершаем таск outbox (неотправленные пачки останутся в базе)
+        if self.outbox_task and not self.outbox_task.done():
+            self.outbox_task.cancel()
+            try:
+                await self.outbox_task
+            except asyncio.CancelledError:
+                pass
+        # Завершаем таск очистки (прерванная порция просто повторится при следующем запуске)
+        if self.retention_task and not self.retention_task.done():
+            self.retention_task.cancel()
+            try:
+                await self.retention_task
+            except asyncio.CancelledError:
+                pass
+        # Завершаем heartbeat и освобождаем аренду, чтобы резерв подхватил работу сразу
+        if self.leader_task and not self.leader_task.done():
+            self.leader_task.cancel()
+            try:
+                await self.leader_task
+            except asyncio.CancelledError:
+                pass
+        if self.leader is not None:
+            self.leader.release()
+        # Останавливаем очередь отправки в Telegram
+        await self.telegram_notifier.close()
+
+    def _outbox_retry_delay(self, attempts: int) -> float:
+        """Пауза перед повторной попыткой: экспонента с джиттером, не больше максимума"""
+        delay = min(Config.OUTBOX_RETRY_BASE_SECONDS * (2 ** attempts), Config.OUTBOX_RETRY_MAX_SECONDS)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def drain_outbox(self) -> int:
+        """Отправляем все пачки из outbox, у которых наступило время. Возвращает число доставленных"""
+        delivered = 0
+        if not self.is_active():
+            return delivered
+
+        for item in self.db.get_due_outbox():
+            if not self.is_running or not self.is_active():
+                break
+
+            outbox_id = item['id']
+            batch_number = item['batch_number']
+            requests_data = item['requests']
+
+            with span('outbox', root=True, tenant=self.name, batch=batch_number, requests=len(requests_data)):
+                # Части пачки, доставленные в прошлых попытках, повторно не отправляются
+                with POLL_STAGE_SECONDS.labels('telegram_send').time():
+                    results = await self.telegram_notifier.deliver_batch(
+                        requests_data, batch_number, skip=item['delivered']
+                    )
+                success = all(results.values())
+
+                if success:
+                    # Отмечаем как отправленные только после подтверждения доставки
+                    if self.db.complete_outbox(outbox_id):
+                        delivered += 1
+                        logger.info(f"Пачка #{batch_number} успешно отправлена ({len(requests_data)} заявок)")
+                else:
+                    delivered_keys = [key for key, ok in results.items() if ok]
+                    self.db.update_outbox_delivered(outbox_id, delivered_keys)
+
+                    delay = self._outbox_retry_delay(item['attempts'])
+                    error = f"Доставлено частей: {len(delivered_keys)} из {len(results)}"
+                    self.db.reschedule_outbox(outbox_id, error, delay)
+                    logger.error(
+                        f"Не удалось отправить пачку #{batch_number} "
+                        f"(попытка {item['attempts'] + 1}), повтор через {delay:.0f}s"
+                    )
+
+        return delivered
+
+    async def outbox_loop(self):
+        """Фоновый цикл отправки пачек из outbox с повторами и экспоненциальной паузой"""
+        while self.is_running:
+            try:
+                self.outbox_wakeup.clear()
+                await self.drain_outbox()
+
+                # Ждём новую пачку или следующей проверки отложенных
+                try:
+                    await asyncio.wait_for(self.outbox_wakeup.wait(), timeout=Config.OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Ошибка в outbox_loop: {e}")
+                await asyncio.sleep(Config.OUTBOX_POLL_SECONDS)
+
+    async def retention_loop(self):
+        """Фоновый цикл очистки: порционные удаления и incremental_vacuum раз в RETENTION_INTERVAL_SECONDS"""
+        while self.is_running:
+            try:
+                if self.is_active():
+                    await self.retention.run_cycle()
+                await asyncio.sleep(Config.RETENTION_INTERVAL_SECONDS)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Ошибка в retention_loop: {e}")
+                await asyncio.sleep(Config.RETENTION_INTERVAL_SECONDS)
 
     async def daily_stats_loop(self):
         """Цикл, отправляющий статистику раз в сутки в 08:00 по Владивостоку (UTC+10).
@@ -261,15 +493,21 @@ class CRMTelegramBot:
                 if not self.is_running:
                     break
 
-                # Собираем статистику и пытаемся отправить с ретраями
-                counts = self.db.get_hourly_sent_counts_last_24h(tz_offset_hours=tz_offset)
+                if not self.is_active():
+                    logger.info("Резервный экземпляр: ежедневную статистику отправляет ведущий")
+                    continue
+
+                # Собираем отчёт один раз за период (он кэшируется на диске) и пытаемся отправить с ретраями
+                report = await self.stats_report_builder.build()
+                # Части отчёта, доставленные в прошлых попытках (график не дублируется)
+                delivered = set()
                 attempt = 0
                 sent = False
                 while attempt < RETRIES and not sent and self.is_running:
                     try:
                         attempt += 1
                         logger.info(f"Отправка ежедневной статистики: попытка {attempt}")
-                        sent = await self.telegram_notifier.send_daily_stats(counts, tz_name='Владивосток')
+                        sent = await self.telegram_notifier.send_stats_report(report, delivered)
                         if not sent:
                             logger.warning(f"Попытка {attempt} не удалась — повтор через {RETRY_DELAY}s")
                             await asyncio.sleep(RETRY_DELAY)
@@ -286,11 +524,91 @@ class CRMTelegramBot:
                 logger.error(f"Ошибка в daily_stats_loop: {e}")
                 await asyncio.sleep(60)
 
+async def run_tenants(tenants: List[Tenant]):
+    """Все тенанты в одном event loop с общими пулами и очередью отправки"""
+    shared = SharedResources(len(tenants))
+    bots = [CRMTelegramBot(tenant, shared) for tenant in tenants]
+
+    def stop_all(signum, frame):
+        logger.info(f"Получен сигнал {signum}, останавливаю всех тенантов...")
+        for bot in bots:
+            bot.is_running = False
+
+    signal.signal(signal.SIGINT, stop_all)
+    signal.signal(signal.SIGTERM, stop_all)
+
+    try:
+        await asyncio.gather(*(bot.run() for bot in bots))
+    finally:
+        await shared.close()
+
 async def main():
-    bot = CRMTelegramBot()
-    await bot.run()
+    # SIGUSR1 включает профилирование следующих циклов без перезапуска
+    PROFILER.install_signal_handler()
+    if Config.PROFILE_CYCLES_ON_START:
+        PROFILER.arm(Config.PROFILE_CYCLES_ON_START)
+
+    # Сторож event loop: ловит блокирующие вызовы внутри корутин
+    watchdog = LoopWatchdog() if Config.WATCHDOG_ENABLED else None
+    if watchdog:
+        watchdog.start()
+
+    metrics_server = MetricsServer() if Config.METRICS_PORT else None
+    if metrics_server:
+        await metrics_server.start()
+
+    try:
+        if Config.TENANTS_FILE:
+            await run_tenants(load_tenants())
+        else:
+            bot = CRMTelegramBot()
+            await bot.run()
+    finally:
+        if metrics_server:
+            await metrics_server.stop()
+        if watchdog:
+            await watchdog.stop()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='CRM requests to Telegram notifier')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Poll the real CRM, but use a shadow DB and write messages to a sink instead of Telegram')
+    parser.add_argument('--sink', help='Dry-run message sink: file path or "-" for stdout (default DRY_RUN_SINK)')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='Convert the database (and tenant databases) to auto_vacuum=INCREMENTAL '
+                             'with a one-off full VACUUM, then exit. Run it while the bot is stopped')
+    return parser.parse_args()
+
+def enable_incremental_vacuum() -> bool:
+    """Разовый перевод баз в auto_vacuum=INCREMENTAL (полный VACUUM каждой базы)"""
+    paths = [tenant.db_path for tenant in load_tenants()] if Config.TENANTS_FILE else [Config.DB_PATH]
+    ok = True
+    for path in paths:
+        try:
+            converted = Database(path).enable_incremental_vacuum()
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Не удалось открыть {path}: {e}")
+            converted = False
+        if converted:
+            print(f"{path}: auto_vacuum=INCREMENTAL")
+        else:
+            print(f"{path}: база занята, повторите при остановленном боте")
+            ok = False
+    return ok
 
 if __name__ == "__main__":
-    import os
-    os.makedirs("logs", exist_ok=True)
+    args = parse_args()
+    if args.dry_run:
+        Config.DRY_RUN = True
+    if args.sink:
+        Config.DRY_RUN_SINK = args.sink
+    # Логирование: запись в файл и консоль — в фоновом потоке (logging_setup.py);
+    # пробный экземпляр пишет в свой файл, чтобы не ротировать лог рабочего
+    setup_logging(shadow_path(Config.LOG_FILE) if Config.DRY_RUN else None)
+    if args.enable_incremental_vacuum:
+        sys.exit(0 if enable_incremental_vacuum() else 1)
+    if Config.DRY_RUN:
+        configure_dry_run()
+        logger.info(f"Пробный режим: сообщения — в {Config.DRY_RUN_SINK}, база, кэш отчётов, "
+                    f"трассировка и профили — теневые, /metrics: {Config.METRICS_PORT or 'выключен'}")
     asyncio.run(main())
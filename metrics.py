@@ -0,0 +1,252 @@
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин по умолчанию (секунды) — от миллисекунд до минуты
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    pairs = []
+    for n, v in zip(names, values):
+        escaped = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{n}="{escaped}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        return [f"{name}_total{labels} {_format_value(self.value)}"]
+
+
+class _GaugeValue(_CounterValue):
+    def set(self, value: float):
+        with self.lock:
+            self.value = value
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        return [f"{name}{labels} {_format_value(self.value)}"]
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self.lock:
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self):
+        """Замеряем длительность блока `with` (time.monotonic)"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started)
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        inner = labels[1:-1] + ',' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{inner}le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f"{name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Metric:
+    """Метрика: имя, описание, метки и серии значений по комбинациям меток"""
+
+    TYPE = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.series: Dict[Tuple[str, ...], object] = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Серия метрики с конкретными значениями меток (у метрики без меток — единственная)"""
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+        with self.lock:
+            value = self.series.get(key)
+            if value is None:
+                value = self.series[key] = self._new_value()
+            return value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        with self.lock:
+            series = list(self.series.items())
+        for values, value in series:
+            lines.extend(value.samples(self.name, _format_labels(self.labelnames, values)))
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик"""
+
+    TYPE = 'counter'
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Текущее значение (может расти и уменьшаться)"""
+
+    TYPE = 'gauge'
+
+    def _new_value(self):
+        return _GaugeValue()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    """Распределение наблюдений по корзинам + сумма и количество"""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+class Registry:
+    """Набор метрик процесса и функции, обновляющие gauge-метрики перед выдачей"""
+
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Функция без аргументов, вызываемая перед каждой выдачей метрик"""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Ошибка сбора метрик: {e}")
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Метрики бота
+POLL_STAGE_SECONDS = Histogram('crm_bot_stage_duration_seconds', 'Длительность этапов цикла опроса', ['stage'])
+POLL_CYCLE_SECONDS = Histogram('crm_bot_poll_duration_seconds', 'Длительность всего цикла опроса CRM')
+ROWS_PARSED = Counter('crm_bot_rows_parsed', 'Строк заявок, разобранных со страниц CRM')
+NEW_REQUESTS = Counter('crm_bot_new_requests', 'Новых заявок, найденных при опросе')
+BATCH_SIZE = Histogram('crm_bot_batch_size', 'Размер пачки заявок', buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+TELEGRAM_ERRORS = Counter('crm_bot_telegram_errors', 'Ошибки отправки в Telegram', ['kind'])
+TELEGRAM_SEND_LATENCY = Histogram(
+    'crm_bot_telegram_send_latency_seconds', 'Задержка от постановки в очередь до отправки в Telegram'
+)
+TELEGRAM_QUEUE_DEPTH = Gauge('crm_bot_telegram_queue_depth', 'Сообщений в очередях отправки')
+OUTBOX_PENDING = Gauge('crm_bot_outbox_pending', 'Пачек в outbox, ожидающих отправки', ['tenant'])
+DB_SIZE_BYTES = Gauge('crm_bot_db_size_bytes', 'Размер файла базы SQLite (с WAL)', ['tenant'])
+EVENT_LOOP_LAG = Gauge('crm_bot_event_loop_lag_seconds', 'Последняя измеренная задержка event loop')
+EVENT_LOOP_BLOCKED = Counter(
+    'crm_bot_event_loop_blocked', 'Блокировки event loop дольше порога по месту в коде', ['location']
+)
+SLOW_CALLBACKS = Counter('crm_bot_slow_callbacks', 'Медленные колбэки asyncio (режим отладки)')
+
+
+def db_size_bytes(db_path: str) -> int:
+    """Размер базы на диске вместе с WAL/журналом"""
+    return sum(os.path.getsize(p) for p in (db_path, f"{db_path}-wal", f"{db_path}-journal") if os.path.exists(p))
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics на aiohttp (поднимается, только если задан METRICS_PORT)"""
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, registry: Optional[Registry] = None):
+        self.host = host or Config.METRICS_HOST
+        self.port = port if port is not None else Config.METRICS_PORT
+        self.registry = registry or REGISTRY
+        self.runner = None
+
+    async def _handle_metrics(self, request):
+        from aiohttp import web
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
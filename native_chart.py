@@ -0,0 +1,257 @@
+"""
+Минимальный рендер почасового графика (столбцы + линия) без matplotlib.
+
+PNG пишется напрямую через zlib и struct, SVG — строкой. Раскладка повторяет
+график matplotlib: столбцы по часам в переданном порядке (шкала может
+начинаться с любого часа), подписи "8ч", линия по своей шкале, как у twinx.
+В PNG нет встроенного шрифта для кириллицы, поэтому заголовок и подписи осей
+там не рисуются (они есть в подписи к фото), а итог выводится как "Σ N".
+В SVG текст рисует просмотрщик, поэтому там есть все подписи.
+"""
+import struct
+import zlib
+from typing import List, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+WIDTH = 1200
+HEIGHT = 500
+MARGIN_LEFT = 80
+MARGIN_RIGHT = 40
+MARGIN_TOP = 50
+MARGIN_BOTTOM = 50
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+GRID = (225, 225, 225)
+# Оранжевый с alpha=0.9 на белом фоне, как в matplotlib
+BAR = (255, 174, 25)
+LINE = (0, 128, 0)
+
+# Шрифт 5x7: каждая строка — 5 бит слева направо
+FONT = {
+    '0': (0b01110, 0b10001, 0b10011, 0b10101, 0b11001, 0b10001, 0b01110),
+    '1': (0b00100, 0b01100, 0b00100, 0b00100, 0b00100, 0b00100, 0b01110),
+    '2': (0b01110, 0b10001, 0b00001, 0b00010, 0b00100, 0b01000, 0b11111),
+    '3': (0b11111, 0b00010, 0b00100, 0b00010, 0b00001, 0b10001, 0b01110),
+    '4': (0b00010, 0b00110, 0b01010, 0b10010, 0b11111, 0b00010, 0b00010),
+    '5': (0b11111, 0b10000, 0b11110, 0b00001, 0b00001, 0b10001, 0b01110),
+    '6': (0b00110, 0b01000, 0b10000, 0b11110, 0b10001, 0b10001, 0b01110),
+    '7': (0b11111, 0b00001, 0b00010, 0b00100, 0b01000, 0b01000, 0b01000),
+    '8': (0b01110, 0b10001, 0b10001, 0b01110, 0b10001, 0b10001, 0b01110),
+    '9': (0b01110, 0b10001, 0b10001, 0b01111, 0b00001, 0b00010, 0b01100),
+    'ч': (0b00000, 0b00000, 0b10001, 0b10001, 0b01111, 0b00001, 0b00001),
+    'Σ': (0b11111, 0b10000, 0b01000, 0b00100, 0b01000, 0b10000, 0b11111),
+    ' ': (0, 0, 0, 0, 0, 0, 0),
+}
+GLYPH_W = 5
+GLYPH_H = 7
+
+
+def _nice_ticks(max_value: float, count: int = 5) -> List[int]:
+    """Целые деления оси Y с шагом 1/2/5 × 10^k"""
+    if max_value <= 0:
+        return [0, 1]
+    raw = max_value / count
+    magnitude = 10 ** (len(str(int(raw))) - 1) if raw >= 1 else 1
+    for factor in (1, 2, 5, 10):
+        step = max(1, factor * magnitude)
+        if step >= raw:
+            break
+    top = -(-int(max_value) // step) * step
+    return list(range(0, top + 1, step))
+
+
+def _layout(values: Sequence[int]) -> Tuple[List[int], float, float, float]:
+    """Деления оси Y, ширина слота часа и шкала линии (мин, размах) как у twinx"""
+    ticks = _nice_ticks(max(values) if values else 0)
+    slot = (WIDTH - MARGIN_LEFT - MARGIN_RIGHT) / max(len(values), 1)
+    low, high = (min(values), max(values)) if values else (0, 0)
+    span = (high - low) or 1
+    # matplotlib добавляет 5% полей к пределам автомасштаба
+    return ticks, slot, low - span * 0.05, span * 1.1
+
+
+class _Canvas:
+    """RGB-холст с примитивами, которых хватает для графика"""
+
+    def __init__(self, width: int, height: int, background=WHITE):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(background) * (width * height)
+
+    def fill_rect(self, x0: int, y0: int, x1: int, y1: int, color):
+        x0, x1 = max(0, min(x0, x1)), min(self.width, max(x0, x1))
+        y0, y1 = max(0, min(y0, y1)), min(self.height, max(y0, y1))
+        if x0 >= x1:
+            return
+        row = bytes(color) * (x1 - x0)
+        for y in range(y0, y1):
+            start = (y * self.width + x0) * 3
+            self.pixels[start:start + len(row)] = row
+
+    def line(self, x0: int, y0: int, x1: int, y1: int, color, thickness: int = 2):
+        """Отрезок по Брезенхэму, толщина — квадратной кистью"""
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+        err = dx + dy
+        half = thickness // 2
+        while True:
+            self.fill_rect(x0 - half, y0 - half, x0 - half + thickness, y0 - half + thickness, color)
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+    def circle(self, cx: int, cy: int, radius: int, color):
+        for dy in range(-radius, radius + 1):
+            dx = int((radius * radius - dy * dy) ** 0.5)
+            self.fill_rect(cx - dx, cy + dy, cx + dx + 1, cy + dy + 1, color)
+
+    def text(self, x: int, y: int, text: str, color, scale: int = 2, anchor: str = 'left'):
+        """Текст шрифтом 5x7; неизвестные символы пропускаются"""
+        advance = (GLYPH_W + 1) * scale
+        if anchor == 'center':
+            x -= (len(text) * advance - scale) // 2
+        elif anchor == 'right':
+            x -= len(text) * advance - scale
+        for ch in text:
+            glyph = FONT.get(ch)
+            if glyph:
+                for row, bits in enumerate(glyph):
+                    for col in range(GLYPH_W):
+                        if bits & (1 << (GLYPH_W - 1 - col)):
+                            px, py = x + col * scale, y + row * scale
+                            self.fill_rect(px, py, px + scale, py + scale, color)
+            x += advance
+
+    def to_png(self) -> bytes:
+        # Сжимаем построчно, не собирая копию всего изображения в памяти
+        compressor = zlib.compressobj(6)
+        stride = self.width * 3
+        pixels = memoryview(self.pixels)
+        parts = []
+        for y in range(self.height):
+            parts.append(compressor.compress(b'\x00'))  # фильтр строки: None
+            parts.append(compressor.compress(pixels[y * stride:(y + 1) * stride]))
+        parts.append(compressor.flush())
+        data = b''.join(parts)
+
+        def chunk(tag: bytes, data: bytes) -> bytes:
+            return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+        header = struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0)
+        return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+                + chunk(b'IDAT', data) + chunk(b'IEND', b''))
+
+
+def render_png(values: Sequence[int], hours: Sequence[int], tz_name: str = '') -> bytes:
+    """Рисуем график в PNG. `hours` — подписи столбцов в порядке отрисовки"""
+    canvas = _Canvas(WIDTH, HEIGHT)
+    ticks, slot, line_low, line_span = _layout(values)
+    plot_top, plot_bottom = MARGIN_TOP, HEIGHT - MARGIN_BOTTOM
+    plot_height = plot_bottom - plot_top
+
+    def bar_y(value: float) -> int:
+        return plot_bottom - int(value / ticks[-1] * plot_height)
+
+    def line_y(value: float) -> int:
+        return plot_bottom - int((value - line_low) / line_span * plot_height)
+
+    # Сетка и подписи оси Y
+    for tick in ticks:
+        y = bar_y(tick)
+        canvas.fill_rect(MARGIN_LEFT, y, WIDTH - MARGIN_RIGHT, y + 1, GRID)
+        canvas.text(MARGIN_LEFT - 8, y - GLYPH_H, str(tick), BLACK, anchor='right')
+
+    # Столбцы и подписи часов
+    for i, (hour, value) in enumerate(zip(hours, values)):
+        left = MARGIN_LEFT + int(i * slot + slot * 0.1)
+        right = MARGIN_LEFT + int((i + 1) * slot - slot * 0.1)
+        canvas.fill_rect(left, bar_y(value), right, plot_bottom, BAR)
+        canvas.text((left + right) // 2, plot_bottom + 10, f"{hour}ч", BLACK, anchor='center')
+
+    # Линия с маркерами
+    points = [
+        (MARGIN_LEFT + int((i + 0.5) * slot), line_y(value))
+        for i, value in enumerate(values)
+    ]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        canvas.line(x0, y0, x1, y1, LINE)
+    for x, y in points:
+        canvas.circle(x, y, 4, LINE)
+
+    # Оси и итог
+    canvas.fill_rect(MARGIN_LEFT, plot_top, MARGIN_LEFT + 1, plot_bottom, BLACK)
+    canvas.fill_rect(WIDTH - MARGIN_RIGHT - 1, plot_top, WIDTH - MARGIN_RIGHT, plot_bottom, BLACK)
+    canvas.fill_rect(MARGIN_LEFT, plot_bottom, WIDTH - MARGIN_RIGHT, plot_bottom + 1, BLACK)
+    canvas.fill_rect(MARGIN_LEFT, plot_top, WIDTH - MARGIN_RIGHT, plot_top + 1, BLACK)
+    canvas.text(WIDTH - MARGIN_RIGHT, 15, f"Σ {sum(values)}", BLACK, anchor='right')
+
+    return canvas.to_png()
+
+
+def render_svg(values: Sequence[int], hours: Sequence[int], tz_name: str = '') -> str:
+    """Рисуем тот же график в SVG (с заголовком и подписями осей)"""
+    ticks, slot, line_low, line_span = _layout(values)
+    plot_top, plot_bottom = MARGIN_TOP, HEIGHT - MARGIN_BOTTOM
+    plot_height = plot_bottom - plot_top
+    right_edge = WIDTH - MARGIN_RIGHT
+
+    def bar_y(value: float) -> float:
+        return plot_bottom - value / ticks[-1] * plot_height
+
+    def line_y(value: float) -> float:
+        return plot_bottom - (value - line_low) / line_span * plot_height
+
+    def rgb(color) -> str:
+        return 'rgb({},{},{})'.format(*color)
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+        f'viewBox="0 0 {WIDTH} {HEIGHT}" font-family="DejaVu Sans, sans-serif" font-size="12">',
+        f'<rect width="{WIDTH}" height="{HEIGHT}" fill="white"/>',
+    ]
+
+    for tick in ticks:
+        y = bar_y(tick)
+        parts.append(f'<line x1="{MARGIN_LEFT}" y1="{y:.1f}" x2="{right_edge}" y2="{y:.1f}" stroke="{rgb(GRID)}"/>')
+        parts.append(f'<text x="{MARGIN_LEFT - 8}" y="{y + 4:.1f}" text-anchor="end">{tick}</text>')
+
+    for i, (hour, value) in enumerate(zip(hours, values)):
+        left = MARGIN_LEFT + i * slot + slot * 0.1
+        y = bar_y(value)
+        parts.append(
+            f'<rect x="{left:.1f}" y="{y:.1f}" width="{slot * 0.8:.1f}" '
+            f'height="{plot_bottom - y:.1f}" fill="{rgb(BAR)}"/>'
+        )
+        parts.append(
+            f'<text x="{MARGIN_LEFT + (i + 0.5) * slot:.1f}" y="{plot_bottom + 18}" '
+            f'text-anchor="middle">{hour}ч</text>'
+        )
+
+    points = [(MARGIN_LEFT + (i + 0.5) * slot, line_y(v)) for i, v in enumerate(values)]
+    parts.append(
+        '<polyline fill="none" stroke-width="2" stroke="{}" points="{}"/>'.format(
+            rgb(LINE), ' '.join(f'{x:.1f},{y:.1f}' for x, y in points))
+    )
+    parts.extend(f'<circle cx="{x:.1f}" cy="{y:.1f}" r="4" fill="{rgb(LINE)}"/>' for x, y in points)
+
+    parts.append(
+        f'<rect x="{MARGIN_LEFT}" y="{plot_top}" width="{right_edge - MARGIN_LEFT}" '
+        f'height="{plot_height}" fill="none" stroke="black"/>'
+    )
+    title = f'Статистика отправок по часам — {tz_name} (последние 24 часа)' if tz_name else 'Статистика отправок по часам'
+    parts.append(f'<text x="{WIDTH / 2}" y="28" text-anchor="middle" font-size="14">{escape(title)}</text>')
+    parts.append(f'<text x="{right_edge}" y="{plot_top - 6}" text-anchor="end">Итого: {sum(values)}</text>')
+    parts.append(f'<text x="{WIDTH / 2}" y="{HEIGHT - 8}" text-anchor="middle">Час (локальное)</text>')
+    parts.append(
+        f'<text x="18" y="{(plot_top + plot_bottom) / 2}" text-anchor="middle" '
+        f'transform="rotate(-90 18 {(plot_top + plot_bottom) / 2})">Количество отправленных заявок</text>'
+    )
+    parts.append('</svg>')
+    return '\n'.join(parts)
@@ -0,0 +1,225 @@
+"""
+Запись и воспроизведение страниц заявок CRM.
+
+PageRecorder дописывает каждую загруженную страницу в gzip-файл дня
+(CRM_RECORD_DIR/pages-YYYY-MM-DD.jsonl.gz, дни по UTC): время загрузки,
+начало цикла опроса, номер страницы и HTML. Запись идёт в потоке разбора
+и не влияет на опрос: ошибки диска только логируются.
+
+PageReplay читает такие файлы и отдаёт CRMParser страницы вместо CRM
+(CRM_REPLAY_DIR) — цикл за циклом в порядке записи, без входа в CRM.
+В памяти держится только текущий цикл, поэтому день записей не грузится целиком.
+
+Прогон разбора и дедупликации по записям с максимальной скоростью
+(регрессионный корпус и бенчмарк на реальных данных):
+
+    python page_recorder.py recordings/pages-2026-10-19.jsonl.gz [--db replay.db] [--snapshot day.json] [--check day.json]
+
+`--snapshot` сохраняет по каждому циклу число строк, новых заявок и хэш
+разобранных данных, `--check` сравнивает с сохранённым (код возврата 1 при расхождении).
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def append_gzip_lines(path: str, lines: List[str]):
+    """
+    Дописываем строки в gzip-файл, создавая каталог. Режим 'ab' добавляет
+    новый gzip-член, такой файл читается gzip.open как один поток
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with gzip.open(path, 'ab') as f:
+        f.write(''.join(line + '\n' for line in lines).encode('utf-8'))
+
+
+def day_file(directory: str, at: float) -> str:
+    return os.path.join(directory, f"pages-{datetime.utcfromtimestamp(at):%Y-%m-%d}.jsonl.gz")
+
+
+class PageRecorder:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.cycle_started: Optional[float] = None
+
+    def start_cycle(self):
+        """Начало опроса: страницы до следующего вызова относятся к одному циклу"""
+        self.cycle_started = round(time.time(), 3)
+
+    def record(self, page: int, html: str):
+        at = time.time()
+        line = json.dumps({
+            'cycle': self.cycle_started or round(at, 3),
+            'at': round(at, 3),
+            'page': page,
+            'html': html,
+        }, ensure_ascii=False)
+        try:
+            append_gzip_lines(day_file(self.directory, at), [line])
+        except OSError as e:
+            logger.error(f"Не удалось записать страницу {page}: {e}")
+
+
+def recording_files(source: str) -> List[str]:
+    """Файлы записей: сам файл или все pages-*.jsonl.gz каталога по порядку дней"""
+    if os.path.isfile(source):
+        return [source]
+    return sorted(
+        os.path.join(source, name) for name in os.listdir(source)
+        if name.startswith('pages-') and name.endswith('.jsonl.gz')
+    )
+
+
+def iter_cycles(source: str) -> Iterator[Dict]:
+    """Циклы опроса из записей: {'cycle': начало, 'pages': {номер: HTML}}"""
+    current = None
+    for path in recording_files(source):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Недописанная строка, если процесс остановили во время записи
+                    logger.warning(f"Пропущена повреждённая запись в {path}")
+                    continue
+                if current is None or record['cycle'] != current['cycle']:
+                    if current is not None:
+                        yield current
+                    current = {'cycle': record['cycle'], 'pages': {}}
+                current['pages'][record['page']] = record['html']
+    if current is not None:
+        yield current
+
+
+class PageReplay:
+    def __init__(self, source: str):
+        self.source = source
+        self._cycles = iter_cycles(source)
+        self.current: Optional[Dict] = None
+        self.cycles_served = 0
+
+    def start_cycle(self) -> bool:
+        """Переходим к следующему записанному циклу; False — записи закончились"""
+        self.current = next(self._cycles, None)
+        if self.current is None:
+            return False
+        self.cycles_served += 1
+        return True
+
+    def get_page(self, page: int) -> Optional[str]:
+        if self.current is None:
+            return None
+        return self.current['pages'].get(page)
+
+
+def _digest(requests_data: List[Dict]) -> str:
+    # url зависит от CRM_BASE_URL окружения, а не от страницы
+    rows = [{k: v for k, v in r.items() if k != 'url'} for r in requests_data]
+    return hashlib.sha1(json.dumps(rows, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def run_replay(source: str, db_path: str) -> Dict:
+    """Разбор и дедупликация по всем записанным циклам, как CRMTelegramBot.process_requests"""
+    from batch_numbers import BatchNumberAllocator
+    from crm_parser import CRMParser
+    from database import Database
+
+    parser = CRMParser(replay_dir=source)
+    replay = parser.replay
+    db = Database(db_path)
+    batch_numbers = BatchNumberAllocator(db)
+
+    totals = {'cycles': 0, 'pages': 0, 'bytes': 0, 'rows': 0, 'new': 0, 'parse_s': 0.0, 'db_s': 0.0}
+    cycles = []
+    started = time.perf_counter()
+    while True:
+        parse_started = time.perf_counter()
+        all_requests = parser.find_all_awaiting_calls()
+        if replay.current is None:
+            break
+        db_started = time.perf_counter()
+
+        active_requests = [req for req in all_requests if not req.get('is_processing', False)]
+        new_requests, _ = db.register_and_enqueue(active_requests, batch_numbers)
+        new_count = len(new_requests)
+        finished = time.perf_counter()
+
+        pages = replay.current['pages']
+        totals['cycles'] += 1
+        totals['pages'] += len(pages)
+        totals['bytes'] += sum(len(html) for html in pages.values())
+        totals['rows'] += len(all_requests)
+        totals['new'] += new_count
+        totals['parse_s'] += db_started - parse_started
+        totals['db_s'] += finished - db_started
+        cycles.append({'cycle': replay.current['cycle'], 'rows': len(all_requests),
+                       'new': new_count, 'digest': _digest(all_requests)})
+
+    elapsed = time.perf_counter() - started
+    totals['elapsed_s'] = elapsed
+    totals['pages_per_sec'] = totals['pages'] / elapsed if elapsed else 0.0
+    totals['rows_per_sec'] = totals['rows'] / elapsed if elapsed else 0.0
+    return {'totals': totals, 'cycles': cycles}
+
+
+def check_snapshot(cycles: List[Dict], snapshot: List[Dict]) -> List[str]:
+    """Расхождения с сохранённым прогоном (пустой список — совпадает)"""
+    problems = []
+    if len(cycles) != len(snapshot):
+        problems.append(f"циклов {len(cycles)}, в снимке {len(snapshot)}")
+    for actual, expected in zip(cycles, snapshot):
+        for key in ('cycle', 'rows', 'new', 'digest'):
+            if actual[key] != expected.get(key):
+                problems.append(f"цикл {expected.get('cycle')}: {key} {actual[key]} вместо {expected.get(key)}")
+                break
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded CRM pages through parsing and deduplication')
+    parser.add_argument('source', help='Recording file or directory (CRM_RECORD_DIR)')
+    parser.add_argument('--db', help='Database for deduplication (default: a fresh temporary one)')
+    parser.add_argument('--snapshot', help='Save per-cycle results as JSON')
+    parser.add_argument('--check', help='Compare per-cycle results with a saved snapshot')
+    args = parser.parse_args()
+
+    # Разбор пишет в лог каждую страницу — в консоль только предупреждения
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+
+    with tempfile.TemporaryDirectory(prefix='replay_') as workdir:
+        result = run_replay(args.source, args.db or os.path.join(workdir, 'replay.db'))
+
+    totals = result['totals']
+    print(f"Циклов: {totals['cycles']}, страниц: {totals['pages']} ({totals['bytes'] / 1024 / 1024:.1f} МБ HTML)")
+    print(f"Заявок в циклах: {totals['rows']}, новых: {totals['new']}")
+    print(f"Время: {totals['elapsed_s']:.2f} с (разбор {totals['parse_s']:.2f} с, база {totals['db_s']:.2f} с)")
+    print(f"Скорость: {totals['pages_per_sec']:.1f} страниц/с, {totals['rows_per_sec']:.1f} заявок/с")
+
+    if args.snapshot:
+        with open(args.snapshot, 'w', encoding='utf-8') as f:
+            json.dump(result['cycles'], f, ensure_ascii=False, indent=1)
+        print(f"Снимок сохранён в {args.snapshot}")
+
+    if args.check:
+        with open(args.check, encoding='utf-8') as f:
+            problems = check_snapshot(result['cycles'], json.load(f))
+        if problems:
+            print(f"Расхождения со снимком {args.check}:")
+            for problem in problems[:20]:
+                print(f"  {problem}")
+            sys.exit(1)
+        print(f"Совпадает со снимком {args.check}")
+
+
+if __name__ == '__main__':
+    main()
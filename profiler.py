@@ -0,0 +1,186 @@
+"""
+Профилирование нескольких циклов опроса без перезапуска бота.
+
+Профилировщик «взводится» сигналом SIGUSR1 (`kill -USR1 <pid>`) или
+настройкой PROFILE_CYCLES_ON_START и снимает профиль следующих
+PROFILE_CYCLES циклов опроса. После каждого цикла в PROFILE_DIR пишутся:
+
+- `<имя>.pstats` — cProfile event loop и потоков разбора
+  (смотреть: `python -m pstats`, snakeviz);
+- `<имя>.collapsed` — стеки статистического сэмплера всех потоков в
+  формате «кадр;кадр;... число» для flamegraph.pl / speedscope.
+
+Пока профилировщик не взведён, цикл проверяет один счётчик и ничего не замеряет.
+"""
+import cProfile
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('cprofile', 'sample', 'both')
+
+
+class StackSampler:
+    """Фоновый поток, снимающий стеки всех потоков каждые `interval` секунд"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _collapse(frame, thread_name: str) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ';'.join(reversed(frames))
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.stacks[self._collapse(frame, names.get(thread_id, str(thread_id)))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def dump(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class CycleProfiler:
+    def __init__(self, output_dir: Optional[str] = None, cycles: Optional[int] = None,
+                 mode: Optional[str] = None, sample_interval: Optional[float] = None):
+        self.output_dir = output_dir or Config.PROFILE_DIR
+        self.cycles = cycles or Config.PROFILE_CYCLES
+        self.mode = mode or Config.PROFILE_MODE
+        if self.mode not in PROFILE_MODES:
+            raise ValueError(f"PROFILE_MODE должен быть одним из {PROFILE_MODES}, а не {self.mode!r}")
+        self.sample_interval = sample_interval or Config.PROFILE_SAMPLE_INTERVAL
+        # Сколько циклов ещё профилировать; 0 — выключен
+        self.remaining = 0
+        # Номер профилируемого цикла — в имени файлов, чтобы циклы одной секунды не перезаписывали друг друга
+        self.sequence = 0
+        # Профили текущего цикла (event loop и потоки разбора), None — цикл не профилируется
+        self._profiles: Optional[List[cProfile.Profile]] = None
+        self._profiles_lock = threading.Lock()
+
+    def arm(self, cycles: Optional[int] = None):
+        """Профилировать следующие `cycles` циклов"""
+        self.remaining = cycles or self.cycles
+        logger.info(f"Профилирование включено на {self.remaining} циклов (режим {self.mode}, каталог {self.output_dir})")
+
+    def install_signal_handler(self, signum: Optional[int] = None):
+        """SIGUSR1 взводит профилировщик (на Windows такого сигнала нет — тогда только PROFILE_CYCLES_ON_START)"""
+        signum = signum if signum is not None else getattr(signal, 'SIGUSR1', None)
+        if signum is None:
+            return
+        signal.signal(signum, lambda s, f: self.arm())
+
+    @contextmanager
+    def cycle(self, name: str = 'poll'):
+        """Профилируем блок `with`, если профилировщик взведён (вложенные циклы входят во внешний)"""
+        if not self.remaining or self._profiles is not None:
+            yield
+            return
+
+        self.remaining -= 1
+        self.sequence += 1
+        profiles: List[cProfile.Profile] = []
+        sampler = None
+        if self.mode in ('cprofile', 'both'):
+            profiles.append(cProfile.Profile())
+        if self.mode in ('sample', 'both'):
+            sampler = StackSampler(self.sample_interval)
+            sampler.start()
+        self._profiles = profiles
+
+        started = time.monotonic()
+        if profiles:
+            profiles[0].enable()
+        try:
+            yield
+        finally:
+            if profiles:
+                profiles[0].disable()
+            self._profiles = None
+            if sampler is not None:
+                sampler.stop()
+            self._dump(name, profiles, sampler, time.monotonic() - started)
+
+    def wrap(self, func):
+        """
+        Функция для пула потоков: если текущий цикл профилируется, вызов
+        попадает в отдельный cProfile, который потом сливается с профилем цикла
+        """
+        def wrapper(*args, **kwargs):
+            profiles = self._profiles
+            if not profiles:
+                return func(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+: cProfile на sys.monitoring один на процесс и уже видит все потоки
+                return func(*args, **kwargs)
+            with self._profiles_lock:
+                profiles.append(profile)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+        return wrapper
+
+    def _dump(self, name: str, profiles: List[cProfile.Profile], sampler: Optional[StackSampler],
+              elapsed: float):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            base = os.path.join(self.output_dir, f"{name}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{self.sequence}")
+            written = []
+            if profiles:
+                stats = pstats.Stats(profiles[0])
+                for profile in profiles[1:]:
+                    stats.add(profile)
+                stats.dump_stats(f"{base}.pstats")
+                written.append(f"{base}.pstats")
+            if sampler is not None:
+                sampler.dump(f"{base}.collapsed")
+                written.append(f"{base}.collapsed")
+            logger.info(
+                f"Профиль цикла {name} ({elapsed:.2f}s) сохранён: {', '.join(written)}; "
+                f"осталось циклов: {self.remaining}"
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить профиль цикла {name}: {e}")
+
+
+PROFILER = CycleProfiler()
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import Config
+from page_recorder import append_gzip_lines
+from timeutils import now_epoch
+
+logger = logging.getLogger(__name__)
+
+# Время последнего появления заявки в CRM (по нему же построен индекс idx_requests_seen_at)
+SEEN_AT_SQL = "COALESCE(last_seen_at, first_seen_at)"
+
+
+class RetentionManager:
+    """
+    Периодическая очистка старых данных небольшими порциями.
+
+    Заявки, не появлявшиеся в CRM дольше RETENTION_DAYS, и доставленные пачки
+    outbox старше RETENTION_OUTBOX_DAYS удаляются кусками по RETENTION_CHUNK_SIZE
+    строк по индексу. Каждый проход (`purge_slice`) ограничен бюджетом времени
+    RETENTION_SLICE_BUDGET_MS и коротко блокирует базу, между проходами
+    управление возвращается event loop. Перед удалением заявки можно дописать
+    в gzip-архив (RETENTION_ARCHIVE_DIR), после очистки освобождённые страницы
+    возвращаются через `PRAGMA incremental_vacuum`.
+    """
+
+    def __init__(self, db, retention_days: Optional[int] = None, outbox_days: Optional[int] = None,
+                 chunk_size: Optional[int] = None, slice_budget_ms: Optional[int] = None,
+                 archive_dir: Optional[str] = None):
+        self.db = db
+        self.retention_days = retention_days if retention_days is not None else Config.RETENTION_DAYS
+        self.outbox_days = outbox_days if outbox_days is not None else Config.RETENTION_OUTBOX_DAYS
+        self.chunk_size = chunk_size or Config.RETENTION_CHUNK_SIZE
+        self.slice_budget = (slice_budget_ms or Config.RETENTION_SLICE_BUDGET_MS) / 1000
+        self.archive_dir = archive_dir if archive_dir is not None else Config.RETENTION_ARCHIVE_DIR
+        self.vacuum_warned = False
+
+    def _archive(self, cursor, ids: List[int]) -> int:
+        """Дописываем удаляемые заявки в архив `requests-YYYY-MM-DD.jsonl.gz` (с именами города и типа)"""
+        placeholders = ','.join('?' * len(ids))
+        cursor.execute(f'''
+            SELECT r.id, r.request_id, r.scheduled_time, r.scheduled_at, r.first_seen_at, r.last_seen_at,
+                   r.last_sent_at, r.batch_number, c.name, t.name, r.is_urgent
+            FROM requests AS r
+            LEFT JOIN cities AS c ON c.id = r.city_id
+            LEFT JOIN request_types AS t ON t.id = r.type_id
+            WHERE r.id IN ({placeholders})
+        ''', ids)
+        columns = ['id', 'request_id', 'scheduled_time', 'scheduled_at', 'first_seen_at', 'last_seen_at',
+                   'last_sent_at', 'batch_number', 'city', 'type', 'is_urgent']
+        rows = cursor.fetchall()
+
+        path = os.path.join(self.archive_dir, f"requests-{datetime.utcnow():%Y-%m-%d}.jsonl.gz")
+        append_gzip_lines(path, [json.dumps(dict(zip(columns, row)), ensure_ascii=False) for row in rows])
+        return len(rows)
+
+    def _purge_requests_chunk(self, conn, cutoff: int) -> int:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT id FROM requests
+            WHERE {SEEN_AT_SQL} < ?
+            ORDER BY {SEEN_AT_SQL}
+            LIMIT ?
+        ''', (cutoff, self.chunk_size))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return 0
+
+        if self.archive_dir:
+            self._archive(cursor, ids)
+        cursor.execute(f"DELETE FROM requests WHERE id IN ({','.join('?' * len(ids))})", ids)
+        conn.commit()
+        return len(ids)
+
+    def _purge_outbox_chunk(self, conn, cutoff: int) -> int:
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM outbox WHERE id IN (
+                SELECT id FROM outbox
+                WHERE sent_at IS NOT NULL AND sent_at < ?
+                LIMIT ?
+            )
+        ''', (cutoff, self.chunk_size))
+        deleted = cursor.rowcount
+        conn.commit()
+        return deleted
+
+    def purge_slice(self) -> Dict[str, int]:
+        """
+        Один проход очистки в пределах бюджета времени.
+        Возвращает {'requests': n, 'outbox': n, 'done': 0/1}; done=1 — удалять больше нечего
+        """
+        deadline = time.monotonic() + self.slice_budget
+        now = now_epoch()
+        result = {'requests': 0, 'outbox': 0, 'done': 0}
+
+        conn = sqlite3.connect(self.db.db_path)
+        try:
+            for key, purge, cutoff in (
+                ('requests', self._purge_requests_chunk, now - self.retention_days * 86400),
+                ('outbox', self._purge_outbox_chunk, now - self.outbox_days * 86400),
+            ):
+                while time.monotonic() < deadline:
+                    deleted = purge(conn, cutoff)
+                    result[key] += deleted
+                    if deleted < self.chunk_size:
+                        break
+                else:
+                    return result
+            result['done'] = 1
+            return result
+        finally:
+            conn.close()
+
+    def incremental_vacuum(self, pages: Optional[int] = None) -> int:
+        """Возвращаем ОС до `pages` свободных страниц. Возвращает число освобождённых страниц"""
+        pages = pages or Config.RETENTION_VACUUM_PAGES
+        conn = sqlite3.connect(self.db.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('PRAGMA auto_vacuum')
+            if cursor.fetchone()[0] != 2:
+                # Без auto_vacuum=INCREMENTAL прагма ничего не освобождает
+                if not self.vacuum_warned:
+                    self.vacuum_warned = True
+                    logger.warning(
+                        f"incremental_vacuum недоступен для {self.db.db_path}: база не в режиме "
+                        f"auto_vacuum=INCREMENTAL (перевод: python main.py --enable-incremental-vacuum)"
+                    )
+                return 0
+            cursor.execute('PRAGMA freelist_count')
+            before = cursor.fetchone()[0]
+            if not before:
+                return 0
+            # execute() делает только один шаг прагмы (одна страница), executescript — до конца
+            conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+            cursor.execute('PRAGMA freelist_count')
+            return before - cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+    async def run_cycle(self) -> Dict[str, int]:
+        """Полный цикл очистки: проходы с паузами между ними, затем incremental_vacuum"""
+        started = time.monotonic()
+        totals = {'requests': 0, 'outbox': 0, 'slices': 0}
+
+        while True:
+            result = self.purge_slice()
+            totals['requests'] += result['requests']
+            totals['outbox'] += result['outbox']
+            totals['slices'] += 1
+            if result['done']:
+                break
+            # Отдаём управление event loop и другим писателям в базу
+            await asyncio.sleep(Config.RETENTION_SLICE_PAUSE_SECONDS)
+
+        totals['vacuumed_pages'] = self.incremental_vacuum()
+
+        if totals['requests'] or totals['outbox'] or totals['vacuumed_pages']:
+            logger.info(
+                f"Очистка: удалено заявок {totals['requests']}, пачек outbox {totals['outbox']}, "
+                f"освобождено страниц {totals['vacuumed_pages']} "
+                f"({totals['slices']} проходов, {time.monotonic() - started:.2f}s)"
+            )
+        return totals
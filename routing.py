@@ -0,0 +1,76 @@
+import json
+import logging
+from typing import Dict, List, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingTable:
+    """
+    Таблица маршрутизации заявок по чатам/темам Telegram.
+
+    Маршрут — словарь вида:
+        {"chat_id": "-100123", "thread_id": 5,
+         "city": ["Москва"], "type": ["Впервые"], "urgent": true}
+
+    Условия `city`, `type` и `urgent` необязательны; маршрут без условий
+    получает все заявки. Заявка уходит во все подходящие маршруты, а если
+    таких нет — в чат по умолчанию (`TELEGRAM_CHAT_ID`).
+    """
+
+    def __init__(self, routes: List[Dict], default_chat_id=None):
+        self.routes = routes
+        self.default = {'chat_id': default_chat_id, 'thread_id': None}
+
+    @classmethod
+    def from_config(cls) -> 'RoutingTable':
+        """Загружаем маршруты из файла TELEGRAM_ROUTES_FILE (JSON-список), если он задан"""
+        routes = []
+        if Config.TELEGRAM_ROUTES_FILE:
+            with open(Config.TELEGRAM_ROUTES_FILE, encoding='utf-8') as f:
+                routes = json.load(f)
+            logger.info(f"Загружено маршрутов Telegram: {len(routes)}")
+        return cls(routes, Config.TELEGRAM_CHAT_ID)
+
+    @staticmethod
+    def destination_key(destination: Dict) -> str:
+        """Строковый ключ назначения: "chat_id" или "chat_id/thread_id\""""
+        if destination.get('thread_id'):
+            return f"{destination['chat_id']}/{destination['thread_id']}"
+        return str(destination['chat_id'])
+
+    @staticmethod
+    def _matches(route: Dict, request_data: Dict) -> bool:
+        if 'city' in route:
+            city = request_data.get('city', '').strip().lower()
+            if city not in {c.strip().lower() for c in route['city']}:
+                return False
+        if 'type' in route:
+            request_type = request_data.get('type', '').strip().lower()
+            if request_type not in {t.strip().lower() for t in route['type']}:
+                return False
+        if 'urgent' in route and bool(request_data.get('is_urgent')) != bool(route['urgent']):
+            return False
+        return True
+
+    def route(self, request_data: Dict) -> List[Dict]:
+        """Возвращаем все назначения для заявки"""
+        destinations = {}
+        for r in self.routes:
+            if self._matches(r, request_data):
+                destination = {'chat_id': r['chat_id'], 'thread_id': r.get('thread_id')}
+                destinations.setdefault(self.destination_key(destination), destination)
+        return list(destinations.values()) or [self.default]
+
+    def split(self, requests_data: List[Dict]) -> Dict[str, Tuple[Dict, List[Dict]]]:
+        """Раскладываем пачку по назначениям: {ключ: (назначение, заявки)}, порядок заявок сохраняется"""
+        result: Dict[str, Tuple[Dict, List[Dict]]] = {}
+        for request_data in requests_data:
+            for destination in self.route(request_data):
+                key = self.destination_key(destination)
+                if key not in result:
+                    result[key] = (destination, [])
+                result[key][1].append(request_data)
+        return result
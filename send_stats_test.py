@@ -6,6 +6,9 @@ import json
 
 from database import Database
 from telegram_notifier import TelegramNotifier
+from stats_report import StatsReportBuilder
+from timeutils import to_epoch
+import native_chart
 
 
 SAMPLE_COUNTS = [120, 100, 80, 50, 30, 20, 10, 5, 3, 7, 15, 25, 40, 60, 110, 140, 170, 180, 190, 200, 185, 160, 140, 100]
@@ -38,10 +41,10 @@ def populate_sample_db(db_path: str, tz_offset_hours: int = 10):
         for i in range(count):
             req_id += 1
             scheduled_time = f"{(local_hour):02d}:00"
-            last_sent_at = (candidate_date + timedelta(minutes=i % 60)).strftime('%Y-%m-%d %H:%M:%S')
+            last_sent_at = to_epoch(candidate_date + timedelta(minutes=i % 60))
             cur.execute(
                 "INSERT OR IGNORE INTO requests (request_id, scheduled_time, first_seen_at, last_sent_at, batch_number) VALUES (?, ?, ?, ?, ?)",
-                (req_id, scheduled_time, datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), last_sent_at, 1)
+                (req_id, scheduled_time, last_sent_at, last_sent_at, 1)
             )
 
     conn.commit()
@@ -65,13 +68,20 @@ async def run_test(args):
     else:
         db = Database(db_path)
 
-    counts = db.get_hourly_sent_counts_last_24h(tz_offset_hours=args.tz_offset)
-    total = sum(counts.values())
+    # Отчёт строит тот же StatsReportBuilder, что и бот. Для реальной БД
+    # используется общий кэш отчётов, так что ручная переотправка шлёт ровно тот же отчёт.
+    builder = StatsReportBuilder(db, tz_offset_hours=args.tz_offset, tz_name=args.tz_name)
+    if args.use_sample_db or args.no_cache:
+        counts = db.get_hourly_sent_counts_last_24h(tz_offset_hours=args.tz_offset)
+        report = await builder.render(counts)
+    else:
+        report = await builder.build(refresh=args.refresh)
 
+    counts = report['counts']
     print(f"Hourly counts (local tz offset {args.tz_offset}):")
     for h in range(24):
         print(f"{h:02d}: {counts.get(h,0)}")
-    print(f"Total (last 24h): {total}")
+    print(f"Total (last 24h): {report['total']}")
 
     # Если указано --send, попытаемся отправить (нужны TELEGRAM env vars)
     if args.send:
@@ -79,41 +89,29 @@ async def run_test(args):
             print("TELEGRAM_BOT_TOKEN or TELEGRAM_CHAT_ID not set in environment. Aborting send.")
             return
         notifier = TelegramNotifier()
-        success = await notifier.send_daily_stats(counts, tz_name=args.tz_name)
+        success = await notifier.send_stats_report(report)
+        await notifier.close()
         if success:
             print("Stats sent to Telegram")
         else:
             print("Failed to send stats to Telegram")
     else:
-        # Сохраняем картинку локально через matplotlib, если установлен
-        try:
-            import matplotlib.pyplot as plt
+        out = args.output or 'daily_stats_test.png'
+        if out.endswith('.svg'):
             hours = list(range(24))
-            values = [counts.get(h, 0) for h in hours]
-
-            fig, ax = plt.subplots(figsize=(12, 5))
-            ax.bar(hours, values, color='orange', alpha=0.9)
-            ax.set_xlabel('Час (локальное)')
-            ax.set_ylabel('Количество отправленных заявок')
-            ax.set_xticks(hours)
-            ax.set_xticklabels([f"{h}ч" for h in hours])
-
-            ax2 = ax.twinx()
-            ax2.plot(hours, values, color='green', marker='o')
-            ax2.set_ylabel('Линия (для наглядности)')
-
-            plt.title(f'Тестовая статистика (по {args.tz_name})')
-            plt.tight_layout()
-
-            out = args.output or 'daily_stats_test.png'
-            plt.savefig(out)
-            plt.close(fig)
+            with open(out, 'w', encoding='utf-8') as f:
+                f.write(native_chart.render_svg([counts.get(h, 0) for h in hours], hours, args.tz_name))
             print(f"Saved test chart to {out}")
-        except ImportError:
-            out = args.output or 'daily_stats_test.json'
+        elif report['png'] is not None and not out.endswith('.json'):
+            with open(out, 'wb') as f:
+                f.write(report['png'])
+            print(f"Saved test chart to {out}")
+        else:
+            if not out.endswith('.json'):
+                out = 'daily_stats_test.json'
             with open(out, 'w', encoding='utf-8') as f:
-                json.dump({'counts': counts, 'total': total}, f, ensure_ascii=False, indent=2)
-            print(f"matplotlib not installed; saved counts JSON to {out}. Install matplotlib to generate PNG.")
+                json.dump({'counts': counts, 'total': report['total']}, f, ensure_ascii=False, indent=2)
+            print(f"Saved counts JSON to {out}")
 
 
 if __name__ == '__main__':
@@ -123,7 +121,9 @@ if __name__ == '__main__':
     parser.add_argument('--tz-offset', type=int, default=10, help='Timezone offset hours (e.g., 10 for VL)')
     parser.add_argument('--send', action='store_true', help='Actually send to Telegram (requires env vars)')
     parser.add_argument('--tz-name', default='Владивосток', help='Timezone name for captions')
-    parser.add_argument('--output', help='Output PNG filename when not sending')
+    parser.add_argument('--output', help='Output filename when not sending (.png, .svg or .json)')
+    parser.add_argument('--refresh', action='store_true', help='Rebuild the cached report for the current period')
+    parser.add_argument('--no-cache', action='store_true', help='Build the report without using the report cache')
 
     args = parser.parse_args()
 
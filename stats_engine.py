@@ -0,0 +1,135 @@
+import logging
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from timeutils import now_epoch
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин распределения размеров пачек
+BATCH_SIZE_BUCKETS = [(1, 1), (2, 5), (6, 10), (11, 20), (21, 50), (51, None)]
+
+
+class StatsEngine:
+    """
+    Аналитика по таблице requests за последние `hours` часов (по времени отправки).
+
+    Всё считается агрегатами SQLite по индексу last_sent_at: задержка
+    уведомления (first_seen_at → last_sent_at) p50/p95/max, разбивки
+    по городам и типам заявок, доля срочных и распределение размеров пачек.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    # Задержка в секундах между появлением заявки и её отправкой
+    LATENCY_SQL = "(last_sent_at - first_seen_at)"
+    WINDOW_SQL = "last_sent_at >= ?"
+
+    def _latency(self, cursor, since: int) -> Dict[str, Optional[int]]:
+        # Выражение задержки не покрыто индексом: один проход по окну и одна сортировка,
+        # число, перцентили и максимум берём из отсортированного столбца
+        cursor.execute(f'''
+            SELECT {self.LATENCY_SQL} AS latency FROM requests
+            WHERE {self.WINDOW_SQL} AND latency IS NOT NULL
+            ORDER BY latency
+        ''', (since,))
+        latencies = [row[0] for row in cursor.fetchall()]
+        count = len(latencies)
+
+        def percentile(p: float) -> Optional[int]:
+            return latencies[min(count - 1, int(count * p))] if count else None
+
+        return {'count': count, 'p50': percentile(0.5), 'p95': percentile(0.95),
+                'max': latencies[-1] if count else None}
+
+    def _breakdown(self, cursor, table: str, since: int, limit: int) -> List[Tuple[str, int]]:
+        # Группируем по целочисленному id, имя подтягиваем из словаря только для топа
+        fk_column = self.db.DICTIONARIES[table]
+        cursor.execute(f'''
+            SELECT COALESCE(d.name, '—'), t.cnt FROM (
+                SELECT {fk_column} AS dictionary_id, COUNT(*) AS cnt FROM requests
+                WHERE {self.WINDOW_SQL}
+                GROUP BY {fk_column}
+                ORDER BY cnt DESC
+                LIMIT ?
+            ) AS t
+            LEFT JOIN {table} AS d ON d.id = t.dictionary_id
+            ORDER BY t.cnt DESC
+        ''', (since, limit))
+        return cursor.fetchall()
+
+    def _batch_sizes(self, cursor, since: int) -> Dict:
+        cursor.execute(f'''
+            SELECT batch_number, COUNT(*) FROM requests
+            WHERE {self.WINDOW_SQL} AND batch_number IS NOT NULL
+            GROUP BY batch_number
+        ''', (since,))
+        sizes = [size for _, size in cursor.fetchall()]
+
+        buckets = {}
+        for low, high in BATCH_SIZE_BUCKETS:
+            label = str(low) if low == high else (f"{low}+" if high is None else f"{low}-{high}")
+            buckets[label] = sum(1 for s in sizes if s >= low and (high is None or s <= high))
+
+        return {
+            'batches': len(sizes),
+            'avg': round(sum(sizes) / len(sizes), 1) if sizes else None,
+            'max': max(sizes) if sizes else None,
+            'buckets': buckets,
+        }
+
+    def compute(self, hours: int = 24, top: int = 5) -> Dict:
+        """Собираем всю аналитику за последние `hours` часов"""
+        since = now_epoch() - hours * 3600
+        conn = sqlite3.connect(self.db.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f'SELECT COUNT(*), SUM(is_urgent) FROM requests WHERE {self.WINDOW_SQL}', (since,))
+            sent, urgent = cursor.fetchone()
+
+            return {
+                'hours': hours,
+                'sent': sent,
+                'urgent_share': round((urgent or 0) / sent, 3) if sent else None,
+                'latency': self._latency(cursor, since),
+                'by_city': self._breakdown(cursor, 'cities', since, top),
+                'by_type': self._breakdown(cursor, 'request_types', since, top),
+                'batch_sizes': self._batch_sizes(cursor, since),
+            }
+        finally:
+            conn.close()
+
+
+def _format_duration(seconds: Optional[int]) -> str:
+    if seconds is None:
+        return '—'
+    if seconds < 60:
+        return f"{seconds}с"
+    if seconds < 3600:
+        return f"{seconds // 60}м {seconds % 60:02d}с"
+    return f"{seconds // 3600}ч {seconds % 3600 // 60:02d}м"
+
+
+def format_stats_summary(stats: Dict) -> str:
+    """Текстовый блок аналитики для ежедневного отчёта"""
+    latency = stats['latency']
+    batches = stats['batch_sizes']
+    urgent = f"{stats['urgent_share'] * 100:.0f}%" if stats['urgent_share'] is not None else '—'
+
+    lines = [
+        f"📈 Аналитика за {stats['hours']} ч",
+        f"Отправлено заявок: {stats['sent']}, срочных: {urgent}",
+        f"Задержка уведомления: p50 {_format_duration(latency['p50'])}, "
+        f"p95 {_format_duration(latency['p95'])}, max {_format_duration(latency['max'])}",
+    ]
+    if stats['by_city']:
+        lines.append("Города: " + ", ".join(f"{name} {count}" for name, count in stats['by_city']))
+    if stats['by_type']:
+        lines.append("Типы: " + ", ".join(f"{name} {count}" for name, count in stats['by_type']))
+    if batches['batches']:
+        lines.append(
+            f"Пачек: {batches['batches']}, средний размер {batches['avg']}, max {batches['max']} "
+            "(" + ", ".join(f"{k}: {v}" for k, v in batches['buckets'].items() if v) + ")"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from config import Config
+from chart_renderer import ChartWorker
+from stats_engine import StatsEngine, format_stats_summary
+
+logger = logging.getLogger(__name__)
+
+# Лимит Telegram на длину подписи к фото
+MAX_CAPTION_LENGTH = 1024
+
+
+def format_text_summary(hours: List[int], values: List[int], tz_name: str) -> str:
+    """Текстовая сводка — фолбэк, если картинку нарисовать не удалось"""
+    lines = [f"Статистика отправок (по {tz_name})"]
+    for h, v in zip(hours, values):
+        lines.append(f"{h:02d}: {v}")
+    lines.append(f"\nОтправлено за последние 24 часа: {sum(values)}")
+    return "\n".join(lines)
+
+
+class StatsReportBuilder:
+    """
+    Собирает ежедневный отчёт: почасовые счётчики, график и подписи.
+
+    Отчёт строится один раз за период и кэшируется на диске
+    (`<period>.json` + `<period>.png` в STATS_CACHE_DIR), поэтому повторные
+    попытки отправки и ручная переотправка используют готовый результат,
+    а не пересчитывают статистику и не рисуют график заново.
+    """
+
+    def __init__(self, db=None, chart_worker: Optional[ChartWorker] = None,
+                 cache_dir: Optional[str] = None, tz_offset_hours: int = 10,
+                 tz_name: str = 'Владивосток', report_hour: int = 8):
+        self.db = db
+        self.chart_worker = chart_worker or ChartWorker()
+        self.cache_dir = cache_dir if cache_dir is not None else Config.STATS_CACHE_DIR
+        self.tz_offset_hours = tz_offset_hours
+        self.tz_name = tz_name
+        self.report_hour = report_hour
+
+    def period_key(self, now_utc: Optional[datetime] = None) -> str:
+        """Период отчёта — локальная дата отправки (отчёт в 08:00 за предыдущие сутки)"""
+        now_local = (now_utc or datetime.utcnow()) + timedelta(hours=self.tz_offset_hours)
+        return (now_local - timedelta(hours=self.report_hour)).strftime('%Y-%m-%d')
+
+    def _paths(self, period: str):
+        base = os.path.join(self.cache_dir, period)
+        return f"{base}.json", f"{base}.png"
+
+    async def render(self, counts: Dict[int, int], period: Optional[str] = None,
+                     analytics: Optional[Dict] = None) -> Dict:
+        """Строим отчёт из готовых счётчиков {час: количество} и аналитики (без кэша)"""
+        hours = list(range(24))
+        values = [counts.get(h, 0) for h in hours]
+        total = sum(values)
+        analytics_text = format_stats_summary(analytics) if analytics else None
+
+        png = None
+        try:
+            png = await self.chart_worker.render(values, hours, self.tz_name)
+        except Exception as e:
+            logger.warning(f"Не удалось сгенерировать изображение статистики: {e}")
+
+        caption = f"📊 Статистика отправок (по {self.tz_name})\nОтправлено за последние 24 часа: {total}"
+        text = format_text_summary(hours, values, self.tz_name)
+        if analytics_text:
+            text = f"{text}\n\n{analytics_text}"
+            # Аналитика идёт в подпись, если помещается, иначе — отдельным сообщением
+            if len(caption) + len(analytics_text) + 2 <= MAX_CAPTION_LENGTH:
+                caption = f"{caption}\n\n{analytics_text}"
+                analytics_text = None
+
+        return {
+            'period': period,
+            'tz_name': self.tz_name,
+            'counts': {h: v for h, v in zip(hours, values)},
+            'total': total,
+            'analytics': analytics,
+            'analytics_text': analytics_text,
+            'caption': caption,
+            'text': text,
+            'png': png,
+        }
+
+    def load(self, period: str) -> Optional[Dict]:
+        """Загружаем отчёт периода из кэша, если он есть"""
+        json_path, png_path = self._paths(period)
+        if not os.path.exists(json_path):
+            return None
+        try:
+            with open(json_path, encoding='utf-8') as f:
+                report = json.load(f)
+            report['counts'] = {int(h): v for h, v in report['counts'].items()}
+            report['png'] = None
+            if report.pop('has_png', False):
+                with open(png_path, 'rb') as f:
+                    report['png'] = f.read()
+            return report
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать кэш отчёта {period}: {e}")
+            return None
+
+    def save(self, report: Dict):
+        """Сохраняем отчёт в кэш (сначала во временные файлы, затем атомарно переименовываем)"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        json_path, png_path = self._paths(report['period'])
+
+        if report['png'] is not None:
+            with open(png_path + '.tmp', 'wb') as f:
+                f.write(report['png'])
+            os.replace(png_path + '.tmp', png_path)
+
+        meta = {k: v for k, v in report.items() if k != 'png'}
+        meta['has_png'] = report['png'] is not None
+        with open(json_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(json_path + '.tmp', json_path)
+
+        self._prune()
+
+    def _prune(self):
+        """Оставляем в кэше только последние STATS_CACHE_KEEP периодов"""
+        periods = sorted(name[:-5] for name in os.listdir(self.cache_dir) if name.endswith('.json'))
+        for period in periods[:-Config.STATS_CACHE_KEEP]:
+            for path in self._paths(period):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    async def build(self, period: Optional[str] = None, refresh: bool = False) -> Dict:
+        """Отчёт за период: из кэша или, если его нет (или `refresh`), строим и кэшируем"""
+        period = period or self.period_key()
+
+        if not refresh:
+            cached = self.load(period)
+            if cached is not None:
+                logger.info(f"Отчёт за {period} взят из кэша")
+                return cached
+
+        counts = self.db.get_hourly_sent_counts_last_24h(tz_offset_hours=self.tz_offset_hours)
+        try:
+            analytics = StatsEngine(self.db).compute(hours=24)
+        except Exception as e:
+            logger.warning(f"Не удалось посчитать аналитику: {e}")
+            analytics = None
+        report = await self.render(counts, period, analytics)
+
+        # Без картинки не кэшируем: следующая попытка снова попробует нарисовать график
+        if report['png'] is not None:
+            try:
+                self.save(report)
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить отчёт {period} в кэш: {e}")
+
+        return report
@@ -2,18 +2,33 @@ import asyncio
 import logging
 import socket
 from datetime import datetime
-from typing import List, Dict
-from telegram import Bot
+from typing import List, Dict, Iterable, Optional, Set
 from telegram.error import TelegramError
 from config import Config
+from telegram_sender import TelegramSender, MAX_MESSAGE_LENGTH, create_sender
+from routing import RoutingTable
+from chart_renderer import ChartWorker
+from stats_report import StatsReportBuilder
+from tracing import traced, current_span
 import io
 
 logger = logging.getLogger(__name__)
 
 class TelegramNotifier:
-    def __init__(self):
-        self.bot = Bot(token=Config.TELEGRAM_BOT_TOKEN)
-        self.chat_id = Config.TELEGRAM_CHAT_ID
+    def __init__(self, chat_id=None, routing: Optional[RoutingTable] = None,
+                 sender: Optional[TelegramSender] = None, chart_worker: Optional[ChartWorker] = None):
+        # Очередь отправки и рендер графиков могут быть общими для нескольких тенантов
+        # (tenants.py): тогда их закрывает владелец, а не этот notifier
+        self.owns_shared = sender is None
+        self.chat_id = chat_id or Config.TELEGRAM_CHAT_ID
+        # Все отправки идут через очередь с учётом flood-лимитов
+        self.sender = sender or create_sender()
+        self.bot = self.sender.bot
+        # Куда отправлять пачки (по городу, типу, срочности)
+        self.routing = routing or RoutingTable.from_config()
+        self.fanout_semaphore = asyncio.Semaphore(Config.TELEGRAM_FANOUT_CONCURRENCY)
+        # Графики рисуются в отдельном процессе, чтобы не блокировать event loop
+        self.chart_worker = chart_worker or ChartWorker()
     
     async def send_startup_notification(self):
         """Отправляем уведомление о запуске бота"""
@@ -33,7 +48,7 @@ class TelegramNotifier:
                 f"*Управление:* PM2 (автозапуск)"
             )
             
-            await self.bot.send_message(
+            await self.sender.send_message(
                 chat_id=self.chat_id,
                 text=message,
                 parse_mode='Markdown',
@@ -46,98 +61,181 @@ class TelegramNotifier:
             logger.error(f"Ошибка отправки уведомления о запуске: {e}")
             return False
     
-    async def send_batch(self, requests_data: List[Dict], batch_number: int) -> bool:
-        """Отправляем пачку заявок"""
-        if not requests_data:
-            logger.info("Нет заявок для отправки")
-            return False
+    def _format_request_line(self, request_data: Dict) -> str:
+        """Строка заявки в сообщении пачки"""
+        request_id = request_data['id']
+        scheduled_time = request_data.get('scheduled_time', '')
         
+        if scheduled_time:
+            return f"`{request_id}` ({scheduled_time})"
+        return f"`{request_id}`"
+
+    def build_batch_messages(self, requests_data: List[Dict], batch_number: int) -> List[str]:
+        """
+        Формируем сообщения пачки, разбивая по строкам так, чтобы каждое
+        помещалось в лимит Telegram. Каждое сообщение начинается с номера
+        пачки; при разбиении добавляется номер части: "#12 (2/3)".
+        """
+        lines = [self._format_request_line(r) for r in requests_data]
+
+        # Резервируем место под самый длинный заголовок части
+        header_reserve = len(f"#{batch_number} ({len(lines)}/{len(lines)})\n\n")
+        limit = MAX_MESSAGE_LENGTH - header_reserve
+
+        bodies = []
+        current = []
+        current_len = 0
+        for line in lines:
+            line_len = len(line) + 1
+            if current and current_len + line_len > limit:
+                bodies.append(current)
+                current = []
+                current_len = 0
+            current.append(line)
+            current_len += line_len
+        if current:
+            bodies.append(current)
+
+        if len(bodies) == 1:
+            return ["\n".join([f"#{batch_number}", ""] + bodies[0])]
+
+        return [
+            "\n".join([f"#{batch_number} ({i}/{len(bodies)})", ""] + body)
+            for i, body in enumerate(bodies, start=1)
+        ]
+
+    @traced('telegram.send_message')
+    async def _send_batch_message(self, destination: Dict, text: str, coalesce: bool) -> bool:
         try:
-            # Формируем сообщение
-            message_lines = [f"#{batch_number}", ""]
-            
-            for request_data in requests_data:
-                request_id = request_data['id']
-                scheduled_time = request_data.get('scheduled_time', '')
-                
-                if scheduled_time:
-                    message_lines.append(f"`{request_id}` ({scheduled_time})")
-                else:
-                    message_lines.append(f"`{request_id}`")
-            
-            message = "\n".join(message_lines)
-            
-            # Отправляем
-            await self.bot.send_message(
-                chat_id=self.chat_id,
-                text=message,
+            options = {}
+            if destination.get('thread_id'):
+                options['message_thread_id'] = destination['thread_id']
+            await self.sender.send_message(
+                chat_id=destination['chat_id'],
+                text=text,
+                coalesce=coalesce,
                 parse_mode='Markdown',
-                disable_notification=True  # Без уведомлений
+                disable_notification=True,  # Без уведомлений
+                **options
             )
-            
-            logger.info(f"Пачка #{batch_number} отправлена: {len(requests_data)} заявок")
             return True
-            
         except TelegramError as e:
-            logger.error(f"Ошибка Telegram: {e}")
+            logger.error(f"Ошибка Telegram ({RoutingTable.destination_key(destination)}): {e}")
             return False
         except Exception as e:
             logger.error(f"Неожиданная ошибка: {e}")
             return False
 
+    async def _deliver_to_destination(self, destination: Dict, messages: List[str],
+                                      coalesce: bool) -> List[bool]:
+        """Отправляем части пачки в одно назначение"""
+        async with self.fanout_semaphore:
+            sent = await asyncio.gather(*(
+                self._send_batch_message(destination, text, coalesce) for text in messages
+            ))
+
+        dest_key = RoutingTable.destination_key(destination)
+        if all(sent):
+            logger.debug(f"Доставлено в {dest_key}: {len(sent)} сообщений")
+        else:
+            logger.error(f"Доставка в {dest_key}: не отправлено {len(sent) - sum(sent)} из {len(sent)} сообщений")
+        return list(sent)
+
+    @traced('telegram.deliver_batch')
+    async def deliver_batch(self, requests_data: List[Dict], batch_number: int,
+                            skip: Iterable[str] = (), coalesce: bool = False) -> Dict[str, bool]:
+        """
+        Отправляем пачку во все назначения и возвращаем результат по каждой части {ключ: успех}.
+
+        Ключ части — "назначение:номер части". Части, чьи ключи переданы в `skip`,
+        уже доставлены ранее и повторно не отправляются. Назначения обслуживаются
+        параллельно (не больше TELEGRAM_FANOUT_CONCURRENCY одновременно), поэтому
+        медленный чат не задерживает остальные.
+        """
+        current_span().set(batch=batch_number, requests=len(requests_data))
+        skip = set(skip)
+        results: Dict[str, bool] = {}
+        deliveries = []
+        delivery_keys = []
+
+        for dest_key, (destination, dest_requests) in self.routing.split(requests_data).items():
+            messages = self.build_batch_messages(dest_requests, batch_number)
+            keys = [f"{dest_key}:{i}" for i in range(len(messages))]
+            results.update({key: True for key in keys})
+
+            pending = [(key, text) for key, text in zip(keys, messages) if key not in skip]
+            if not pending:
+                continue
+
+            delivery_keys.append([key for key, _ in pending])
+            deliveries.append(self._deliver_to_destination(
+                destination, [text for _, text in pending], coalesce
+            ))
+
+        for keys, sent in zip(delivery_keys, await asyncio.gather(*deliveries)):
+            results.update(zip(keys, sent))
+        return results
+
+    async def send_batch(self, requests_data: List[Dict], batch_number: int, coalesce: bool = False) -> bool:
+        """Отправляем пачку заявок
+
+        `coalesce=True` разрешает склеить сообщение с соседними в очереди чата.
+        """
+        if not requests_data:
+            logger.info("Нет заявок для отправки")
+            return False
+        
+        results = await self.deliver_batch(requests_data, batch_number, coalesce=coalesce)
+        delivered = sum(results.values())
+        
+        if delivered == len(results):
+            logger.info(f"Пачка #{batch_number} отправлена: {len(requests_data)} заявок")
+            return True
+        
+        logger.error(f"Пачка #{batch_number} отправлена частично: {delivered} из {len(results)} сообщений")
+        return False
+
     async def send_daily_stats(self, counts: Dict[int, int], tz_name: str = 'Владивосток') -> bool:
         """Отправляет почасовой график и суммарную статистику за последние 24 часа.
 
         `counts` — словарь {hour_local: count} по локальному часу (0..23).
         """
         try:
-            # Подготовка данных
-            hours = list(range(24))
-            values = [counts.get(h, 0) for h in hours]
-            total = sum(values)
-            # Создаём график: столбцы + линия
-            try:
-                # Используем headless backend (Agg) для серверного рендера
-                import matplotlib
-                matplotlib.use('Agg')
-                import matplotlib.pyplot as plt
-            except Exception:
-                # Если matplotlib не установлен или не работает — отправим текстовую сводку
-                lines = [f"Статистика отправок (по {tz_name})"]
-                for h in hours:
-                    lines.append(f"{h:02d}: {values[h]}")
-                lines.append(f"\nОтправлено за последние 24 часа: {total}")
-                await self.bot.send_message(chat_id=self.chat_id, text="\n".join(lines))
-                logger.warning("matplotlib not available — отправлена текстовая статистика")
-                return True
-
-            fig, ax = plt.subplots(figsize=(12, 5))
-            ax.bar(hours, values, color='orange', alpha=0.9)
-            ax.set_xlabel('Час (локальное)')
-            ax.set_ylabel('Количество отправленных заявок')
-            ax.set_xticks(hours)
-            ax.set_xticklabels([f"{h}ч" for h in hours])
-
-            ax2 = ax.twinx()
-            ax2.plot(hours, values, color='green', marker='o')
-            ax2.set_ylabel('Линия (для наглядности)')
-
-            plt.title(f'Статистика отправок по часам — {tz_name} (последние 24 часа)')
-            plt.tight_layout()
+            builder = StatsReportBuilder(chart_worker=self.chart_worker, tz_name=tz_name)
+            report = await builder.render(counts)
+        except Exception as e:
+            logger.error(f"Ошибка при формировании статистики: {e}")
+            return False
+        return await self.send_stats_report(report)
 
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png')
-            plt.close(fig)
-            buf.seek(0)
+    async def send_stats_report(self, report: Dict, delivered: Optional[Set[str]] = None) -> bool:
+        """Отправляет готовый отчёт (см. StatsReportBuilder): график с подписью или текстовую сводку
 
-            caption = f"📊 Статистика отправок (по {tz_name})\nОтправлено за последние 24 часа: {total}"
+        Отчёт может состоять из двух сообщений (график и аналитика, не поместившаяся
+        в подпись). В `delivered` записываются доставленные части ('text', 'photo',
+        'analytics'); при повторе с тем же множеством они не отправляются снова.
+        """
+        delivered = delivered if delivered is not None else set()
+        try:
+            if report['png'] is None:
+                # Картинку нарисовать не удалось — отправим текстовую сводку
+                if 'text' not in delivered:
+                    await self.sender.send_message(chat_id=self.chat_id, text=report['text'])
+                    delivered.add('text')
+                logger.info("Ежедневная статистика отправлена в текстовом виде (фолбэк)")
+                return True
 
-            await self.bot.send_photo(
-                chat_id=self.chat_id,
-                photo=buf,
-                caption=caption,
-                parse_mode='Markdown'
-            )
+            # Подпись без Markdown: в ней названия городов и типов заявок из CRM
+            if 'photo' not in delivered:
+                await self.sender.send_photo(
+                    chat_id=self.chat_id,
+                    photo=io.BytesIO(report['png']),
+                    caption=report['caption']
+                )
+                delivered.add('photo')
+            if report.get('analytics_text') and 'analytics' not in delivered:
+                await self.sender.send_message(chat_id=self.chat_id, text=report['analytics_text'])
+                delivered.add('analytics')
 
             logger.info("Ежедневная статистика отправлена")
             return True
@@ -145,5 +243,12 @@ class TelegramNotifier:
             logger.error(f"Ошибка Telegram при отправке статистики: {e}")
             return False
         except Exception as e:
-            logger.error(f"Ошибка при формировании/отправке статистики: {e}")
+            logger.error(f"Ошибка при отправке статистики: {e}")
             return False
+
+    async def close(self):
+        """Останавливаем очередь отправки и процесс рендера графиков"""
+        if not self.owns_shared:
+            return
+        await self.sender.close()
+        await asyncio.get_running_loop().run_in_executor(None, self.chart_worker.stop)
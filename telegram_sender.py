@@ -0,0 +1,330 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter, TimedOut, NetworkError
+from config import Config
+from metrics import TELEGRAM_ERRORS, TELEGRAM_SEND_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Лимит Telegram на длину текста одного сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+
+def create_bot(token: Optional[str] = None) -> Bot:
+    """
+    Бот Telegram. TELEGRAM_API_BASE_URL направляет запросы на другой Bot API
+    (свой telegram-bot-api сервер или локальную заглушку benchmarks/fake_telegram.py)
+    """
+    options = {}
+    if Config.TELEGRAM_API_BASE_URL:
+        base_url = Config.TELEGRAM_API_BASE_URL.rstrip('/')
+        options['base_url'] = f"{base_url}/bot"
+        options['base_file_url'] = f"{base_url}/file/bot"
+    return Bot(token=token or Config.TELEGRAM_BOT_TOKEN, **options)
+
+
+class TokenBucket:
+    """Простой token bucket: `rate` токенов в секунду, не больше `capacity` в запасе"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        if now <= self.updated_at:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """Забираем токен и возвращаем, сколько секунд нужно подождать перед отправкой"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.paused_until - now)
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Блокируем отправку на `seconds` (ответ Telegram RetryAfter)"""
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        # Ожидание ничего не накапливает: после паузы начинаем с пустым запасом
+        self.tokens = min(self.tokens, 0)
+        self.updated_at = self.paused_until
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    """`retry_after` бывает int или timedelta в зависимости от версии python-telegram-bot"""
+    value = error.retry_after
+    if hasattr(value, 'total_seconds'):
+        return value.total_seconds()
+    return float(value)
+
+
+class TelegramSender:
+    """
+    Отправка сообщений в Telegram с учётом flood-лимитов.
+
+    Сообщения в один чат идут строго по очереди через token bucket чата,
+    все чаты вместе ограничены глобальным bucket. На RetryAfter чат ставится
+    на паузу на указанное время, и сообщение отправляется повторно.
+    Подряд стоящие в очереди текстовые сообщения с `coalesce=True`
+    склеиваются в одно, если помещаются в лимит длины.
+    """
+
+    LATENCY_WINDOW = 500
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.global_bucket = TokenBucket(Config.TELEGRAM_GLOBAL_RATE, Config.TELEGRAM_GLOBAL_RATE)
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        self.queues: Dict[str, Deque[Dict]] = {}
+        self.queue_events: Dict[str, asyncio.Event] = {}
+        self.workers: Dict[str, asyncio.Task] = {}
+
+        # Метрики
+        self.latencies: Deque[float] = deque(maxlen=self.LATENCY_WINDOW)
+        self.sent_count = 0
+        self.failed_count = 0
+        self.retry_after_count = 0
+        self.coalesced_count = 0
+
+    def _chat_bucket(self, chat_key: str) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_key)
+        if bucket is None:
+            # Отрицательный chat_id — группа/канал, у них лимит строже
+            rate = Config.TELEGRAM_GROUP_RATE if chat_key.startswith('-') else Config.TELEGRAM_CHAT_RATE
+            bucket = TokenBucket(rate, 1)
+            self.chat_buckets[chat_key] = bucket
+        return bucket
+
+    async def send_message(self, chat_id, text: str, coalesce: bool = False, **kwargs) -> Any:
+        """Ставим текстовое сообщение в очередь чата и ждём результата отправки"""
+        return await self._enqueue(chat_id, 'message', dict(text=text, **kwargs), coalesce)
+
+    async def send_photo(self, chat_id, photo, **kwargs) -> Any:
+        """Ставим фото в очередь чата и ждём результата отправки"""
+        return await self._enqueue(chat_id, 'photo', dict(photo=photo, **kwargs), False)
+
+    async def _enqueue(self, chat_id, method: str, kwargs: Dict, coalesce: bool) -> Any:
+        chat_key = str(chat_id)
+        future = asyncio.get_running_loop().create_future()
+        item = {
+            'chat_id': chat_id,
+            'method': method,
+            'kwargs': kwargs,
+            'coalesce': coalesce,
+            'futures': [future],
+            'enqueued_at': time.monotonic(),
+        }
+
+        self.queues.setdefault(chat_key, deque()).append(item)
+        self.queue_events.setdefault(chat_key, asyncio.Event()).set()
+
+        worker = self.workers.get(chat_key)
+        if worker is None or worker.done():
+            self.workers[chat_key] = asyncio.create_task(self._chat_worker(chat_key))
+
+        return await future
+
+    def _coalesce(self, item: Dict, queue: Deque[Dict]):
+        """Присоединяем к `item` следующие совместимые сообщения из очереди"""
+        if item['method'] != 'message' or not item['coalesce']:
+            return
+
+        options = {k: v for k, v in item['kwargs'].items() if k != 'text'}
+        text = item['kwargs']['text']
+
+        while queue:
+            nxt = queue[0]
+            if nxt['method'] != 'message' or not nxt['coalesce']:
+                break
+            if {k: v for k, v in nxt['kwargs'].items() if k != 'text'} != options:
+                break
+            joined = f"{text}\n\n{nxt['kwargs']['text']}"
+            if len(joined) > MAX_MESSAGE_LENGTH:
+                break
+
+            queue.popleft()
+            text = joined
+            item['futures'].extend(nxt['futures'])
+            item['enqueued_at'] = min(item['enqueued_at'], nxt['enqueued_at'])
+            self.coalesced_count += 1
+
+        item['kwargs']['text'] = text
+
+    async def _chat_worker(self, chat_key: str):
+        """Последовательно отправляем очередь одного чата"""
+        queue = self.queues[chat_key]
+        event = self.queue_events[chat_key]
+        bucket = self._chat_bucket(chat_key)
+
+        while True:
+            if not queue:
+                event.clear()
+                await event.wait()
+                continue
+
+            item = queue.popleft()
+            self._coalesce(item, queue)
+
+            try:
+                result = await self._deliver(item, bucket)
+            except Exception as e:
+                self.failed_count += 1
+                TELEGRAM_ERRORS.labels('failed').inc()
+                for future in item['futures']:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.sent_count += 1
+            self.latencies.append(time.monotonic() - item['enqueued_at'])
+            TELEGRAM_SEND_LATENCY.observe(self.latencies[-1])
+            for future in item['futures']:
+                if not future.done():
+                    future.set_result(result)
+
+    async def _deliver(self, item: Dict, bucket: TokenBucket) -> Any:
+        """Отправляем одно сообщение, соблюдая лимиты и повторяя после RetryAfter"""
+        attempt = 0
+        while True:
+            attempt += 1
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+
+            try:
+                if item['method'] == 'photo':
+                    photo = item['kwargs']['photo']
+                    if hasattr(photo, 'seek'):
+                        photo.seek(0)
+                    return await self.bot.send_photo(chat_id=item['chat_id'], **item['kwargs'])
+                return await self.bot.send_message(chat_id=item['chat_id'], **item['kwargs'])
+
+            except RetryAfter as e:
+                self.retry_after_count += 1
+                TELEGRAM_ERRORS.labels('retry_after').inc()
+                delay = _retry_after_seconds(e)
+                logger.warning(f"Flood-лимит Telegram для чата {item['chat_id']}: пауза {delay:.0f}s")
+                bucket.pause(delay)
+                if attempt >= Config.TELEGRAM_MAX_RETRIES:
+                    raise
+
+            except BadRequest:
+                # Ошибка в самом запросе (разметка, длина) — повтор не поможет
+                TELEGRAM_ERRORS.labels('bad_request').inc()
+                raise
+
+            except (TimedOut, NetworkError) as e:
+                # Сетевые сбои повторяем с той же паузой, что и flood-лимит по умолчанию
+                logger.warning(f"Сетевая ошибка Telegram (попытка {attempt}): {e}")
+                TELEGRAM_ERRORS.labels('network').inc()
+                if attempt >= Config.TELEGRAM_MAX_RETRIES:
+                    raise
+                bucket.pause(min(2 ** attempt, 30))
+
+    def queue_depth(self, chat_id=None) -> int:
+        """Количество сообщений в очереди (одного чата или всех)"""
+        if chat_id is not None:
+            return len(self.queues.get(str(chat_id), ()))
+        return sum(len(q) for q in self.queues.values())
+
+    def get_metrics(self) -> Dict:
+        """Текущие метрики отправки: очереди, счётчики и задержка постановка → отправка"""
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return {
+            'queue_depth': {chat: len(q) for chat, q in self.queues.items()},
+            'sent': self.sent_count,
+            'failed': self.failed_count,
+            'retry_after': self.retry_after_count,
+            'coalesced': self.coalesced_count,
+            'latency_p50': percentile(0.5),
+            'latency_p95': percentile(0.95),
+            'latency_max': latencies[-1] if latencies else None,
+        }
+
+    async def close(self):
+        """Останавливаем обработчики очередей"""
+        for task in self.workers.values():
+            task.cancel()
+        for task in self.workers.values():
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.workers.clear()
+
+        # Неотправленные сообщения отменяем, чтобы никто не ждал их вечно
+        for queue in self.queues.values():
+            while queue:
+                for future in queue.popleft()['futures']:
+                    future.cancel()
+
+
+class SinkSender:
+    """
+    Замена TelegramSender для пробного режима (main.py --dry-run): сообщения
+    пишутся строками JSON в файл или stdout ("-") вместо отправки в Telegram
+    """
+
+    def __init__(self, path: str = '-'):
+        self.bot = None
+        self.path = path
+        self.stream = sys.stdout if path == '-' else open(path, 'a', encoding='utf-8', buffering=1)
+        self.sent_count = 0
+
+    def _write(self, chat_id, method: str, **fields):
+        record = {'at': datetime.now().isoformat(timespec='milliseconds'), 'method': method, 'chat_id': str(chat_id)}
+        record.update({key: value for key, value in fields.items() if value is not None})
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.stream.flush()
+        self.sent_count += 1
+
+    async def send_message(self, chat_id, text: str, coalesce: bool = False, **kwargs) -> Any:
+        self._write(chat_id, 'sendMessage', message_thread_id=kwargs.get('message_thread_id'),
+                    parse_mode=kwargs.get('parse_mode'), text=text)
+
+    async def send_photo(self, chat_id, photo, **kwargs) -> Any:
+        size = len(photo.getvalue()) if hasattr(photo, 'getvalue') else None
+        self._write(chat_id, 'sendPhoto', photo_bytes=size, caption=kwargs.get('caption'))
+
+    def queue_depth(self, chat_id=None) -> int:
+        return 0
+
+    def get_metrics(self) -> Dict:
+        return {'queue_depth': {}, 'sent': self.sent_count, 'failed': 0, 'retry_after': 0, 'coalesced': 0,
+                'latency_p50': None, 'latency_p95': None, 'latency_max': None}
+
+    async def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+def create_sender():
+    """Очередь отправки в Telegram или, в пробном режиме (DRY_RUN), запись в DRY_RUN_SINK"""
+    if Config.DRY_RUN:
+        return SinkSender(Config.DRY_RUN_SINK)
+    return TelegramSender(create_bot())
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+from config import Config
+from chart_renderer import ChartWorker
+from telegram_sender import create_sender
+
+logger = logging.getLogger(__name__)
+
+
+class Tenant:
+    """
+    Один аккаунт CRM в многотенантном режиме.
+
+    Описывается в TENANTS_FILE (JSON-список), например:
+        {"name": "msk", "crm_base_url": "https://kp-lead-centre.ru",
+         "crm_login": "...", "crm_password": "...", "chat_id": "-100123",
+         "routes": [{"chat_id": "-100456", "urgent": true}]}
+
+    Необязательные поля: `crm_base_url` (по умолчанию CRM_BASE_URL), `routes`
+    (см. routing.py), `max_pages` и `db_path` (по умолчанию tenants/<name>.db).
+    """
+
+    def __init__(self, name: str, crm_login: str, crm_password: str, chat_id,
+                 crm_base_url: Optional[str] = None, routes: Optional[List[Dict]] = None,
+                 max_pages: Optional[int] = None, db_path: Optional[str] = None):
+        self.name = name
+        self.crm_login = crm_login
+        self.crm_password = crm_password
+        self.chat_id = chat_id
+        self.crm_base_url = crm_base_url or Config.CRM_BASE_URL
+        self.routes = routes or []
+        self.max_pages = max_pages
+        self.db_path = db_path or os.path.join(Config.TENANTS_DIR, f"{name}.db")
+
+    def data_dir(self, base_dir: str) -> str:
+        """Подкаталог тенанта для его файлов (кэш отчётов, архив)"""
+        return os.path.join(base_dir, self.name) if base_dir else base_dir
+
+
+def load_tenants(path: Optional[str] = None) -> List[Tenant]:
+    """Читаем список тенантов из TENANTS_FILE"""
+    path = path or Config.TENANTS_FILE
+    with open(path, encoding='utf-8') as f:
+        tenants = [Tenant(**item) for item in json.load(f)]
+
+    names = [t.name for t in tenants]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Имена тенантов должны быть уникальны: {names}")
+
+    for tenant in tenants:
+        os.makedirs(os.path.dirname(tenant.db_path) or '.', exist_ok=True)
+    logger.info(f"Загружено тенантов: {len(tenants)} ({', '.join(names)})")
+    return tenants
+
+
+class SharedResources:
+    """
+    Ресурсы, общие для всех тенантов процесса: пул HTTP-соединений,
+    пул потоков для загрузки и разбора страниц CRM, очередь отправки
+    в Telegram (один бот — одни flood-лимиты) и рендер графиков.
+    """
+
+    def __init__(self, tenants_count: int):
+        pool_size = max(1, tenants_count)
+        self.http_adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.parse_executor = ThreadPoolExecutor(max_workers=Config.PARSE_WORKERS, thread_name_prefix='crm-parse')
+        self.sender = create_sender()
+        self.chart_worker = ChartWorker()
+
+    async def close(self):
+        await self.sender.close()
+        await asyncio.get_running_loop().run_in_executor(None, self.chart_worker.stop)
+        self.parse_executor.shutdown(wait=False)
+        self.http_adapter.close()
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import time
+
+
+def now_epoch() -> int:
+    """Текущее время UTC в секундах epoch"""
+    return int(time.time())
+
+
+def to_epoch(dt: datetime) -> int:
+    """datetime -> секунды epoch (наивный datetime считается UTC)"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def from_epoch(ts: int) -> datetime:
+    """Секунды epoch -> наивный datetime в UTC"""
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(tzinfo=None)
+
+
+def parse_local(text: str, fmt: str, utc_offset_minutes: int) -> Optional[int]:
+    """Разбираем локальное время `text` по формату `fmt` в зоне UTC+offset -> epoch (None, если не разобрали)"""
+    try:
+        local = datetime.strptime(text, fmt)
+    except (TypeError, ValueError):
+        return None
+    return to_epoch(local - timedelta(minutes=utc_offset_minutes))
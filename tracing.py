@@ -0,0 +1,296 @@
+"""
+Трассировка горячего пути: загрузка страниц CRM → разбор → запись в базу → отправка.
+
+Цикл (опрос CRM, отправка outbox) открывает корневой спан, внутри него
+CRMParser, Database и TelegramNotifier открывают дочерние спаны. Родитель
+хранится в contextvars, поэтому связи сохраняются и в asyncio-задачах,
+и в пуле потоков (при запуске через `run_in_context`). Законченный цикл
+пишется одной строкой JSON в TRACE_FILE с ротацией по размеру.
+
+Если трассировка выключена (TRACE_ENABLED) или спан открыт вне цикла,
+`span()` возвращает пустой контекст-менеджер — это одно чтение ContextVar.
+Корневой спан при этом всё равно выдаёт циклу идентификатор (`current_trace_id`),
+по которому логи связываются с циклом.
+
+Сводка по самым медленным циклам:
+
+    python tracing.py [--file logs/traces.jsonl] [--top 10] [--name poll]
+"""
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import statistics
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('trace_span', default=None)
+# Идентификатор текущего цикла — есть и при выключенной трассировке (для корреляции логов)
+_cycle_id: contextvars.ContextVar = contextvars.ContextVar('trace_cycle_id', default=None)
+
+
+class _NoopSpan:
+    """Заглушка, когда трассировка выключена: ничего не замеряет и не пишет"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _CycleScope(_NoopSpan):
+    """Корневой спан при выключенной трассировке: только идентификатор цикла для логов"""
+
+    def __enter__(self):
+        self._token = _cycle_id.set(uuid.uuid4().hex[:12])
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _cycle_id.reset(self._token)
+        return False
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional['Span'] = None, attrs: Optional[Dict] = None):
+        self.name = name
+        self.parent = parent
+        self.root = parent.root if parent is not None else self
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:12]
+        self.attrs = attrs or {}
+        self.children: List['Span'] = []
+        self.started = 0.0
+        self.duration = 0.0
+        self._token = None
+
+    def set(self, **attrs):
+        """Дописываем атрибуты спана (число строк, размер ответа и т.п.)"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        if self.parent is not None:
+            # list.append атомарен — дочерние спаны могут приходить из пула потоков
+            self.parent.children.append(self)
+        else:
+            self.wall_started = time.time()
+            self._cycle_token = _cycle_id.set(self.trace_id)
+        self.started = time.monotonic()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.monotonic() - self.started
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        if self.parent is None:
+            _cycle_id.reset(self._cycle_token)
+            TRACER.write(self)
+        return False
+
+    def to_dict(self, root_started: Optional[float] = None) -> Dict:
+        root_started = self.started if root_started is None else root_started
+        data = {
+            'name': self.name,
+            'offset_ms': round((self.started - root_started) * 1000, 2),
+            'duration_ms': round(self.duration * 1000, 2),
+        }
+        if self.attrs:
+            data['attrs'] = self.attrs
+        if self.children:
+            data['children'] = [child.to_dict(root_started) for child in self.children]
+        return data
+
+
+class Tracer:
+    """
+    Запись законченных циклов в JSONL-файл с ротацией (RotatingFileHandler).
+    Как и логи (logging_setup.py), файл пишет и ротирует фоновый QueueListener,
+    в event loop остаётся только постановка строки в очередь
+    """
+
+    def __init__(self, enabled: bool = False, path: Optional[str] = None,
+                 max_bytes: Optional[int] = None, backup_count: Optional[int] = None):
+        self.enabled = enabled
+        self.path = path or Config.TRACE_FILE
+        self.max_bytes = max_bytes or Config.TRACE_MAX_BYTES
+        self.backup_count = backup_count if backup_count is not None else Config.TRACE_BACKUP_COUNT
+        self._writer = None
+
+    def _get_writer(self) -> logging.Logger:
+        if self._writer is None:
+            # logging_setup сам импортирует tracing (current_trace_id), поэтому импорт здесь
+            from logging_setup import start_queue_listener
+
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+
+            writer = logging.getLogger(f"{__name__}.file")
+            writer.handlers = [start_queue_listener(handler)]
+            writer.setLevel(logging.INFO)
+            writer.propagate = False
+            self._writer = writer
+        return self._writer
+
+    def write(self, root: Span):
+        record = {
+            'trace_id': root.trace_id,
+            'start': round(root.wall_started, 3),
+        }
+        record.update(root.to_dict())
+        try:
+            self._get_writer().info(json.dumps(record, ensure_ascii=False, default=str))
+        except Exception as e:
+            logger.warning(f"Не удалось записать трассировку {root.trace_id}: {e}")
+
+
+TRACER = Tracer(enabled=Config.TRACE_ENABLED)
+
+
+def span(name: str, root: bool = False, **attrs):
+    """
+    Спан внутри текущего цикла. `root=True` начинает новый цикл (если цикла
+    ещё нет); вне цикла и при выключенной трассировке возвращается заглушка
+    """
+    parent = _current_span.get()
+    if parent is None:
+        if not root:
+            return NOOP_SPAN
+        if not TRACER.enabled:
+            return _CycleScope()
+    return Span(name, parent, attrs)
+
+
+def current_span():
+    """Текущий спан (или заглушка), например чтобы дописать атрибуты"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def current_trace_id() -> Optional[str]:
+    """Идентификатор текущего цикла (опрос CRM, отправка пачки) или None вне цикла"""
+    return _cycle_id.get()
+
+
+def traced(name: str, root: bool = False):
+    """Декоратор: вызов функции (обычной или корутины) — отдельный спан"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, root):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, root):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run_in_context(func, *args):
+    """
+    Обёртка для run_in_executor: функция выполняется в копии текущего контекста,
+    чтобы спаны из пула потоков попали в текущий цикл
+    """
+    return functools.partial(contextvars.copy_context().run, func, *args)
+
+
+# --- Сводка по файлу трассировок ---
+
+def _trace_files(path: str) -> List[str]:
+    """Текущий файл и ротированные копии (path.1, path.2, ...) от старых к новым"""
+    files = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        files.append(f"{path}.{index}")
+        index += 1
+    files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def load_traces(path: str, name: Optional[str] = None) -> List[Dict]:
+    traces = []
+    for file_path in _trace_files(path):
+        with open(file_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    trace = json.loads(line)
+                except ValueError:
+                    continue
+                if name is None or trace['name'] == name:
+                    traces.append(trace)
+    return traces
+
+
+def aggregate_spans(trace: Dict) -> Dict[str, Dict]:
+    """Суммарное время, число и максимум по именам дочерних спанов цикла"""
+    totals: Dict[str, Dict] = {}
+    stack = list(trace.get('children', []))
+    while stack:
+        node = stack.pop()
+        entry = totals.setdefault(node['name'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        entry['count'] += 1
+        entry['total_ms'] += node['duration_ms']
+        entry['max_ms'] = max(entry['max_ms'], node['duration_ms'])
+        stack.extend(node.get('children', []))
+    return totals
+
+
+def summarize(traces: List[Dict], top: int = 10) -> str:
+    if not traces:
+        return "Трассировок нет"
+
+    durations = sorted(t['duration_ms'] for t in traces)
+    lines = [
+        f"Циклов: {len(traces)}, p50 {statistics.median(durations):.1f} ms, "
+        f"p95 {durations[min(len(durations) - 1, int(len(durations) * 0.95))]:.1f} ms, "
+        f"max {durations[-1]:.1f} ms",
+    ]
+
+    for trace in sorted(traces, key=lambda t: t['duration_ms'], reverse=True)[:top]:
+        started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(trace['start']))
+        attrs = ' '.join(f"{k}={v}" for k, v in trace.get('attrs', {}).items())
+        lines.append("")
+        lines.append(f"{started} {trace['name']} [{trace['trace_id']}] {trace['duration_ms']:.1f} ms {attrs}".rstrip())
+        spans = sorted(aggregate_spans(trace).items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        for span_name, entry in spans:
+            lines.append(
+                f"    {span_name:<32}{entry['count']:>6} x {entry['total_ms']:>10.1f} ms  (max {entry['max_ms']:.1f} ms)"
+            )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise the slowest traced cycles')
+    parser.add_argument('--file', default=Config.TRACE_FILE, help='Trace file (rotated copies are read too)')
+    parser.add_argument('--top', type=int, default=10, help='How many slowest cycles to show')
+    parser.add_argument('--name', help='Only cycles with this root span name (poll, outbox)')
+    args = parser.parse_args()
+
+    print(summarize(load_traces(args.file, args.name), args.top))
+
+
+if __name__ == '__main__':
+    main()